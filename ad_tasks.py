@@ -10,6 +10,155 @@ INSTRUCCIONES DE INSTALACIÓN:
 5. Reemplazar tasks.html con tasks_ads.html
 """
 
+import logging
+import secrets
+import time
+from datetime import datetime
+from threading import Lock
+
+from db import BatchWriter, execute_query, get_cursor
+from database import (
+    get_task, get_config, increment_stat,
+    decimal_to_float, row_to_dict, rows_to_list
+)
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CACHÉ EN MEMORIA
+# ============================================
+# Las tareas y la configuración solo cambian cuando un admin las edita,
+# así que se sirven desde memoria en el flujo de /api/ad-task/watch.
+# Formato: { clave: (timestamp, valor) }
+
+_TASK_CACHE_TTL = 60
+_TASK_CACHE_MAX_SIZE = 512
+_CONFIG_CACHE_TTL = 300
+
+_task_cache = {}
+_config_cache = {}
+_cache_lock = Lock()
+
+# Último anuncio visto por usuario/tarea: { (user_id, task_id): timestamp }
+_LAST_AD_WATCH_MAX_SIZE = 50000
+_LAST_AD_WATCH_RETENTION = 3600
+_last_ad_watch = {}
+
+
+# ============================================
+# SQL DEL FLUJO /api/ad-task/watch
+# ============================================
+# Sentencias fijas de la ruta caliente, definidas una sola vez.
+# No se usan prepared statements del servidor: el pool reinicia la sesión
+# (pool_reset_session) al devolver cada conexión, lo que libera los handles
+# preparados, y preparar en cada uso costaría un round-trip extra.
+
+# En la rama UPDATE, LAST_INSERT_ID(expr) devuelve el nuevo ads_watched en
+# cursor.lastrowid (0 si la tarea ya estaba completada). Al insertar una fila
+# nueva lastrowid es el id AUTO_INCREMENT, así que ahí ads_watched es 1.
+# El orden de las asignaciones importa: `completed` se evalúa al final,
+# con el ads_watched ya actualizado.
+_SQL_UPSERT_AD_PROGRESS = """
+    INSERT INTO ad_task_progress 
+    (user_id, task_id, ads_watched, total_earned, completed, last_ad_at, created_at)
+    VALUES (%s, %s, 1, %s, %s, NOW(), NOW())
+    ON DUPLICATE KEY UPDATE 
+        total_earned = IF(completed, total_earned, total_earned + VALUES(total_earned)),
+        last_ad_at = IF(completed, last_ad_at, NOW()),
+        ads_watched = IF(completed, ads_watched + LAST_INSERT_ID(0), LAST_INSERT_ID(ads_watched + 1)),
+        completed = completed OR ads_watched >= %s
+"""
+
+_SQL_ADD_PXC_BALANCE = """
+    UPDATE users SET pxc_balance = pxc_balance + %s WHERE user_id = %s
+"""
+
+# Mismo registro que log_balance_change(), con los saldos leídos en la
+# propia transacción justo después del incremento
+_SQL_LOG_PXC_BALANCE = """
+    INSERT INTO balance_history 
+    (user_id, currency, amount, action, description, balance_before, balance_after, created_at)
+    SELECT %s, 'PXC', %s, 'add', %s, pxc_balance - %s, pxc_balance, NOW()
+    FROM users WHERE user_id = %s
+"""
+
+_SQL_SELECT_PXC_BALANCE = """
+    SELECT pxc_balance FROM users WHERE user_id = %s
+"""
+
+_SQL_INCREMENT_TASK_COMPLETIONS = """
+    UPDATE tasks SET current_completions = current_completions + 1 
+    WHERE task_id = %s
+"""
+
+# Contador de tareas de anuncios iniciadas: permite a /tasks saltarse el JOIN
+# con ad_task_progress para los usuarios que nunca vieron un anuncio
+_SQL_INCREMENT_AD_TASKS_STARTED = """
+    UPDATE users SET ad_tasks_started = ad_tasks_started + 1 
+    WHERE user_id = %s
+"""
+
+_SQL_APPEND_COMPLETED_TASK = """
+    UPDATE users 
+    SET completed_tasks = JSON_ARRAY_APPEND(COALESCE(completed_tasks, JSON_ARRAY()), '$', %s)
+    WHERE user_id = %s 
+      AND NOT JSON_CONTAINS(COALESCE(completed_tasks, JSON_ARRAY()), JSON_QUOTE(%s))
+"""
+
+_SQL_SELECT_LAST_AD_AT = """
+    SELECT last_ad_at FROM ad_task_progress 
+    WHERE user_id = %s AND task_id = %s
+"""
+
+_SQL_INSERT_AD_COMPLETION = """
+    INSERT INTO ad_completions (user_id, task_id, ad_type, reward, completed_at)
+    VALUES (%s, %s, 'ad_task', %s, %s)
+"""
+
+# Log de anuncios (solo auditoría): se escribe en segundo plano por lotes
+_ad_completions_writer = BatchWriter(_SQL_INSERT_AD_COMPLETION, name="ad_completions")
+
+
+def get_task_cached(task_id):
+    """Obtiene una tarea usando la caché en memoria (TTL de 60s)"""
+    key = str(task_id)
+    now = time.monotonic()
+    cached = _task_cache.get(key)
+    if cached and now - cached[0] < _TASK_CACHE_TTL:
+        return cached[1]
+
+    task = get_task(task_id)
+    if task:
+        with _cache_lock:
+            if len(_task_cache) >= _TASK_CACHE_MAX_SIZE:
+                # Descartar la entrada más antigua
+                oldest = min(_task_cache, key=lambda k: _task_cache[k][0])
+                _task_cache.pop(oldest, None)
+            _task_cache[key] = (now, task)
+    return task
+
+
+def invalidate_task_cache(task_id=None):
+    """Elimina una tarea de la caché (o toda la caché si task_id es None)"""
+    with _cache_lock:
+        if task_id is None:
+            _task_cache.clear()
+        else:
+            _task_cache.pop(str(task_id), None)
+
+
+def get_config_cached(key, default=None):
+    """Obtiene un valor de configuración usando la caché en memoria (TTL de 300s)"""
+    now = time.monotonic()
+    cached = _config_cache.get(key)
+    if cached and now - cached[0] < _CONFIG_CACHE_TTL:
+        return cached[1]
+
+    value = get_config(key, default)
+    _config_cache[key] = (now, value)
+    return value
+
+
 # ============================================
 # FUNCIONES PARA AGREGAR A database.py
 # ============================================
@@ -18,15 +167,14 @@ def get_ad_tasks():
     """Obtiene todas las tareas de anuncios activas"""
     with get_cursor() as cursor:
         cursor.execute("""
-            SELECT * FROM tasks 
+            SELECT task_id, title, description, reward, task_type,
+                   ads_required, reward_per_ad, active, created_at,
+                   1 AS is_ad_task
+            FROM tasks 
             WHERE task_type = 'ads' AND active = TRUE 
             ORDER BY created_at DESC
         """)
-        tasks = rows_to_list(cursor, cursor.fetchall())
-        for task in tasks:
-            task['active'] = bool(task.get('active', 1))
-            task['is_ad_task'] = True
-        return tasks
+        return rows_to_list(cursor, cursor.fetchall())
 
 
 def get_ad_task_progress(user_id, task_id=None):
@@ -37,83 +185,163 @@ def get_ad_task_progress(user_id, task_id=None):
     with get_cursor() as cursor:
         if task_id:
             cursor.execute("""
-                SELECT * FROM ad_task_progress 
+                SELECT task_id, ads_watched, total_earned, completed, last_ad_at 
+                FROM ad_task_progress 
                 WHERE user_id = %s AND task_id = %s
             """, (str(user_id), str(task_id)))
             return row_to_dict(cursor, cursor.fetchone())
         else:
             cursor.execute("""
-                SELECT * FROM ad_task_progress 
+                SELECT task_id, ads_watched, total_earned, completed, last_ad_at 
+                FROM ad_task_progress 
                 WHERE user_id = %s
             """, (str(user_id),))
-            results = rows_to_list(cursor, cursor.fetchall())
-            # Convertir a diccionario por task_id
-            return {p['task_id']: p for p in results}
+            # Construir el diccionario por task_id directamente desde el cursor
+            return {row['task_id']: decimal_to_float(row) for row in cursor}
+
+
+def get_active_tasks_with_ad_progress(user_id, include_progress=True):
+    """
+    Obtiene las tareas activas junto con el progreso de anuncios del usuario
+    en una sola consulta. Las tareas de anuncios con progreso incluyen la
+    clave 'progress' (ads_watched, total_earned, completed).
+    Con include_progress=False (usuario sin tareas de anuncios iniciadas)
+    se omite el JOIN con ad_task_progress.
+    """
+    with get_cursor() as cursor:
+        if not include_progress:
+            cursor.execute("""
+                SELECT * FROM tasks 
+                WHERE active = TRUE 
+                ORDER BY created_at DESC
+            """)
+            tasks = rows_to_list(cursor, cursor.fetchall())
+            for task in tasks:
+                task['requires_channel_join'] = bool(task.get('requires_channel_join', 0))
+                task['active'] = bool(task.get('active', 1))
+            return tasks
+        
+        cursor.execute("""
+            SELECT t.*, 
+                   p.ads_watched AS progress_ads_watched, 
+                   p.total_earned AS progress_total_earned, 
+                   p.completed AS progress_completed
+            FROM tasks t
+            LEFT JOIN ad_task_progress p 
+                ON p.task_id = t.task_id AND p.user_id = %s
+            WHERE t.active = TRUE
+            ORDER BY t.created_at DESC
+        """, (str(user_id),))
+        tasks = rows_to_list(cursor, cursor.fetchall())
+        for task in tasks:
+            task['requires_channel_join'] = bool(task.get('requires_channel_join', 0))
+            task['active'] = bool(task.get('active', 1))
+            ads_watched = task.pop('progress_ads_watched')
+            total_earned = task.pop('progress_total_earned')
+            completed = task.pop('progress_completed')
+            if ads_watched is not None:
+                task['progress'] = {
+                    'task_id': task['task_id'],
+                    'ads_watched': ads_watched,
+                    'total_earned': total_earned,
+                    'completed': completed,
+                }
+        return tasks
+
+
+def get_tasks_bundle(user_id, completed_ids, include_progress=True):
+    """
+    Obtiene las tareas activas ya clasificadas para la página /tasks:
+    (available, completed, ad_tasks, completed_ad_tasks, ad_progress).
+    Una sola consulta (tareas + progreso de anuncios) y una sola pasada;
+    completed_ids es el conjunto de task_id completados del usuario.
+    """
+    available_tasks = {}
+    completed_tasks = {}
+    ad_tasks = {}
+    completed_ad_tasks = {}
+    ad_progress = {}
+
+    for task in get_active_tasks_with_ad_progress(user_id, include_progress):
+        task_id = str(task.get('task_id', ''))
+
+        # Separar tareas de anuncios (completadas o en progreso)
+        if task.get('task_type') == 'ads':
+            progress = task.pop('progress', None)
+            if progress:
+                ad_progress[task_id] = progress
+            if progress and progress.get('completed'):
+                task['total_earned'] = progress.get('total_earned', 0)
+                completed_ad_tasks[task_id] = task
+            else:
+                ad_tasks[task_id] = task
+        elif task_id in completed_ids:
+            completed_tasks[task_id] = task
+        else:
+            available_tasks[task_id] = task
+
+    return available_tasks, completed_tasks, ad_tasks, completed_ad_tasks, ad_progress
 
 
 def update_ad_task_progress(user_id, task_id, reward_per_ad):
     """
     Actualiza el progreso de una tarea de anuncios cuando el usuario ve un anuncio.
-    Returns: (success, ads_watched, total_earned, task_completed)
+    Returns: (success, ads_watched, total_earned, task_completed, new_balance)
+    new_balance es el saldo PXC tras la recompensa (None si no se otorgó).
     """
     try:
         # Obtener información de la tarea
-        task = get_task(task_id)
+        task = get_task_cached(task_id)
         if not task or task.get('task_type') != 'ads':
-            return False, 0, 0, False
+            return False, 0, 0, False, None
         
         ads_required = task.get('ads_required', 10)
         
-        with get_cursor() as cursor:
-            # Verificar progreso actual
-            cursor.execute("""
-                SELECT ads_watched, total_earned, completed 
-                FROM ad_task_progress 
-                WHERE user_id = %s AND task_id = %s
-            """, (str(user_id), str(task_id)))
+        # Todas las escrituras de progreso en una sola transacción
+        with get_cursor(transaction=True) as cursor:
+            # Crear o actualizar progreso en una sola sentencia
+            cursor.execute(_SQL_UPSERT_AD_PROGRESS, (
+                str(user_id), str(task_id), float(reward_per_ad), 1 >= ads_required, ads_required
+            ))
             
-            progress = row_to_dict(cursor, cursor.fetchone())
+            if cursor.rowcount == 1:
+                # Fila nueva (primer anuncio de esta tarea); lastrowid es el id
+                # AUTO_INCREMENT de la fila, no el progreso
+                new_ads_watched = 1
+                cursor.execute(_SQL_INCREMENT_AD_TASKS_STARTED, (str(user_id),))
+            else:
+                # Fila actualizada: lastrowid trae LAST_INSERT_ID(ads_watched + 1),
+                # o 0 si la tarea ya estaba completada
+                new_ads_watched = cursor.lastrowid or 0
+                if not new_ads_watched:
+                    # Tarea ya completada
+                    return False, 0, 0, True, None
             
-            if progress and progress.get('completed'):
-                # Tarea ya completada
-                return False, progress.get('ads_watched', 0), progress.get('total_earned', 0), True
+            new_total_earned = new_ads_watched * float(reward_per_ad)
+            is_completed = new_ads_watched >= ads_required
             
-            if progress:
-                # Actualizar progreso existente
-                new_ads_watched = progress.get('ads_watched', 0) + 1
-                new_total_earned = float(progress.get('total_earned', 0)) + float(reward_per_ad)
-                is_completed = new_ads_watched >= ads_required
-                
-                cursor.execute("""
-                    UPDATE ad_task_progress 
-                    SET ads_watched = %s, 
-                        total_earned = %s, 
-                        completed = %s,
-                        last_ad_at = NOW(),
-                        updated_at = NOW()
-                    WHERE user_id = %s AND task_id = %s
-                """, (new_ads_watched, new_total_earned, is_completed, str(user_id), str(task_id)))
-            else:
-                # Crear nuevo progreso
-                new_ads_watched = 1
-                new_total_earned = float(reward_per_ad)
-                is_completed = new_ads_watched >= ads_required
-                
-                cursor.execute("""
-                    INSERT INTO ad_task_progress 
-                    (user_id, task_id, ads_watched, total_earned, completed, last_ad_at, created_at)
-                    VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-                """, (str(user_id), str(task_id), new_ads_watched, new_total_earned, is_completed))
+            # Dar recompensa al usuario (incremento atómico + historial)
+            cursor.execute(_SQL_ADD_PXC_BALANCE, (float(reward_per_ad), str(user_id)))
+            # Saldo resultante en la misma transacción (la ruta ya no necesita get_user)
+            cursor.execute(_SQL_SELECT_PXC_BALANCE, (str(user_id),))
+            row = cursor.fetchone()
+            new_balance = float(row['pxc_balance']) if row else 0.0
+            try:
+                cursor.execute(_SQL_LOG_PXC_BALANCE, (
+                    str(user_id), float(reward_per_ad), f'Ad watched in task {task_id}',
+                    float(reward_per_ad), str(user_id)
+                ))
+            except Exception as _log_err:
+                logger.warning("[ad_tasks] balance history error (no crítico): %s", _log_err)
+            
+            # Si completó la tarea, actualizar contador de completaciones
+            if is_completed:
+                cursor.execute(_SQL_INCREMENT_TASK_COMPLETIONS, (task_id,))
         
-        # Dar recompensa al usuario
-        update_balance(user_id, 'pxc', reward_per_ad, 'add', f'Ad watched in task {task_id}')
+        # Registrar en log de anuncios (sin bloquear la respuesta)
+        _ad_completions_writer.put((str(user_id), str(task_id), float(reward_per_ad), datetime.now()))
         
-        # Si completó la tarea, actualizar contador de completaciones
         if is_completed:
-            execute_query("""
-                UPDATE tasks SET current_completions = current_completions + 1 
-                WHERE task_id = %s
-            """, (task_id,))
             increment_stat('total_tasks_completed')
             
             # Procesar referido si es primera tarea (ANTES de actualizar completed_tasks
@@ -122,37 +350,22 @@ def update_ad_task_progress(user_id, task_id, reward_per_ad):
                 from referral_utils import validate_referral_on_first_task
                 validate_referral_on_first_task(user_id)
             except Exception as _ref_err:
-                print(f"[ad_tasks] referral validation error: {_ref_err}")
+                logger.warning("[ad_tasks] referral validation error: %s", _ref_err)
             
-            # Marcar en completed_tasks del usuario
-            user = get_user(user_id)
-            completed = user.get('completed_tasks', [])
-            if str(task_id) not in completed:
-                completed.append(str(task_id))
-                update_user(user_id, completed_tasks=completed)
+            # Marcar en completed_tasks del usuario con un UPDATE atómico,
+            # sin leer ni reescribir la lista completa
+            execute_query(_SQL_APPEND_COMPLETED_TASK, (str(task_id), str(user_id), str(task_id)))
         
-        # Registrar en log de anuncios
-        try:
-            execute_query("""
-                INSERT INTO ad_completions (user_id, task_id, ad_type, reward, completed_at)
-                VALUES (%s, %s, 'ad_task', %s, NOW())
-            """, (str(user_id), str(task_id), float(reward_per_ad)))
-        except:
-            pass
-        
-        return True, new_ads_watched, new_total_earned, is_completed
+        return True, new_ads_watched, new_total_earned, is_completed, new_balance
         
     except Exception as e:
-        print(f"[update_ad_task_progress] Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return False, 0, 0, False
+        logger.exception(f"[update_ad_task_progress] Error: {e}")
+        return False, 0, 0, False, None
 
 
 def create_ad_task(title, description, ads_required, reward_per_ad, active=True):
     """Crea una nueva tarea de anuncios"""
-    import uuid
-    task_id = f"adtask_{uuid.uuid4().hex[:8]}"
+    task_id = f"adtask_{secrets.token_urlsafe(6)}"
     total_reward = float(ads_required) * float(reward_per_ad)
     
     try:
@@ -175,34 +388,59 @@ def get_user_ad_stats(user_id):
     """Obtiene las estadísticas de anuncios de un usuario"""
     with get_cursor() as cursor:
         cursor.execute("""
-            SELECT * FROM user_ad_stats WHERE user_id = %s
+            SELECT user_id, ads_watched_today, total_ads_watched, total_earnings, last_ad_date
+            FROM user_ad_stats WHERE user_id = %s
         """, (str(user_id),))
         return row_to_dict(cursor, cursor.fetchone())
 
 
-def check_ad_cooldown(user_id, task_id, cooldown_seconds=30):
-    """Verifica si el usuario puede ver otro anuncio (cooldown)"""
+def _get_last_ad_timestamp(user_id, task_id):
+    """Lee last_ad_at de la base de datos como timestamp (None si no hay)"""
     with get_cursor() as cursor:
-        cursor.execute("""
-            SELECT last_ad_at FROM ad_task_progress 
-            WHERE user_id = %s AND task_id = %s
-        """, (str(user_id), str(task_id)))
+        cursor.execute(_SQL_SELECT_LAST_AD_AT, (str(user_id), str(task_id)))
         
         result = cursor.fetchone()
-        if not result or not result[0]:
-            return True, 0
+        last_ad = result.get('last_ad_at') if result else None
+        if not last_ad:
+            return None
         
-        from datetime import datetime, timedelta
-        last_ad = result[0]
-        if isinstance(last_ad, str):
-            last_ad = datetime.strptime(last_ad, '%Y-%m-%d %H:%M:%S')
+        # El driver ya devuelve DATETIME como datetime (no se usa raw=True)
+        return last_ad.timestamp()
+
+
+def check_ad_cooldown(user_id, task_id, cooldown_seconds=30):
+    """
+    Verifica si el usuario puede ver otro anuncio (cooldown).
+    El último anuncio de cada usuario/tarea se guarda en memoria; solo se
+    consulta la base de datos la primera vez que se ve el par en este proceso.
+    Si el anuncio está permitido, el cooldown queda reservado de inmediato.
+    """
+    key = (str(user_id), str(task_id))
+    
+    # Lectura de la base de datos fuera del lock
+    last_db = None
+    if key not in _last_ad_watch:
+        last_db = _get_last_ad_timestamp(user_id, task_id)
+    
+    with _cache_lock:
+        now = time.time()
+        # setdefault nunca pisa una reserva hecha entretanto por otra petición
+        last_ad = _last_ad_watch.setdefault(key, last_db)
         
-        elapsed = (datetime.now() - last_ad).total_seconds()
+        if last_ad is not None:
+            elapsed = now - last_ad
+            if elapsed < cooldown_seconds:
+                return False, int(cooldown_seconds - elapsed)
         
-        if elapsed >= cooldown_seconds:
-            return True, 0
+        if len(_last_ad_watch) >= _LAST_AD_WATCH_MAX_SIZE:
+            # Las entradas antiguas ya no afectan al cooldown
+            expired = [k for k, v in _last_ad_watch.items() if v is None or now - v > _LAST_AD_WATCH_RETENTION]
+            for k in expired:
+                del _last_ad_watch[k]
         
-        return False, int(cooldown_seconds - elapsed)
+        _last_ad_watch[key] = now
+    
+    return True, 0
 
 
 # ============================================
@@ -214,8 +452,10 @@ def check_ad_cooldown(user_id, task_id, cooldown_seconds=30):
 from database import (
     # ... imports existentes ...
     get_ad_tasks, get_ad_task_progress, update_ad_task_progress,
-    create_ad_task, get_user_ad_stats, check_ad_cooldown
+    create_ad_task, get_user_ad_stats, check_ad_cooldown,
+    get_active_tasks_with_ad_progress, get_tasks_bundle
 )
+from ad_tasks import get_task_cached, get_config_cached, invalidate_task_cache
 
 # Actualizar la ruta /tasks:
 @app.route('/tasks')
@@ -238,40 +478,18 @@ def tasks():
     if channel_check:
         return channel_check
 
-    # Obtener tareas normales
-    all_tasks = get_active_tasks()
-    
     raw_completed = user.get('completed_tasks', [])
     if not isinstance(raw_completed, list):
         raw_completed = []
     completed_ids_set = set(str(t) for t in raw_completed if t)
 
-    available_tasks = {}
-    completed_tasks = {}
-    ad_tasks = {}
-    completed_ad_tasks = {}
-
-    for task in all_tasks:
-        task_id = str(task.get('task_id', ''))
-        
-        # Separar tareas de anuncios
-        if task.get('task_type') == 'ads':
-            ad_tasks[task_id] = task
-        elif task_id in completed_ids_set:
-            completed_tasks[task_id] = task
-        else:
-            available_tasks[task_id] = task
-
-    # Obtener progreso de tareas de anuncios
-    ad_progress = get_ad_task_progress(user_id)
-    
-    # Separar tareas de anuncios completadas
-    for task_id, task in list(ad_tasks.items()):
-        progress = ad_progress.get(task_id, {})
-        if progress.get('completed'):
-            task['total_earned'] = progress.get('total_earned', 0)
-            completed_ad_tasks[task_id] = task
-            del ad_tasks[task_id]
+    # Tareas y progreso de anuncios en una sola consulta, ya clasificadas;
+    # sin tareas de anuncios iniciadas no hace falta el JOIN de progreso
+    (available_tasks, completed_tasks, ad_tasks,
+     completed_ad_tasks, ad_progress) = get_tasks_bundle(
+        user_id, completed_ids_set,
+        include_progress=user.get('ad_tasks_started') != 0
+    )
 
     return render_template('tasks_ads.html',
                          user=user,
@@ -305,8 +523,8 @@ def api_ad_task_watch():
     if not task_id:
         return jsonify({'success': False, 'error': 'Task ID required'}), 400
 
-    # Obtener la tarea
-    task = get_task(task_id)
+    # Obtener la tarea (caché en memoria)
+    task = get_task_cached(task_id)
     if not task:
         return jsonify({'success': False, 'error': 'Task not found'}), 404
 
@@ -317,7 +535,7 @@ def api_ad_task_watch():
         return jsonify({'success': False, 'error': 'Task is not active'}), 400
 
     # Verificar cooldown
-    cooldown_seconds = int(get_config('ad_task_cooldown_seconds') or 30)
+    cooldown_seconds = int(get_config_cached('ad_task_cooldown_seconds') or 30)
     can_watch, remaining = check_ad_cooldown(user_id, task_id, cooldown_seconds)
     
     if not can_watch:
@@ -332,7 +550,8 @@ def api_ad_task_watch():
     reward_per_ad = float(task.get('reward_per_ad') or 0.1)
     ads_required = int(task.get('ads_required') or 10)
     
-    success, ads_watched, total_earned, task_completed = update_ad_task_progress(
+    # Progreso, recompensa y saldo resultante en una sola transacción
+    success, ads_watched, total_earned, task_completed, new_balance = update_ad_task_progress(
         user_id, task_id, reward_per_ad
     )
 
@@ -345,10 +564,6 @@ def api_ad_task_watch():
             }), 400
         return jsonify({'success': False, 'error': 'Failed to update progress'}), 500
 
-    # Obtener balance actualizado
-    updated_user = get_user(user_id)
-    new_balance = float(updated_user.get('pxc_balance', 0)) if updated_user else 0
-
     logger.info(f"[AdTask] User {user_id} watched ad in {task_id}: {ads_watched}/{ads_required}")
 
     return jsonify({
@@ -449,6 +664,7 @@ def admin_task_edit(task_id):
             })
 
         if update_task(task_id, **update_data):
+            invalidate_task_cache(task_id)
             flash('Tarea actualizada', 'success')
         else:
             flash('Error al actualizar tarea', 'error')
@@ -467,8 +683,6 @@ def install_ad_tasks_system():
     Script para instalar automáticamente el sistema de tareas de anuncios.
     Ejecuta las migraciones de base de datos necesarias.
     """
-    from db import execute_query, get_cursor
-    
     print("=" * 50)
     print("Instalando Sistema de Tareas de Anuncios")
     print("=" * 50)
@@ -486,7 +700,7 @@ def install_ad_tasks_system():
         """
         CREATE TABLE IF NOT EXISTS ad_task_progress (
             id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id VARCHAR(50) NOT NULL,
+            user_id BIGINT UNSIGNED NOT NULL,
             task_id VARCHAR(50) NOT NULL,
             ads_watched INT DEFAULT 0,
             total_earned DECIMAL(10, 4) DEFAULT 0.0000,
@@ -494,9 +708,7 @@ def install_ad_tasks_system():
             last_ad_at DATETIME DEFAULT NULL,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            UNIQUE KEY unique_user_task (user_id, task_id),
-            INDEX idx_user_id (user_id),
-            INDEX idx_task_id (task_id)
+            UNIQUE KEY unique_user_task (user_id, task_id)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
         """,
         
@@ -504,7 +716,7 @@ def install_ad_tasks_system():
         """
         CREATE TABLE IF NOT EXISTS user_ad_stats (
             id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id VARCHAR(50) NOT NULL UNIQUE,
+            user_id BIGINT UNSIGNED NOT NULL UNIQUE,
             ads_watched_today INT DEFAULT 0,
             total_ads_watched INT DEFAULT 0,
             total_earnings DECIMAL(20, 8) DEFAULT 0.00000000,
@@ -518,7 +730,7 @@ def install_ad_tasks_system():
         """
         CREATE TABLE IF NOT EXISTS ad_completions (
             id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id VARCHAR(50) NOT NULL,
+            user_id BIGINT UNSIGNED NOT NULL,
             task_id VARCHAR(50) DEFAULT NULL,
             ad_type VARCHAR(50) DEFAULT 'task_center',
             reward DECIMAL(10, 4) NOT NULL,
@@ -535,6 +747,28 @@ def install_ad_tasks_system():
             ('ad_task_default_reward', '0.1'),
             ('ad_task_max_daily_completions', '50')
         ON DUPLICATE KEY UPDATE config_value = config_value
+        """,
+        
+        # 6. Índice compuesto para get_ad_tasks (task_type, active, created_at)
+        """
+        ALTER TABLE tasks 
+            ADD INDEX idx_type_active_created (task_type, active, created_at)
+        """,
+        
+        # 7. Contador de tareas de anuncios iniciadas por usuario
+        """
+        ALTER TABLE users 
+            ADD COLUMN IF NOT EXISTS ad_tasks_started SMALLINT UNSIGNED DEFAULT 0
+        """,
+        
+        # 8. Rellenar el contador con el progreso existente
+        """
+        UPDATE users u
+        JOIN (
+            SELECT user_id, COUNT(*) AS started 
+            FROM ad_task_progress GROUP BY user_id
+        ) p ON p.user_id = u.user_id
+        SET u.ad_tasks_started = p.started
         """
     ]
     
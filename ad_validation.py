@@ -14,21 +14,47 @@ FLUJO DE VALIDACIÓN:
 
 INSTALACIÓN:
 1. Ejecutar create_ad_validation_tables() o el SQL de migración
-2. Registrar las rutas en app.py
+2. Registrar las rutas en app.py: app.register_blueprint(ad_validation_bp)
+   (o register_ad_validation_routes(app), que hace lo mismo)
 3. Configurar Reward URL en Telega.io: https://tudominio.com/api/telega/callback
+4. (Opcional) Definir TELEGA_WEBHOOK_SECRET para exigir la firma HMAC del callback
 """
 
-import uuid
+import os
+import json
 import hashlib
 import hmac
+import secrets
 import time
 import logging
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify
+from threading import Lock
+from flask import Blueprint, request, jsonify
+
+from db import BatchWriter, execute_query, get_cursor
+from database import row_to_dict
 
 logger = logging.getLogger(__name__)
 
+# orjson (opcional) serializa los payloads de los callbacks bastante más
+# rápido que json; si no está instalado se usa la librería estándar
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj)
+
+try:
+    from onclicka_pts_system import add_pts_async
+    PTS_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"⚠️ PTS system not available: {e}")
+    PTS_AVAILABLE = False
+
 # ============================================
 # CONFIGURACIÓN
 # ============================================
@@ -45,8 +71,369 @@ MAX_ADS_PER_DAY = 50
 # Recompensa por anuncio visto
 REWARD_PER_AD = 0.003  # DOGE
 
-# Secret para validar callbacks de Telega.io (CAMBIAR EN PRODUCCIÓN)
-TELEGA_WEBHOOK_SECRET = "tu_secret_de_telega_aqui"
+# Limpieza de ad_tokens: filas por DELETE y pausa entre bloques
+CLEANUP_BATCH_SIZE = 1000
+CLEANUP_BATCH_PAUSE_SECONDS = 0.05
+
+# Secret para validar callbacks de Telega.io (firma HMAC-SHA256 del cuerpo
+# en la cabecera X-Telega-Signature). Si está vacío no se verifica la firma.
+TELEGA_WEBHOOK_SECRET = os.environ.get('TELEGA_WEBHOOK_SECRET', '')
+TELEGA_SIGNATURE_HEADER = 'X-Telega-Signature'
+
+
+def _hash_token(token):
+    """
+    Hash del token para guardarlo en la base de datos (nunca en texto plano).
+    BLAKE2b de 16 bytes: los tokens ya son 128 bits aleatorios, así que basta
+    con un hash rápido y la clave del índice queda en 32 caracteres.
+    """
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+
+def _user_agent_fingerprint(user_agent):
+    """Huella de 16 caracteres del User-Agent (basta para detectar cambios de dispositivo)"""
+    if not user_agent:
+        return None
+    return hashlib.blake2s(user_agent.encode(), digest_size=8).hexdigest()
+
+
+def verify_telega_signature(f):
+    """
+    Decorador que valida la firma HMAC de los callbacks de Telega.io.
+    Se firma el cuerpo en POST y la query string en GET (donde viaja el
+    token). La comparación es en tiempo constante (hmac.compare_digest).
+    Sin TELEGA_WEBHOOK_SECRET configurado no se valida la firma.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if TELEGA_WEBHOOK_SECRET:
+            received = request.headers.get(TELEGA_SIGNATURE_HEADER, '')
+            signed = request.query_string if request.method == 'GET' else request.get_data()
+            expected = hmac.new(
+                TELEGA_WEBHOOK_SECRET.encode(),
+                signed,
+                hashlib.sha256
+            ).hexdigest()
+            if not received or not hmac.compare_digest(expected, received.lower()):
+                logger.warning(f"[Telega Callback] Invalid signature from {request.remote_addr}")
+                return jsonify({'success': False, 'error': 'Invalid signature'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+
+# ============================================
+# SENTENCIAS SQL
+# ============================================
+# Definidas una vez a nivel de módulo (ver la nota en ad_tasks.py sobre
+# por qué no se usan prepared statements con el pool actual).
+#
+# claim_reward aplica saldo e historial en una sola
+# transacción (get_cursor(transaction=True)) en lugar de update_balance(),
+# que hace get_user + UPDATE + INSERT con una conexión por sentencia.
+
+_SQL_ADD_DOGE_BALANCE = """
+    UPDATE users SET doge_balance = doge_balance + %s WHERE user_id = %s
+"""
+
+# Mismo registro que log_balance_change(), con los saldos leídos en la
+# propia transacción justo después del incremento
+_SQL_LOG_DOGE_BALANCE = """
+    INSERT INTO balance_history 
+    (user_id, currency, amount, action, description, balance_before, balance_after, created_at)
+    SELECT %s, 'DOGE', %s, 'add', 'Telega.io ad reward', doge_balance - %s, doge_balance, NOW()
+    FROM users WHERE user_id = %s
+"""
+
+_SQL_SELECT_DOGE_BALANCE = """
+    SELECT doge_balance FROM users WHERE user_id = %s
+"""
+
+_SQL_SELECT_DAILY_STATS = """
+    SELECT ads_completed, ads_claimed, total_earned, last_ad_at 
+    FROM ad_daily_stats 
+    WHERE user_id = %s AND stat_date = %s
+"""
+
+# api_request_ad_token: existencia/baneo del usuario y, si el contador diario
+# no está en memoria, sus estadísticas de hoy en la misma consulta
+_SQL_SELECT_USER_BANNED = """
+    SELECT banned FROM users WHERE user_id = %s
+"""
+
+_SQL_SELECT_USER_WITH_DAILY_STATS = """
+    SELECT u.banned, s.ads_completed, s.ads_claimed, s.total_earned, s.last_ad_at 
+    FROM users u 
+    LEFT JOIN ad_daily_stats s 
+        ON s.user_id = u.user_id AND s.stat_date = %s 
+    WHERE u.user_id = %s
+"""
+
+_SQL_SELECT_TOKEN = """
+    SELECT user_id, ad_type, ad_block_uuid, status, 
+           expires_at, completed_at, claimed_at 
+    FROM ad_tokens 
+    WHERE token = %s
+"""
+
+_SQL_INSERT_TELEGA_CALLBACK = """
+    INSERT INTO telega_callbacks 
+    (token, user_id, callback_data, ip_address, valid, error_message, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+_SQL_DELETE_OLD_TOKENS = """
+    DELETE FROM ad_tokens 
+    WHERE expires_at < DATE_SUB(NOW(), INTERVAL 7 DAY)
+    LIMIT %s
+"""
+
+
+# ============================================
+# CONTADORES DIARIOS EN MEMORIA
+# ============================================
+# Cupo diario, cooldown y estadísticas del día por usuario, para no
+# consultar ad_daily_stats en cada solicitud de anuncio. Se cargan de la
+# base de datos la primera vez y se actualizan en cada evento; la tabla
+# se escribe en segundo plano con _daily_stats_writer.
+# Formato: { (user_id, fecha): {'ads_completed', 'ads_claimed', 'total_earned', 'last_ad_at'} }
+# Solo se guardan los contadores de _counters_day; el diccionario se vacía
+# una vez cuando cambia el día. _counters_lock protege el diccionario y
+# los incrementos de cada contador.
+_daily_ad_counters = {}
+_counters_day = None
+_counters_lock = Lock()
+
+
+def _merge_daily_stats(items):
+    """Suma los deltas de un lote que caen en la misma fila (user_id, stat_date)"""
+    merged = {}
+    for user_id, stat_date, requested, completed, claimed, earned, last_ad_at in items:
+        row = merged.get((user_id, stat_date))
+        if row is None:
+            merged[(user_id, stat_date)] = [user_id, stat_date, requested, completed, claimed, earned, last_ad_at]
+            continue
+        row[2] += requested
+        row[3] += completed
+        row[4] += claimed
+        row[5] += earned
+        if last_ad_at and (row[6] is None or last_ad_at > row[6]):
+            row[6] = last_ad_at
+    return [tuple(row) for row in merged.values()]
+
+
+# Writer en segundo plano que acumula los contadores de ad_daily_stats
+_daily_stats_writer = BatchWriter("""
+    INSERT INTO ad_daily_stats 
+    (user_id, stat_date, ads_requested, ads_completed, ads_claimed, total_earned, last_ad_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE 
+        ads_requested = ads_requested + VALUES(ads_requested),
+        ads_completed = ads_completed + VALUES(ads_completed),
+        ads_claimed = ads_claimed + VALUES(ads_claimed),
+        total_earned = total_earned + VALUES(total_earned),
+        last_ad_at = COALESCE(VALUES(last_ad_at), last_ad_at)
+""", name="ad_daily_stats", batch_size=500, merge=_merge_daily_stats)
+
+
+def _queue_daily_stats(user_id, today, requested=0, completed=0, claimed=0, earned=0.0, last_ad_at=None):
+    """Encola un incremento de ad_daily_stats (se agrupa por usuario y día al escribir)"""
+    _daily_stats_writer.put((
+        str(user_id), today, requested, completed, claimed, float(earned), last_ad_at
+    ))
+
+
+def _get_daily_counter(user_id, today):
+    """Obtiene el contador diario del usuario, cargándolo de la BD si no está en memoria"""
+    key = (str(user_id), today)
+    counter = _daily_ad_counters.get(key)
+    if counter is not None:
+        return counter
+    
+    with get_cursor() as cursor:
+        cursor.execute(_SQL_SELECT_DAILY_STATS, (str(user_id), today))
+        
+        stats = row_to_dict(cursor, cursor.fetchone()) or {}
+    
+    return _cache_daily_counter(key, today, stats)
+
+
+def _cache_daily_counter(key, today, stats):
+    """Guarda en memoria el contador diario a partir de una fila de ad_daily_stats"""
+    global _counters_day
+    counter = {
+        'ads_completed': stats.get('ads_completed') or 0,
+        'ads_claimed': stats.get('ads_claimed') or 0,
+        'total_earned': float(stats.get('total_earned') or 0),
+        'last_ad_at': stats.get('last_ad_at'),
+    }
+    with _counters_lock:
+        if _counters_day is None or today > _counters_day:
+            # Nuevo día: descartar los contadores del anterior
+            _daily_ad_counters.clear()
+            _counters_day = today
+        elif today < _counters_day:
+            # Petición rezagada del día anterior: no se guarda
+            return counter
+        # Si otra petición ya lo cargó, conservar sus incrementos
+        return _daily_ad_counters.setdefault(key, counter)
+
+
+def _get_user_ad_status(user_id, today):
+    """
+    Comprueba en una sola consulta que el usuario existe y su estado de baneo,
+    cargando de paso su contador diario si no estaba en memoria.
+    
+    Returns:
+        dict con 'banned', o None si el usuario no existe
+    """
+    key = (str(user_id), today)
+    with get_cursor() as cursor:
+        if key in _daily_ad_counters:
+            cursor.execute(_SQL_SELECT_USER_BANNED, (str(user_id),))
+            row = cursor.fetchone()
+        else:
+            cursor.execute(_SQL_SELECT_USER_WITH_DAILY_STATS, (today, str(user_id)))
+            row = row_to_dict(cursor, cursor.fetchone())
+            if row:
+                _cache_daily_counter(key, today, row)
+    
+    if not row:
+        return None
+    return {'banned': bool(row.get('banned'))}
+
+
+# ============================================
+# ALMACÉN DE TOKENS EN MEMORIA
+# ============================================
+# El ciclo de vida de los tokens (pending -> completed -> claimed) se
+# resuelve en memoria: los tokens viven 2 minutos y la app corre en un
+# único worker de gunicorn (ver gunicorn.conf.py), así que el proceso es
+# la fuente de verdad. La tabla ad_tokens se escribe en segundo plano solo
+# como auditoría y se consulta únicamente si el token no está en memoria
+# (por ejemplo, tras un reinicio).
+# Formato: { token: {user_id, ad_type, ad_block_uuid, status, expires_at, ...} }
+_TOKEN_STORE_MAX_SIZE = 20000
+_token_store = {}
+_token_lock = Lock()
+
+# Caché negativa: tokens desconocidos ya buscados en ad_tokens, para que
+# callbacks o peticiones repetidas con tokens falsos no consulten la BD.
+# Formato: { token: datetime de expiración de la entrada }
+_MISSING_TOKEN_TTL_SECONDS = TOKEN_LIFETIME_SECONDS
+_MISSING_TOKEN_MAX_SIZE = 20000
+_missing_tokens = {}
+
+
+# Writer en segundo plano que guarda el estado de cada token en ad_tokens
+_token_writer = BatchWriter("""
+    INSERT INTO ad_tokens 
+    (token, user_id, ad_type, ad_block_uuid, status, expires_at, 
+     completed_at, claimed_at, ip_address, user_agent, telega_response)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE 
+        status = VALUES(status),
+        completed_at = COALESCE(VALUES(completed_at), completed_at),
+        claimed_at = COALESCE(VALUES(claimed_at), claimed_at),
+        telega_response = COALESCE(VALUES(telega_response), telega_response)
+""", name="ad_tokens")
+
+
+def _persist_token(token, info):
+    """Encola una foto del estado actual del token para ad_tokens"""
+    _token_writer.put((
+        _hash_token(token), str(info['user_id']), info.get('ad_type'), info.get('ad_block_uuid'),
+        info['status'], info['expires_at'], info.get('completed_at'), info.get('claimed_at'),
+        info.get('ip_address'), info.get('user_agent'), info.get('telega_response')
+    ))
+
+
+def _store_token(token, info):
+    """Guarda un token en memoria, descartando los que ya expiraron"""
+    with _token_lock:
+        if len(_token_store) >= _TOKEN_STORE_MAX_SIZE:
+            now = datetime.now()
+            for old_token in [t for t, v in _token_store.items() if v['expires_at'] < now]:
+                del _token_store[old_token]
+        _token_store[token] = info
+        _missing_tokens.pop(token, None)
+
+
+def _remember_missing_token(token):
+    """Recuerda que un token no existe en ad_tokens durante un rato"""
+    now = datetime.now()
+    with _token_lock:
+        if len(_missing_tokens) >= _MISSING_TOKEN_MAX_SIZE:
+            for old_token in [t for t, exp in _missing_tokens.items() if exp < now]:
+                del _missing_tokens[old_token]
+            if len(_missing_tokens) >= _MISSING_TOKEN_MAX_SIZE:
+                _missing_tokens.clear()
+        _missing_tokens[token] = now + timedelta(seconds=_MISSING_TOKEN_TTL_SECONDS)
+
+
+def _purge_expired_tokens():
+    """Elimina de memoria los tokens expirados y las entradas negativas vencidas"""
+    now = datetime.now()
+    with _token_lock:
+        for old_token in [t for t, v in _token_store.items() if v['expires_at'] < now]:
+            del _token_store[old_token]
+        for old_token in [t for t, exp in _missing_tokens.items() if exp < now]:
+            del _missing_tokens[old_token]
+
+
+def _transition_token(token, from_status, to_status, owner=None, **fields):
+    """
+    Cambia el estado de un token de forma atómica (equivalente a SETNX).
+    Solo un llamador puede pasar un token de from_status a to_status.
+    Si se indica owner, el token además debe pertenecer a ese usuario.
+    
+    Returns:
+        copia del token actualizado, o None si no estaba en from_status
+    """
+    with _token_lock:
+        info = _token_store.get(token)
+        if not info or info['status'] != from_status or datetime.now() > info['expires_at']:
+            return None
+        if owner is not None and str(info['user_id']) != str(owner):
+            return None
+        info['status'] = to_status
+        info.update(fields)
+        updated = dict(info)
+    _persist_token(token, updated)
+    return updated
+
+
+def _record_ad_completed(user_id, now):
+    """Actualiza el contador diario tras completar un anuncio y encola la escritura"""
+    today = now.date()
+    # Cargar el contador antes de encolar, para no contar dos veces este evento
+    counter = _get_daily_counter(user_id, today)
+    with _counters_lock:
+        counter['ads_completed'] += 1
+        counter['last_ad_at'] = now
+    _queue_daily_stats(user_id, today, completed=1, last_ad_at=now)
+
+
+def _record_ad_claimed(user_id, now, reward):
+    """Actualiza el contador diario tras reclamar una recompensa y encola la escritura"""
+    today = now.date()
+    counter = _get_daily_counter(user_id, today)
+    with _counters_lock:
+        counter['ads_claimed'] += 1
+        counter['total_earned'] += float(reward)
+        snapshot = dict(counter)
+    _queue_daily_stats(user_id, today, claimed=1, earned=reward)
+    return snapshot
+
+
+def _stats_from_counter(counter):
+    """Formato de respuesta de las estadísticas diarias de anuncios"""
+    return {
+        'ads_completed': counter.get('ads_completed', 0),
+        'ads_claimed': counter.get('ads_claimed', 0),
+        'total_earned': float(counter.get('total_earned', 0)),
+        'max_ads': MAX_ADS_PER_DAY,
+        'reward_per_ad': REWARD_PER_AD
+    }
 
 
 # ============================================
@@ -58,7 +445,7 @@ MIGRATION_SQL = """
 CREATE TABLE IF NOT EXISTS ad_tokens (
     id INT AUTO_INCREMENT PRIMARY KEY,
     token VARCHAR(64) NOT NULL UNIQUE,
-    user_id VARCHAR(50) NOT NULL,
+    user_id BIGINT UNSIGNED NOT NULL,
     ad_type VARCHAR(20) DEFAULT 'rewarded',
     ad_block_uuid VARCHAR(100) DEFAULT NULL,
     
@@ -73,19 +460,18 @@ CREATE TABLE IF NOT EXISTS ad_tokens (
     
     -- Info adicional
     ip_address VARCHAR(50) DEFAULT NULL,
-    user_agent TEXT DEFAULT NULL,
+    user_agent VARCHAR(16) DEFAULT NULL,  -- huella blake2s del User-Agent
     telega_response TEXT DEFAULT NULL,
     
-    INDEX idx_token (token),
-    INDEX idx_user_id (user_id),
     INDEX idx_status (status),
-    INDEX idx_expires_at (expires_at)
+    INDEX idx_expires_at (expires_at),
+    INDEX idx_user_status (user_id, status)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Tabla para estadísticas diarias de anuncios por usuario
 CREATE TABLE IF NOT EXISTS ad_daily_stats (
     id INT AUTO_INCREMENT PRIMARY KEY,
-    user_id VARCHAR(50) NOT NULL,
+    user_id BIGINT UNSIGNED NOT NULL,
     stat_date DATE NOT NULL,
     
     ads_requested INT DEFAULT 0,
@@ -99,7 +485,6 @@ CREATE TABLE IF NOT EXISTS ad_daily_stats (
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
     UNIQUE KEY unique_user_date (user_id, stat_date),
-    INDEX idx_user_id (user_id),
     INDEX idx_stat_date (stat_date)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -132,8 +517,6 @@ CREATE TABLE IF NOT EXISTS telega_callbacks (
 
 def create_ad_validation_tables():
     """Crea las tablas necesarias para la validación de anuncios"""
-    from db import execute_query
-    
     statements = [s.strip() for s in MIGRATION_SQL.split(';') if s.strip()]
     
     for statement in statements:
@@ -159,34 +542,34 @@ def generate_ad_token(user_id, ad_type='rewarded', ad_block_uuid=None):
     Returns:
         dict con token y expires_at, o None si hay error
     """
-    from db import execute_query, get_cursor
-    
     try:
-        # Generar token único
-        raw_token = f"{user_id}-{time.time()}-{uuid.uuid4().hex}"
-        token = hashlib.sha256(raw_token.encode()).hexdigest()[:32]
+        # Generar token único (128 bits aleatorios)
+        token = secrets.token_hex(16)
         
         # Calcular expiración
-        expires_at = datetime.now() + timedelta(seconds=TOKEN_LIFETIME_SECONDS)
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=TOKEN_LIFETIME_SECONDS)
         
-        # Obtener IP del usuario
+        # Obtener IP del usuario y huella corta del User-Agent
         ip_address = request.remote_addr if request else None
-        user_agent = request.user_agent.string if request and request.user_agent else None
+        user_agent = _user_agent_fingerprint(request.environ.get('HTTP_USER_AGENT') if request else None)
         
-        # Insertar token en la base de datos
-        execute_query("""
-            INSERT INTO ad_tokens 
-            (token, user_id, ad_type, ad_block_uuid, status, expires_at, ip_address, user_agent)
-            VALUES (%s, %s, %s, %s, 'pending', %s, %s, %s)
-        """, (token, str(user_id), ad_type, ad_block_uuid, expires_at, ip_address, user_agent))
+        # Guardar token en memoria (ad_tokens se escribe en segundo plano)
+        token_info = {
+            'token': token,
+            'user_id': str(user_id),
+            'ad_type': ad_type,
+            'ad_block_uuid': ad_block_uuid,
+            'status': 'pending',
+            'expires_at': expires_at,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+        }
+        _store_token(token, token_info)
+        _persist_token(token, token_info)
         
-        # Actualizar estadísticas diarias
-        today = datetime.now().date()
-        execute_query("""
-            INSERT INTO ad_daily_stats (user_id, stat_date, ads_requested)
-            VALUES (%s, %s, 1)
-            ON DUPLICATE KEY UPDATE ads_requested = ads_requested + 1
-        """, (str(user_id), today))
+        # Actualizar estadísticas diarias (en segundo plano)
+        _queue_daily_stats(user_id, now.date(), requested=1)
         
         logger.info(f"[AdToken] Generated token {token[:8]}... for user {user_id}")
         
@@ -208,30 +591,37 @@ def validate_token(token):
     Returns:
         dict con info del token, o None si no es válido
     """
-    from db import get_cursor, row_to_dict
-    
     try:
-        with get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM ad_tokens 
-                WHERE token = %s
-            """, (token,))
+        now = datetime.now()
+        stored = _token_store.get(token)
+        if stored is not None:
+            result = dict(stored)
+        else:
+            missing_until = _missing_tokens.get(token)
+            if missing_until and now < missing_until:
+                return None
             
-            result = row_to_dict(cursor, cursor.fetchone())
+            # No está en memoria (p. ej. tras un reinicio): leer de ad_tokens
+            with get_cursor() as cursor:
+                cursor.execute(_SQL_SELECT_TOKEN, (_hash_token(token),))
+                
+                result = row_to_dict(cursor, cursor.fetchone())
             
             if not result:
+                _remember_missing_token(token)
                 return None
             
-            # Verificar si ha expirado
-            expires_at = result.get('expires_at')
-            if expires_at:
-                if isinstance(expires_at, str):
-                    expires_at = datetime.fromisoformat(expires_at)
-                if datetime.now() > expires_at:
-                    result['status'] = 'expired'
-            
-            return result
-            
+            result['token'] = token
+            if result.get('expires_at'):
+                _store_token(token, dict(result))
+        
+        # Verificar si ha expirado
+        expires_at = result.get('expires_at')
+        if expires_at and now > expires_at:
+            result['status'] = 'expired'
+        
+        return result
+        
     except Exception as e:
         logger.error(f"[AdToken] Error validating token: {e}")
         return None
@@ -249,42 +639,31 @@ def mark_token_completed(token, telega_response=None):
     Returns:
         True si se marcó correctamente, False si no
     """
-    from db import execute_query, get_cursor
-    
     try:
-        # Verificar estado actual
-        token_info = validate_token(token)
-        if not token_info:
-            logger.warning(f"[AdToken] Token not found: {token[:8]}...")
-            return False
-        
-        if token_info['status'] != 'pending':
-            logger.warning(f"[AdToken] Token {token[:8]}... not pending (status: {token_info['status']})")
-            return False
-        
-        if token_info.get('status') == 'expired':
-            logger.warning(f"[AdToken] Token {token[:8]}... expired")
-            return False
-        
-        # Marcar como completado
-        execute_query("""
-            UPDATE ad_tokens 
-            SET status = 'completed', 
-                completed_at = NOW(),
-                telega_response = %s
-            WHERE token = %s AND status = 'pending'
-        """, (telega_response, token))
+        # Marcar como completado (atómico: solo un llamador gana, sin lectura previa)
+        now = datetime.now()
+        fields = {'completed_at': now, 'telega_response': telega_response}
+        token_info = _transition_token(token, 'pending', 'completed', **fields)
+        
+        if token_info is None:
+            # Solo se lee el token para explicar el fallo, o para cargarlo
+            # desde ad_tokens si no estaba en memoria (p. ej. tras un reinicio)
+            current = validate_token(token)
+            if not current:
+                logger.warning(f"[AdToken] Token not found: {token[:8]}...")
+                return False
+            
+            if current['status'] != 'pending':
+                logger.warning(f"[AdToken] Token {token[:8]}... not pending (status: {current['status']})")
+                return False
+            
+            token_info = _transition_token(token, 'pending', 'completed', **fields)
+            if token_info is None:
+                logger.warning(f"[AdToken] Token {token[:8]}... already processed")
+                return False
         
         # Actualizar estadísticas diarias
-        user_id = token_info['user_id']
-        today = datetime.now().date()
-        execute_query("""
-            INSERT INTO ad_daily_stats (user_id, stat_date, ads_completed, last_ad_at)
-            VALUES (%s, %s, 1, NOW())
-            ON DUPLICATE KEY UPDATE 
-                ads_completed = ads_completed + 1,
-                last_ad_at = NOW()
-        """, (str(user_id), today))
+        _record_ad_completed(token_info['user_id'], now)
         
         logger.info(f"[AdToken] Token {token[:8]}... marked as completed")
         return True
@@ -305,65 +684,65 @@ def claim_reward(token, user_id):
     Returns:
         dict con resultado, o None si hay error
     """
-    from db import execute_query
-    from database import update_balance, get_user
-    
     pts_reward = 7  # PTS por anuncio Telega (es mayor porque paga más DOGE)
     
     try:
-        # Validar token
-        token_info = validate_token(token)
-        if not token_info:
-            return {'success': False, 'error': 'Token not found'}
-        
-        # Verificar que el token pertenece al usuario
-        if str(token_info['user_id']) != str(user_id):
-            logger.warning(f"[AdToken] User {user_id} tried to claim token of user {token_info['user_id']}")
-            return {'success': False, 'error': 'Token does not belong to user'}
-        
-        # Verificar estado
-        if token_info['status'] == 'expired':
-            return {'success': False, 'error': 'Token expired'}
-        
-        if token_info['status'] == 'pending':
-            return {'success': False, 'error': 'Ad not completed yet'}
-        
-        if token_info['status'] == 'claimed':
-            return {'success': False, 'error': 'Reward already claimed'}
-        
-        if token_info['status'] != 'completed':
-            return {'success': False, 'error': f'Invalid token status: {token_info["status"]}'}
-        
-        # Marcar como reclamado
-        execute_query("""
-            UPDATE ad_tokens 
-            SET status = 'claimed', claimed_at = NOW()
-            WHERE token = %s AND status = 'completed'
-        """, (token,))
+        # Marcar como reclamado (atómico: evita el doble reclamo, sin lectura previa)
+        now = datetime.now()
+        claimed = _transition_token(token, 'completed', 'claimed', owner=user_id, claimed_at=now)
+        
+        if claimed is None:
+            # Solo se lee el token para explicar el fallo, o para cargarlo
+            # desde ad_tokens si no estaba en memoria (p. ej. tras un reinicio)
+            token_info = validate_token(token)
+            if not token_info:
+                return {'success': False, 'error': 'Token not found'}
+            
+            # Verificar que el token pertenece al usuario
+            if str(token_info['user_id']) != str(user_id):
+                logger.warning(f"[AdToken] User {user_id} tried to claim token of user {token_info['user_id']}")
+                return {'success': False, 'error': 'Token does not belong to user'}
+            
+            # Verificar estado
+            if token_info['status'] == 'expired':
+                return {'success': False, 'error': 'Token expired'}
+            
+            if token_info['status'] == 'pending':
+                return {'success': False, 'error': 'Ad not completed yet'}
+            
+            if token_info['status'] == 'claimed':
+                return {'success': False, 'error': 'Reward already claimed'}
+            
+            if token_info['status'] != 'completed':
+                return {'success': False, 'error': f'Invalid token status: {token_info["status"]}'}
+            
+            if not _transition_token(token, 'completed', 'claimed', owner=user_id, claimed_at=now):
+                return {'success': False, 'error': 'Reward already claimed'}
+        
+        # Dar recompensa y registrar historial en una sola transacción,
+        # leyendo el balance actualizado en la misma conexión
+        with get_cursor(transaction=True) as cursor:
+            cursor.execute(_SQL_ADD_DOGE_BALANCE, (REWARD_PER_AD, str(user_id)))
+            try:
+                cursor.execute(_SQL_LOG_DOGE_BALANCE, (
+                    str(user_id), REWARD_PER_AD, REWARD_PER_AD, str(user_id)
+                ))
+            except Exception as log_error:
+                logger.warning(f"[AdToken] Balance history error (no crítico): {log_error}")
+            cursor.execute(_SQL_SELECT_DOGE_BALANCE, (str(user_id),))
+            row = cursor.fetchone()
+        
+        new_balance = float(row.get('doge_balance') or 0) if row else 0
         
-        # Dar recompensa
-        update_balance(user_id, 'doge', REWARD_PER_AD, 'add', 'Telega.io ad reward')
+        # Actualizar estadísticas diarias
+        counter = _record_ad_claimed(user_id, now, REWARD_PER_AD)
         
         # Agregar PTS al ranking
-        try:
-            from onclicka_pts_system import add_pts
-            add_pts(user_id, pts_reward, 'ad_watched', 'Telega.io ad')
-        except Exception as pts_error:
-            logger.warning(f"[AdToken] Error adding PTS: {pts_error}")
-        
-        # Actualizar estadísticas diarias
-        today = datetime.now().date()
-        execute_query("""
-            INSERT INTO ad_daily_stats (user_id, stat_date, ads_claimed, total_earned)
-            VALUES (%s, %s, 1, %s)
-            ON DUPLICATE KEY UPDATE 
-                ads_claimed = ads_claimed + 1,
-                total_earned = total_earned + %s
-        """, (str(user_id), today, REWARD_PER_AD, REWARD_PER_AD))
-        
-        # Obtener balance actualizado
-        user = get_user(user_id)
-        new_balance = float(user.get('doge_balance', 0)) if user else 0
+        if PTS_AVAILABLE:
+            try:
+                add_pts_async(user_id, pts_reward, 'ad_watched', 'Telega.io ad')
+            except Exception as pts_error:
+                logger.warning(f"[AdToken] Error adding PTS: {pts_error}")
         
         logger.info(f"[AdToken] User {user_id} claimed reward for token {token[:8]}... +{REWARD_PER_AD} DOGE +{pts_reward} PTS")
         
@@ -372,7 +751,8 @@ def claim_reward(token, user_id):
             'reward': REWARD_PER_AD,
             'pts_reward': pts_reward,
             'new_balance': new_balance,
-            'message': f'+{REWARD_PER_AD} DOGE +{pts_reward} PTS'
+            'message': f'+{REWARD_PER_AD} DOGE +{pts_reward} PTS',
+            'stats': _stats_from_counter(counter)
         }
         
     except Exception as e:
@@ -387,23 +767,11 @@ def check_user_can_watch_ad(user_id):
     Returns:
         dict con can_watch (bool), reason (str si no puede), cooldown_remaining (int)
     """
-    from db import get_cursor, row_to_dict
-    
     try:
-        today = datetime.now().date()
-        
-        with get_cursor() as cursor:
-            # Obtener estadísticas del día
-            cursor.execute("""
-                SELECT ads_completed, last_ad_at 
-                FROM ad_daily_stats 
-                WHERE user_id = %s AND stat_date = %s
-            """, (str(user_id), today))
-            
-            stats = row_to_dict(cursor, cursor.fetchone())
+        now = datetime.now()
         
-        if not stats:
-            return {'can_watch': True, 'cooldown_remaining': 0}
+        # Obtener estadísticas del día (contador en memoria)
+        stats = _get_daily_counter(user_id, now.date())
         
         # Verificar límite diario
         ads_today = stats.get('ads_completed', 0)
@@ -418,10 +786,7 @@ def check_user_can_watch_ad(user_id):
         # Verificar cooldown
         last_ad_at = stats.get('last_ad_at')
         if last_ad_at:
-            if isinstance(last_ad_at, str):
-                last_ad_at = datetime.fromisoformat(last_ad_at)
-            
-            elapsed = (datetime.now() - last_ad_at).total_seconds()
+            elapsed = (now - last_ad_at).total_seconds()
             if elapsed < AD_COOLDOWN_SECONDS:
                 remaining = int(AD_COOLDOWN_SECONDS - elapsed)
                 return {
@@ -444,35 +809,9 @@ def check_user_can_watch_ad(user_id):
 
 def get_user_ad_stats(user_id):
     """Obtiene las estadísticas de anuncios del usuario para hoy"""
-    from db import get_cursor, row_to_dict
-    
     try:
-        today = datetime.now().date()
-        
-        with get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM ad_daily_stats 
-                WHERE user_id = %s AND stat_date = %s
-            """, (str(user_id), today))
-            
-            stats = row_to_dict(cursor, cursor.fetchone())
-        
-        if not stats:
-            return {
-                'ads_completed': 0,
-                'ads_claimed': 0,
-                'total_earned': 0,
-                'max_ads': MAX_ADS_PER_DAY,
-                'reward_per_ad': REWARD_PER_AD
-            }
-        
-        return {
-            'ads_completed': stats.get('ads_completed', 0),
-            'ads_claimed': stats.get('ads_claimed', 0),
-            'total_earned': float(stats.get('total_earned', 0)),
-            'max_ads': MAX_ADS_PER_DAY,
-            'reward_per_ad': REWARD_PER_AD
-        }
+        # Contador en memoria: incluye los incrementos aún no escritos en ad_daily_stats
+        return _stats_from_counter(_get_daily_counter(user_id, datetime.now().date()))
         
     except Exception as e:
         logger.error(f"[AdToken] Error getting user stats: {e}")
@@ -485,20 +824,21 @@ def get_user_ad_stats(user_id):
         }
 
 
+# Auditoría de callbacks en segundo plano: un pico de callbacks de Telega.io
+# no deja los threads de gunicorn esperando a MySQL
+_callback_log_writer = BatchWriter(_SQL_INSERT_TELEGA_CALLBACK, name="telega_callbacks")
+
+
 def log_telega_callback(token, user_id, callback_data, ip_address, valid, error_message=None):
-    """Registra un callback de Telega.io para auditoría"""
-    from db import execute_query
-    import json
-    
+    """Registra un callback de Telega.io para auditoría (escritura en segundo plano)"""
     try:
         if isinstance(callback_data, dict):
-            callback_data = json.dumps(callback_data)
+            callback_data = _json_dumps(callback_data)
         
-        execute_query("""
-            INSERT INTO telega_callbacks 
-            (token, user_id, callback_data, ip_address, valid, error_message)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (token, str(user_id) if user_id else None, callback_data, ip_address, valid, error_message))
+        _callback_log_writer.put((
+            _hash_token(token) if token else None, str(user_id) if user_id else None,
+            callback_data, ip_address, valid, error_message, datetime.now()
+        ))
         
     except Exception as e:
         logger.error(f"[AdToken] Error logging callback: {e}")
@@ -506,22 +846,25 @@ def log_telega_callback(token, user_id, callback_data, ip_address, valid, error_
 
 def cleanup_expired_tokens():
     """Limpia tokens expirados (ejecutar periódicamente)"""
-    from db import execute_query
-    
     try:
-        execute_query("""
-            UPDATE ad_tokens 
-            SET status = 'expired' 
-            WHERE status = 'pending' AND expires_at < NOW()
-        """)
-        
-        # Opcional: eliminar tokens muy antiguos
-        execute_query("""
-            DELETE FROM ad_tokens 
-            WHERE created_at < DATE_SUB(NOW(), INTERVAL 7 DAY)
-        """)
-        
-        logger.info("[AdToken] Cleaned up expired tokens")
+        # La expiración es perezosa: validate_token y _transition_token ya
+        # tratan como expirado cualquier token con expires_at vencido, así
+        # que no hace falta marcar 'expired' fila por fila en ad_tokens.
+        _purge_expired_tokens()
+        
+        # Eliminar tokens antiguos en bloques pequeños (usa idx_expires_at)
+        # para no bloquear las escrituras de ad_tokens con un DELETE enorme
+        deleted = 0
+        while True:
+            with get_cursor() as cursor:
+                cursor.execute(_SQL_DELETE_OLD_TOKENS, (CLEANUP_BATCH_SIZE,))
+                rows = cursor.rowcount
+            deleted += rows
+            if rows < CLEANUP_BATCH_SIZE:
+                break
+            time.sleep(CLEANUP_BATCH_PAUSE_SECONDS)
+        
+        logger.info(f"[AdToken] Cleaned up expired tokens ({deleted} deleted)")
         
     except Exception as e:
         logger.error(f"[AdToken] Error cleaning up tokens: {e}")
@@ -531,225 +874,221 @@ def cleanup_expired_tokens():
 # RUTAS FLASK
 # ============================================
 
-def register_ad_validation_routes(app):
-    """Registra las rutas de validación de anuncios en la app Flask"""
-    from database import get_user
-    
-    @app.route('/api/ads/request-token', methods=['POST'])
-    def api_request_ad_token():
-        """
-        Solicita un token para ver un anuncio.
-        El frontend debe llamar esta ruta ANTES de mostrar el anuncio.
-        """
-        data = request.get_json() or {}
-        user_id = data.get('user_id')
-        ad_type = data.get('ad_type', 'rewarded')
-        ad_block_uuid = data.get('ad_block_uuid')
-        
-        if not user_id:
-            return jsonify({'success': False, 'error': 'User ID required'}), 400
-        
-        # Verificar usuario
-        user = get_user(user_id)
-        if not user:
-            return jsonify({'success': False, 'error': 'User not found'}), 404
-        
-        if user.get('banned'):
-            return jsonify({'success': False, 'error': 'User banned'}), 403
-        
-        # Verificar si puede ver anuncio
-        check = check_user_can_watch_ad(user_id)
-        if not check.get('can_watch'):
-            return jsonify({
-                'success': False,
-                'error': check.get('reason', 'Cannot watch ad'),
-                'cooldown_remaining': check.get('cooldown_remaining', 0)
-            })
-        
-        # Generar token
-        token_data = generate_ad_token(user_id, ad_type, ad_block_uuid)
-        if not token_data:
-            return jsonify({'success': False, 'error': 'Failed to generate token'}), 500
-        
-        return jsonify({
-            'success': True,
-            'token': token_data['token'],
-            'expires_in': token_data['expires_in'],
-            'reward': REWARD_PER_AD
-        })
-    
-    
-    @app.route('/api/ads/complete', methods=['POST'])
-    def api_complete_ad():
-        """
-        Marca un anuncio como completado.
-        MODO SIN CALLBACK: El frontend llama cuando el anuncio termina.
-        Para producción, usar el callback de Telega.io en su lugar.
-        """
-        data = request.get_json() or {}
-        token = data.get('token')
-        user_id = data.get('user_id')
-        
-        if not token:
-            return jsonify({'success': False, 'error': 'Token required'}), 400
-        
-        if not user_id:
-            return jsonify({'success': False, 'error': 'User ID required'}), 400
-        
-        # Validar que el token pertenece al usuario
-        token_info = validate_token(token)
-        if not token_info:
-            return jsonify({'success': False, 'error': 'Invalid token'}), 400
-        
-        if str(token_info['user_id']) != str(user_id):
-            return jsonify({'success': False, 'error': 'Token mismatch'}), 403
-        
-        # Marcar como completado
-        if not mark_token_completed(token):
-            return jsonify({'success': False, 'error': 'Failed to complete token'}), 400
-        
-        return jsonify({
-            'success': True,
-            'message': 'Ad completed, ready to claim reward'
-        })
-    
-    
-    @app.route('/api/ads/claim', methods=['POST'])
-    def api_claim_ad_reward():
-        """
-        Reclama la recompensa de un anuncio completado.
-        """
-        data = request.get_json() or {}
-        token = data.get('token')
-        user_id = data.get('user_id')
-        
-        if not token:
-            return jsonify({'success': False, 'error': 'Token required'}), 400
-        
-        if not user_id:
-            return jsonify({'success': False, 'error': 'User ID required'}), 400
-        
-        result = claim_reward(token, user_id)
-        
-        if result.get('success'):
-            # Obtener estadísticas actualizadas
-            stats = get_user_ad_stats(user_id)
-            result['stats'] = stats
-        
-        return jsonify(result)
-    
-    
-    @app.route('/api/ads/stats', methods=['GET'])
-    def api_ad_stats():
-        """Obtiene las estadísticas de anuncios del usuario"""
-        user_id = request.args.get('user_id')
-        
-        if not user_id:
-            return jsonify({'success': False, 'error': 'User ID required'}), 400
-        
-        stats = get_user_ad_stats(user_id)
-        check = check_user_can_watch_ad(user_id)
-        
+ad_validation_bp = Blueprint('ad_validation', __name__)
+
+
+@ad_validation_bp.route('/api/ads/request-token', methods=['POST'])
+def api_request_ad_token():
+    """
+    Solicita un token para ver un anuncio.
+    El frontend debe llamar esta ruta ANTES de mostrar el anuncio.
+    """
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    ad_type = data.get('ad_type', 'rewarded')
+    ad_block_uuid = data.get('ad_block_uuid')
+
+    if not user_id:
+        return jsonify({'success': False, 'error': 'User ID required'}), 400
+
+    # Verificar usuario (y cargar su contador diario en la misma consulta)
+    user_status = _get_user_ad_status(user_id, datetime.now().date())
+    if not user_status:
+        return jsonify({'success': False, 'error': 'User not found'}), 404
+
+    if user_status['banned']:
+        return jsonify({'success': False, 'error': 'User banned'}), 403
+
+    # Verificar si puede ver anuncio (contador en memoria)
+    check = check_user_can_watch_ad(user_id)
+    if not check.get('can_watch'):
         return jsonify({
-            'success': True,
-            'stats': stats,
-            'can_watch': check.get('can_watch', True),
+            'success': False,
+            'error': check.get('reason', 'Cannot watch ad'),
             'cooldown_remaining': check.get('cooldown_remaining', 0)
         })
-    
-    
-    @app.route('/api/telega/callback', methods=['POST', 'GET'])
-    def api_telega_callback():
-        """
-        Callback de Telega.io cuando un anuncio se completa.
-        Configura esta URL en el dashboard de Telega.io como Reward URL.
-        
-        Telega.io enviará datos del anuncio completado.
-        """
-        # Obtener datos del callback
-        if request.method == 'POST':
-            data = request.get_json() or request.form.to_dict()
-        else:
-            data = request.args.to_dict()
-        
-        ip_address = request.remote_addr
-        
-        logger.info(f"[Telega Callback] Received: {data}")
-        
-        # Extraer token y user_id del callback
-        # NOTA: Los nombres de los campos dependen de cómo Telega.io envíe los datos
-        token = data.get('token') or data.get('ad_token') or data.get('custom_data')
-        user_id = data.get('user_id') or data.get('userId')
-        
-        if not token:
-            log_telega_callback(None, None, data, ip_address, False, 'No token in callback')
-            return jsonify({'success': False, 'error': 'No token'}), 400
-        
-        # Validar token
-        token_info = validate_token(token)
-        if not token_info:
-            log_telega_callback(token, user_id, data, ip_address, False, 'Invalid token')
-            return jsonify({'success': False, 'error': 'Invalid token'}), 400
-        
-        # Marcar como completado
-        import json
-        success = mark_token_completed(token, json.dumps(data))
-        
-        if success:
-            log_telega_callback(token, token_info['user_id'], data, ip_address, True, None)
-            logger.info(f"[Telega Callback] Token {token[:8]}... marked completed")
-            return jsonify({'success': True})
-        else:
-            log_telega_callback(token, token_info['user_id'], data, ip_address, False, 'Failed to mark completed')
+
+    # Generar token
+    token_data = generate_ad_token(user_id, ad_type, ad_block_uuid)
+    if not token_data:
+        return jsonify({'success': False, 'error': 'Failed to generate token'}), 500
+
+    return jsonify({
+        'success': True,
+        'token': token_data['token'],
+        'expires_in': token_data['expires_in'],
+        'reward': REWARD_PER_AD
+    })
+
+
+@ad_validation_bp.route('/api/ads/complete', methods=['POST'])
+def api_complete_ad():
+    """
+    Marca un anuncio como completado.
+    MODO SIN CALLBACK: El frontend llama cuando el anuncio termina.
+    Para producción, usar el callback de Telega.io en su lugar.
+    """
+    data = request.get_json() or {}
+    token = data.get('token')
+    user_id = data.get('user_id')
+
+    if not token:
+        return jsonify({'success': False, 'error': 'Token required'}), 400
+
+    if not user_id:
+        return jsonify({'success': False, 'error': 'User ID required'}), 400
+
+    # Validar que el token pertenece al usuario
+    token_info = validate_token(token)
+    if not token_info:
+        return jsonify({'success': False, 'error': 'Invalid token'}), 400
+
+    if str(token_info['user_id']) != str(user_id):
+        return jsonify({'success': False, 'error': 'Token mismatch'}), 403
+
+    # Marcar como completado
+    if not mark_token_completed(token):
+        return jsonify({'success': False, 'error': 'Failed to complete token'}), 400
+
+    return jsonify({
+        'success': True,
+        'message': 'Ad completed, ready to claim reward'
+    })
+
+
+@ad_validation_bp.route('/api/ads/claim', methods=['POST'])
+def api_claim_ad_reward():
+    """
+    Reclama la recompensa de un anuncio completado.
+    """
+    data = request.get_json() or {}
+    token = data.get('token')
+    user_id = data.get('user_id')
+
+    if not token:
+        return jsonify({'success': False, 'error': 'Token required'}), 400
+
+    if not user_id:
+        return jsonify({'success': False, 'error': 'User ID required'}), 400
+
+    # claim_reward ya incluye las estadísticas actualizadas en 'stats'
+    result = claim_reward(token, user_id)
+
+    return jsonify(result)
+
+
+@ad_validation_bp.route('/api/ads/stats', methods=['GET'])
+def api_ad_stats():
+    """Obtiene las estadísticas de anuncios del usuario"""
+    user_id = request.args.get('user_id')
+
+    if not user_id:
+        return jsonify({'success': False, 'error': 'User ID required'}), 400
+
+    stats = get_user_ad_stats(user_id)
+    check = check_user_can_watch_ad(user_id)
+
+    return jsonify({
+        'success': True,
+        'stats': stats,
+        'can_watch': check.get('can_watch', True),
+        'cooldown_remaining': check.get('cooldown_remaining', 0)
+    })
+
+
+@ad_validation_bp.route('/api/telega/callback', methods=['POST', 'GET'])
+@verify_telega_signature
+def api_telega_callback():
+    """
+    Callback de Telega.io cuando un anuncio se completa.
+    Configura esta URL en el dashboard de Telega.io como Reward URL.
+
+    Telega.io enviará datos del anuncio completado.
+    """
+    # Obtener datos del callback
+    if request.method == 'POST':
+        data = request.get_json() or request.form.to_dict()
+    else:
+        data = request.args.to_dict()
+
+    ip_address = request.remote_addr
+    # Serializar el payload una sola vez (auditoría + telega_response)
+    payload = _json_dumps(data)
+
+    logger.info(f"[Telega Callback] Received: {payload}")
+
+    # Extraer token y user_id del callback
+    # NOTA: Los nombres de los campos dependen de cómo Telega.io envíe los datos
+    token = data.get('token') or data.get('ad_token') or data.get('custom_data')
+    user_id = data.get('user_id') or data.get('userId')
+
+    if not token:
+        log_telega_callback(None, None, payload, ip_address, False, 'No token in callback')
+        return jsonify({'success': False, 'error': 'No token'}), 400
+
+    # Validar token
+    token_info = validate_token(token)
+    if not token_info:
+        log_telega_callback(token, user_id, payload, ip_address, False, 'Invalid token')
+        return jsonify({'success': False, 'error': 'Invalid token'}), 400
+
+    # Marcar como completado
+    success = mark_token_completed(token, payload)
+
+    if success:
+        log_telega_callback(token, token_info['user_id'], payload, ip_address, True, None)
+        logger.info(f"[Telega Callback] Token {token[:8]}... marked completed")
+        return jsonify({'success': True})
+    else:
+        log_telega_callback(token, token_info['user_id'], payload, ip_address, False, 'Failed to mark completed')
+        return jsonify({'success': False, 'error': 'Failed to complete'}), 400
+
+
+@ad_validation_bp.route('/api/ads/quick-reward', methods=['POST'])
+def api_quick_ad_reward():
+    """
+    Endpoint simplificado que combina complete + claim en uno.
+    Usar cuando NO tienes callback de Telega.io configurado.
+    Incluye validaciones básicas anti-fraude.
+    """
+    data = request.get_json() or {}
+    token = data.get('token')
+    user_id = data.get('user_id')
+
+    if not token:
+        return jsonify({'success': False, 'error': 'Token required'}), 400
+
+    if not user_id:
+        return jsonify({'success': False, 'error': 'User ID required'}), 400
+
+    # Validar token
+    token_info = validate_token(token)
+    if not token_info:
+        return jsonify({'success': False, 'error': 'Invalid or expired token'}), 400
+
+    if str(token_info['user_id']) != str(user_id):
+        return jsonify({'success': False, 'error': 'Token mismatch'}), 403
+
+    if token_info['status'] == 'expired':
+        return jsonify({'success': False, 'error': 'Token expired'}), 400
+
+    if token_info['status'] == 'claimed':
+        return jsonify({'success': False, 'error': 'Already claimed'}), 400
+
+    # Si está pending, marcar como completed primero
+    if token_info['status'] == 'pending':
+        if not mark_token_completed(token):
             return jsonify({'success': False, 'error': 'Failed to complete'}), 400
-    
-    
-    @app.route('/api/ads/quick-reward', methods=['POST'])
-    def api_quick_ad_reward():
-        """
-        Endpoint simplificado que combina complete + claim en uno.
-        Usar cuando NO tienes callback de Telega.io configurado.
-        Incluye validaciones básicas anti-fraude.
-        """
-        data = request.get_json() or {}
-        token = data.get('token')
-        user_id = data.get('user_id')
-        
-        if not token:
-            return jsonify({'success': False, 'error': 'Token required'}), 400
-        
-        if not user_id:
-            return jsonify({'success': False, 'error': 'User ID required'}), 400
-        
-        # Validar token
-        token_info = validate_token(token)
-        if not token_info:
-            return jsonify({'success': False, 'error': 'Invalid or expired token'}), 400
-        
-        if str(token_info['user_id']) != str(user_id):
-            return jsonify({'success': False, 'error': 'Token mismatch'}), 403
-        
-        if token_info['status'] == 'expired':
-            return jsonify({'success': False, 'error': 'Token expired'}), 400
-        
-        if token_info['status'] == 'claimed':
-            return jsonify({'success': False, 'error': 'Already claimed'}), 400
-        
-        # Si está pending, marcar como completed primero
-        if token_info['status'] == 'pending':
-            if not mark_token_completed(token):
-                return jsonify({'success': False, 'error': 'Failed to complete'}), 400
-        
-        # Reclamar recompensa
-        result = claim_reward(token, user_id)
-        
-        if result.get('success'):
-            stats = get_user_ad_stats(user_id)
-            result['stats'] = stats
-        
-        return jsonify(result)
-    
-    
+
+    # Reclamar recompensa
+    result = claim_reward(token, user_id)
+
+    return jsonify(result)
+
+
+def register_ad_validation_routes(app):
+    """Registra las rutas de validación de anuncios en la app Flask"""
+    app.register_blueprint(ad_validation_bp)
     logger.info("✅ [AdValidation] Routes registered")
     return app
 
@@ -14,14 +14,27 @@ REGLAS:
 - Recompensa solo validada por backend
 """
 
-from flask import Blueprint, jsonify, request, render_template
+from flask import Blueprint, request, render_template
 from datetime import datetime
-import hashlib
 import secrets
 import logging
+import sys
+import time
+from threading import Lock
+
+from json_response import fast_jsonify as _jsonify
+from db import BatchWriter, get_cursor
+from ban_system import get_user_access
 
 logger = logging.getLogger(__name__)
 
+try:
+    from onclicka_pts_system import add_pts_async
+    PTS_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"⚠️ PTS system not available: {e}")
+    PTS_AVAILABLE = False
+
 # ============================================
 # CONFIGURACIÓN EXCLUSIVA DE ADEXIUM
 # ============================================
@@ -34,9 +47,154 @@ ADEXIUM_CONFIG = {
     'token_expiry_seconds': 120       # Token válido por 2 minutos
 }
 
+# Parte estática de la respuesta de /adexium/status (se calcula una sola vez)
+ADEXIUM_STATUS_CONFIG = {
+    'max_daily_ads': ADEXIUM_CONFIG['max_daily_ads'],
+    'cooldown_seconds': ADEXIUM_CONFIG['cooldown_seconds'],
+    'min_watch_seconds': ADEXIUM_CONFIG['min_watch_seconds'],
+    'reward_per_ad': ADEXIUM_CONFIG['reward_per_ad'],
+    'total_possible_reward': ADEXIUM_CONFIG['max_daily_ads'] * ADEXIUM_CONFIG['reward_per_ad'],
+    'widget_id': ADEXIUM_CONFIG['widget_id']
+}
+
+# ============================================
+# SENTENCIAS SQL
+# ============================================
+# Definidas una vez a nivel de módulo (ver la nota en ad_tasks.py sobre
+# por qué no se usan prepared statements con el pool actual).
+
+_SQL_SELECT_PROGRESS = """
+    SELECT ads_watched, total_earned, completed, last_ad_at, progress_date
+    FROM adexium_progress WHERE user_id = %s
+"""
+
+_SQL_RESET_DAILY_PROGRESS = """
+    UPDATE adexium_progress
+    SET ads_watched = 0, total_earned = 0, completed = 0,
+        progress_date = %s, session_token = NULL, updated_at = NOW()
+    WHERE user_id = %s
+      AND (progress_date IS NULL OR progress_date <> %s)
+"""
+
+_SQL_SELECT_SESSION_TOKEN = """
+    SELECT session_token, token_created_at
+    FROM adexium_progress WHERE user_id = %s
+"""
+
+_SQL_UPSERT_SESSION = """
+    INSERT INTO adexium_progress
+    (user_id, ads_watched, total_earned, completed, progress_date, session_token, token_created_at)
+    VALUES (%s, 0, 0, 0, %s, %s, NOW())
+    ON DUPLICATE KEY UPDATE
+        session_token = VALUES(session_token),
+        token_created_at = NOW(),
+        updated_at = NOW()
+"""
+
+# Una fila por sesión (UNIQUE session_token): el inicio la crea y el estado
+# final (completed/failed/cancelled) la actualiza, solo si es del mismo usuario
+_SQL_UPSERT_HISTORY = """
+    INSERT INTO adexium_history
+    (user_id, session_token, status, ip_address, user_agent, watch_duration,
+     reward_amount, fail_reason, started_at, completed_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        watch_duration = IF(user_id = VALUES(user_id) AND VALUES(status) <> 'started', VALUES(watch_duration), watch_duration),
+        reward_amount = IF(user_id = VALUES(user_id) AND VALUES(status) <> 'started', VALUES(reward_amount), reward_amount),
+        fail_reason = IF(user_id = VALUES(user_id) AND VALUES(status) <> 'started', VALUES(fail_reason), fail_reason),
+        completed_at = IF(user_id = VALUES(user_id) AND VALUES(status) <> 'started', VALUES(completed_at), completed_at),
+        status = IF(user_id = VALUES(user_id) AND VALUES(status) <> 'started', VALUES(status), status)
+"""
+
+_SQL_ADD_DOGE_BALANCE = """
+    UPDATE users
+    SET doge_balance = doge_balance + %s, updated_at = NOW()
+    WHERE user_id = %s
+"""
+
+# Transición completa en una sola sentencia atómica: solo aplica si el token
+# sigue vigente, es del día y no se superó el límite. MySQL evalúa las
+# asignaciones de izquierda a derecha, así que `completed` ya ve el
+# ads_watched incrementado.
+_SQL_UPDATE_PROGRESS_REWARD = """
+    UPDATE adexium_progress
+    SET ads_watched = ads_watched + 1,
+        total_earned = total_earned + %s,
+        completed = (ads_watched >= %s),
+        last_ad_at = NOW(), session_token = NULL, updated_at = NOW()
+    WHERE user_id = %s AND session_token = %s
+      AND progress_date = %s AND ads_watched < %s
+"""
+
+_SQL_SELECT_PROGRESS_TOTALS = """
+    SELECT ads_watched, total_earned, completed
+    FROM adexium_progress WHERE user_id = %s
+"""
+
+_SQL_LOG_REWARD = """
+    INSERT INTO balance_history
+    (user_id, action, currency, amount, description, created_at)
+    VALUES (%s, 'adexium_reward', 'DOGE', %s, %s, NOW())
+"""
+
+_SQL_CLEAR_SESSION_TOKEN = """
+    UPDATE adexium_progress
+    SET session_token = NULL
+    WHERE user_id = %s AND session_token = %s
+"""
+
+# Historial de sesiones (solo auditoría): se escribe en segundo plano por
+# lotes. Un único writer mantiene el orden, así el inicio de una sesión
+# siempre llega a la DB antes que su estado final.
+_history_writer = BatchWriter(_SQL_UPSERT_HISTORY, name="adexium_history")
+
+
+def _log_history(user_id, session_token, status, watch_duration=0, reward_amount=0,
+                 fail_reason=None, ip_address=None, user_agent=None):
+    """Encola un evento del historial de Adexium (con la hora del evento)"""
+    now = datetime.now()
+    started = status == 'started'
+    _history_writer.put((
+        str(user_id), session_token, status, ip_address, user_agent,
+        watch_duration, reward_amount, fail_reason,
+        now if started else None, None if started else now
+    ))
+
 # Blueprint para rutas de Adexium
 adexium_bp = Blueprint('adexium', __name__, url_prefix='/adexium')
 
+# get_user_id vive en el módulo de la aplicación (web.py en producción).
+# Se enlaza una vez al registrar el blueprint en lugar de hacer
+# "from app import ..." en cada petición (que además cargaba app.py).
+_get_user_id = None
+
+
+@adexium_bp.record_once
+def _bind_app_helpers(state):
+    global _get_user_id
+    _get_user_id = sys.modules[state.app.import_name].get_user_id
+
+# ============================================
+# CACHÉ EN MEMORIA DEL PROGRESO
+# ============================================
+# El frontend consulta /adexium/status cada pocos segundos y cada ruta lee
+# el progreso varias veces (status + cooldown). Un TTL corto absorbe esas
+# ráfagas; las escrituras de recompensa invalidan la entrada del usuario.
+# Formato: { user_id: (timestamp, progreso) }
+
+_PROGRESS_CACHE_TTL = 2
+_PROGRESS_CACHE_MAX_SIZE = 10000
+
+_progress_cache = {}
+_progress_cache_lock = Lock()
+
+# Bloqueo por usuario de /adexium/start mientras hay una sesión en curso:
+# los clics repetidos se rechazan sin tocar MySQL. Se libera al cancelar,
+# al recompensar o si el inicio falla.
+# Formato: { user_id: expira (monotonic) }
+_start_locks = {}
+_start_locks_lock = Lock()
+
 
 # ============================================
 # FUNCIONES DE BASE DE DATOS - ADEXIUM
@@ -44,40 +202,84 @@ adexium_bp = Blueprint('adexium', __name__, url_prefix='/adexium')
 
 def get_adexium_progress(user_id):
     """
-    Obtiene el progreso de Adexium del usuario para hoy.
+    Obtiene el progreso de Adexium del usuario para hoy (caché de 2s).
     Resetea automáticamente cuando cambia la fecha.
     Variables EXCLUSIVAS de Adexium - NO compartidas con otras plataformas.
     """
-    from db import get_cursor
+    key = str(user_id)
+    now = time.monotonic()
+    cached = _progress_cache.get(key)
+    if cached and now - cached[0] < _PROGRESS_CACHE_TTL:
+        return dict(cached[1])
+
+    progress = _load_adexium_progress(user_id)
+    if progress is None:
+        return {
+            'ads_watched': 0,
+            'total_earned': 0.0,
+            'completed': False,
+            'last_ad_at': None
+        }
+
+    with _progress_cache_lock:
+        if len(_progress_cache) >= _PROGRESS_CACHE_MAX_SIZE:
+            # Descartar las entradas caducadas
+            for k in [k for k, v in _progress_cache.items() if now - v[0] >= _PROGRESS_CACHE_TTL]:
+                _progress_cache.pop(k, None)
+        if len(_progress_cache) < _PROGRESS_CACHE_MAX_SIZE:
+            _progress_cache[key] = (now, progress)
+    return dict(progress)
+
+
+def _acquire_start_lock(user_id, ttl):
+    """Reserva el inicio de sesión del usuario durante ttl segundos (False si ya está reservado)"""
+    key = str(user_id)
+    now = time.monotonic()
+    with _start_locks_lock:
+        expires = _start_locks.get(key)
+        if expires and expires > now:
+            return False
+        if len(_start_locks) >= _PROGRESS_CACHE_MAX_SIZE:
+            for k in [k for k, v in _start_locks.items() if v <= now]:
+                _start_locks.pop(k, None)
+        _start_locks[key] = now + ttl
+        return True
+
+
+def _release_start_lock(user_id):
+    """Libera la reserva de inicio de sesión del usuario"""
+    with _start_locks_lock:
+        _start_locks.pop(str(user_id), None)
+
+
+def invalidate_adexium_progress(user_id):
+    """Elimina el progreso del usuario de la caché tras una escritura"""
+    with _progress_cache_lock:
+        _progress_cache.pop(str(user_id), None)
+
+
+def _load_adexium_progress(user_id):
+    """Lee el progreso de la base de datos (None si hay error)"""
     today = datetime.now().date()
 
     try:
         with get_cursor() as cursor:
-            cursor.execute(
-                """SELECT ads_watched, total_earned, completed, last_ad_at, progress_date
-                   FROM adexium_progress WHERE user_id = %s""",
-                (str(user_id),)
-            )
+            cursor.execute(_SQL_SELECT_PROGRESS, (str(user_id),))
             result = cursor.fetchone()
 
             if result:
+                # mysql-connector devuelve DATE/DATETIME como objetos nativos
                 progress_date = result.get('progress_date')
-                if progress_date:
-                    if isinstance(progress_date, str):
-                        progress_date = datetime.strptime(progress_date, '%Y-%m-%d').date()
-                    elif hasattr(progress_date, 'date'):
-                        progress_date = progress_date.date() if callable(getattr(progress_date, 'date', None)) else progress_date
+                if isinstance(progress_date, datetime):
+                    progress_date = progress_date.date()
 
-                # Si la fecha es diferente a hoy, resetear (reset diario)
+                # Si la fecha es diferente a hoy, resetear (reset diario).
+                # La condición sobre progress_date hace el reset idempotente:
+                # si otra petición ya lo hizo y registró un anuncio, no se pisa.
                 if progress_date != today:
-                    cursor.execute(
-                        """UPDATE adexium_progress
-                           SET ads_watched = 0, total_earned = 0, completed = 0,
-                               progress_date = %s, session_token = NULL, updated_at = NOW()
-                           WHERE user_id = %s""",
-                        (today, str(user_id))
-                    )
-                    logger.info(f"[Adexium] Daily reset for user {user_id}")
+                    cursor.execute(_SQL_RESET_DAILY_PROGRESS, (today, str(user_id), today))
+                    if cursor.rowcount:
+                        logger.info(f"[Adexium] Daily reset for user {user_id}")
                     return {
                         'ads_watched': 0,
                         'total_earned': 0.0,
@@ -101,12 +303,7 @@ def get_adexium_progress(user_id):
 
     except Exception as e:
         logger.warning(f"[Adexium] Error getting progress: {e}")
-        return {
-            'ads_watched': 0,
-            'total_earned': 0.0,
-            'completed': False,
-            'last_ad_at': None
-        }
+        return None
 
 
 def check_adexium_cooldown(user_id):
@@ -121,9 +318,6 @@ def check_adexium_cooldown(user_id):
         if not last_ad_at:
             return True, 0
 
-        if isinstance(last_ad_at, str):
-            last_ad_at = datetime.strptime(last_ad_at, '%Y-%m-%d %H:%M:%S')
-
         elapsed = (datetime.now() - last_ad_at).total_seconds()
         cooldown = ADEXIUM_CONFIG['cooldown_seconds']
 
@@ -139,23 +333,15 @@ def check_adexium_cooldown(user_id):
 
 def generate_adexium_token(user_id):
     """Genera un token único para la sesión de visualización de Adexium"""
-    random_bytes = secrets.token_bytes(32)
-    timestamp = str(datetime.now().timestamp())
-    data = f"adexium:{user_id}:{timestamp}:{random_bytes.hex()}"
-    return hashlib.sha256(data.encode()).hexdigest()
+    return secrets.token_hex(32)
 
 
 def validate_adexium_token(user_id, token):
     """Valida que el token de sesión de Adexium sea válido y no haya expirado"""
-    from db import get_cursor
 
     try:
         with get_cursor() as cursor:
-            cursor.execute(
-                """SELECT session_token, token_created_at
-                   FROM adexium_progress WHERE user_id = %s""",
-                (str(user_id),)
-            )
+            cursor.execute(_SQL_SELECT_SESSION_TOKEN, (str(user_id),))
             result = cursor.fetchone()
 
             if not result:
@@ -170,9 +356,6 @@ def validate_adexium_token(user_id, token):
             if not token_created_at:
                 return False, "Token timestamp missing"
 
-            if isinstance(token_created_at, str):
-                token_created_at = datetime.strptime(token_created_at, '%Y-%m-%d %H:%M:%S')
-
             elapsed = (datetime.now() - token_created_at).total_seconds()
             if elapsed > ADEXIUM_CONFIG['token_expiry_seconds']:
                 return False, "Token expired"
@@ -191,19 +374,17 @@ def validate_adexium_token(user_id, token):
 @adexium_bp.route('/')
 def adexium_page():
     """Página principal de Adexium en Explorar"""
-    from app import get_user_id, get_user
-
-    user_id = request.args.get('user_id') or get_user_id()
+    user_id = request.args.get('user_id') or _get_user_id()
 
     if not user_id:
         return render_template('telegram_required.html')
 
-    user = get_user(user_id)
+    user = get_user_access(user_id)
     if not user:
         return render_template('telegram_required.html')
 
-    if user.get('banned'):
-        return render_template('banned.html', reason=user.get('ban_reason', 'Cuenta suspendida'))
+    if user['banned']:
+        return render_template('banned.html', reason=user['ban_reason'] or 'Cuenta suspendida')
 
     progress = get_adexium_progress(user_id)
     can_watch, cooldown_remaining = check_adexium_cooldown(user_id)
@@ -221,19 +402,17 @@ def adexium_page():
 @adexium_bp.route('/status', methods=['GET'])
 def adexium_status():
     """Obtiene el estado actual del sistema Adexium para el usuario"""
-    from app import get_user_id, get_user
-
-    user_id = request.args.get('user_id') or get_user_id()
+    user_id = request.args.get('user_id') or _get_user_id()
 
     if not user_id:
-        return jsonify({'success': False, 'error': 'User ID required'}), 400
+        return _jsonify({'success': False, 'error': 'User ID required'}), 400
 
-    user = get_user(user_id)
+    user = get_user_access(user_id)
     if not user:
-        return jsonify({'success': False, 'error': 'User not found'}), 404
+        return _jsonify({'success': False, 'error': 'User not found'}), 404
 
-    if user.get('banned'):
-        return jsonify({'success': False, 'error': 'User banned'}), 403
+    if user['banned']:
+        return _jsonify({'success': False, 'error': 'User banned'}), 403
 
     progress = get_adexium_progress(user_id)
     can_watch, cooldown_remaining = check_adexium_cooldown(user_id)
@@ -241,7 +420,7 @@ def adexium_status():
     config = ADEXIUM_CONFIG
     ads_remaining = config['max_daily_ads'] - progress['ads_watched']
 
-    return jsonify({
+    return _jsonify({
         'success': True,
         'progress': {
             'ads_watched': progress['ads_watched'],
@@ -251,14 +430,7 @@ def adexium_status():
         },
         'can_watch': can_watch and not progress['completed'] and ads_remaining > 0,
         'cooldown_remaining': cooldown_remaining,
-        'config': {
-            'max_daily_ads': config['max_daily_ads'],
-            'cooldown_seconds': config['cooldown_seconds'],
-            'min_watch_seconds': config['min_watch_seconds'],
-            'reward_per_ad': config['reward_per_ad'],
-            'total_possible_reward': config['max_daily_ads'] * config['reward_per_ad'],
-            'widget_id': config['widget_id']
-        }
+        'config': ADEXIUM_STATUS_CONFIG
     })
 
 
@@ -269,28 +441,33 @@ def adexium_start():
     Genera un token único para verificar la visualización completa.
     ANTI-ABUSO: Bloquea múltiples clics rápidos.
     """
-    from app import get_user_id, get_user
-    from db import get_cursor
-
     data = request.get_json() or {}
-    user_id = data.get('user_id') or get_user_id()
+    user_id = data.get('user_id') or _get_user_id()
 
     if not user_id:
-        return jsonify({'success': False, 'error': 'User ID required'}), 400
+        return _jsonify({'success': False, 'error': 'User ID required'}), 400
+
+    config = ADEXIUM_CONFIG
+
+    # Clics repetidos con una sesión en curso: rechazar antes de consultar la DB
+    if not _acquire_start_lock(user_id, config['min_watch_seconds']):
+        return _jsonify({'success': False, 'error': 'Ya hay una sesión en curso'}), 429
 
-    user = get_user(user_id)
+    user = get_user_access(user_id)
     if not user:
-        return jsonify({'success': False, 'error': 'User not found'}), 404
+        _release_start_lock(user_id)
+        return _jsonify({'success': False, 'error': 'User not found'}), 404
 
-    if user.get('banned'):
-        return jsonify({'success': False, 'error': 'User banned'}), 403
+    if user['banned']:
+        _release_start_lock(user_id)
+        return _jsonify({'success': False, 'error': 'User banned'}), 403
 
-    config = ADEXIUM_CONFIG
     progress = get_adexium_progress(user_id)
 
     # Verificar límite diario (12 anuncios)
     if progress['completed'] or progress['ads_watched'] >= config['max_daily_ads']:
-        return jsonify({
+        _release_start_lock(user_id)
+        return _jsonify({
             'success': False,
             'error': 'Has alcanzado el límite diario de anuncios',
             'completed': True,
@@ -300,9 +477,10 @@ def adexium_start():
     # Verificar cooldown (7 minutos)
     can_watch, cooldown_remaining = check_adexium_cooldown(user_id)
     if not can_watch:
+        _release_start_lock(user_id)
         minutes = cooldown_remaining // 60
         seconds = cooldown_remaining % 60
-        return jsonify({
+        return _jsonify({
             'success': False,
             'error': f'Próximo anuncio disponible en {minutes}m {seconds}s',
             'cooldown_remaining': cooldown_remaining
@@ -314,39 +492,20 @@ def adexium_start():
 
     try:
         with get_cursor() as cursor:
-            # Verificar si existe registro
-            cursor.execute(
-                "SELECT user_id FROM adexium_progress WHERE user_id = %s",
-                (str(user_id),)
-            )
-            existing = cursor.fetchone()
-
-            if existing:
-                cursor.execute(
-                    """UPDATE adexium_progress
-                       SET session_token = %s, token_created_at = NOW(), updated_at = NOW()
-                       WHERE user_id = %s""",
-                    (session_token, str(user_id))
-                )
-            else:
-                cursor.execute(
-                    """INSERT INTO adexium_progress
-                       (user_id, ads_watched, total_earned, completed, progress_date, session_token, token_created_at)
-                       VALUES (%s, 0, 0, 0, %s, %s, NOW())""",
-                    (str(user_id), today, session_token)
-                )
-
-            # Registrar inicio en historial
-            cursor.execute(
-                """INSERT INTO adexium_history
-                   (user_id, session_token, status, ip_address, user_agent, started_at)
-                   VALUES (%s, %s, 'started', %s, %s, NOW())""",
-                (str(user_id), session_token, request.remote_addr, request.headers.get('User-Agent', '')[:255])
-            )
+            # Crear o actualizar el registro en una sola sentencia (user_id es UNIQUE)
+            cursor.execute(_SQL_UPSERT_SESSION, (str(user_id), today, session_token))
+
+        # Registrar inicio en historial
+        # User-Agent directo del environ WSGI (sin pasar por request.headers)
+        _log_history(
+            user_id, session_token, 'started',
+            ip_address=request.remote_addr,
+            user_agent=(request.environ.get('HTTP_USER_AGENT') or '')[:255]
+        )
 
         logger.info(f"[Adexium] Session started for user {user_id}, token: {session_token[:16]}...")
 
-        return jsonify({
+        return _jsonify({
             'success': True,
             'session_token': session_token,
             'min_watch_seconds': config['min_watch_seconds'],
@@ -357,7 +516,8 @@ def adexium_start():
 
     except Exception as e:
         logger.error(f"[Adexium] Error starting session: {e}")
-        return jsonify({'success': False, 'error': 'Database error'}), 500
+        _release_start_lock(user_id)
+        return _jsonify({'success': False, 'error': 'Database error'}), 500
 
 
 @adexium_bp.route('/reward', methods=['POST'])
@@ -367,26 +527,23 @@ def adexium_reward():
     Requiere el token de sesión y la duración de visualización (mínimo 15 segundos).
     VALIDACIÓN ESTRICTA: Solo el backend otorga recompensas.
     """
-    from app import get_user_id, get_user
-    from db import get_cursor
-
     data = request.get_json() or {}
-    user_id = data.get('user_id') or get_user_id()
+    user_id = data.get('user_id') or _get_user_id()
     session_token = data.get('session_token')
     watch_duration = data.get('watch_duration', 0)
 
     if not user_id:
-        return jsonify({'success': False, 'error': 'User ID required'}), 400
+        return _jsonify({'success': False, 'error': 'User ID required'}), 400
 
     if not session_token:
-        return jsonify({'success': False, 'error': 'Session token required'}), 400
+        return _jsonify({'success': False, 'error': 'Session token required'}), 400
 
-    user = get_user(user_id)
+    user = get_user_access(user_id)
     if not user:
-        return jsonify({'success': False, 'error': 'User not found'}), 404
+        return _jsonify({'success': False, 'error': 'User not found'}), 404
 
-    if user.get('banned'):
-        return jsonify({'success': False, 'error': 'User banned'}), 403
+    if user['banned']:
+        return _jsonify({'success': False, 'error': 'User banned'}), 403
 
     config = ADEXIUM_CONFIG
 
@@ -394,7 +551,7 @@ def adexium_reward():
     is_valid, validation_msg = validate_adexium_token(user_id, session_token)
     if not is_valid:
         logger.warning(f"[Adexium] Invalid token for user {user_id}: {validation_msg}")
-        return jsonify({
+        return _jsonify({
             'success': False,
             'error': 'Sesión inválida o expirada',
             'detail': validation_msg
@@ -410,82 +567,73 @@ def adexium_reward():
         logger.warning(f"[Adexium] Insufficient watch time for user {user_id}: {watch_duration}s < {config['min_watch_seconds']}s")
 
         # Actualizar historial como fallido
-        try:
-            with get_cursor() as cursor:
-                cursor.execute(
-                    """UPDATE adexium_history
-                       SET status = 'failed', watch_duration = %s, completed_at = NOW(),
-                           fail_reason = 'insufficient_time'
-                       WHERE session_token = %s AND user_id = %s""",
-                    (watch_duration, session_token, str(user_id))
-                )
-        except:
-            pass
-
-        return jsonify({
+        _log_history(user_id, session_token, 'failed', watch_duration=watch_duration,
+                     fail_reason='insufficient_time')
+
+        return _jsonify({
             'success': False,
             'error': f'Debes ver el anuncio al menos {config["min_watch_seconds"]} segundos',
             'watch_duration': watch_duration,
             'required': config['min_watch_seconds']
         })
 
-    # Verificar límite diario nuevamente (anti-abuso)
-    progress = get_adexium_progress(user_id)
-    if progress['ads_watched'] >= config['max_daily_ads']:
-        return jsonify({
-            'success': False,
-            'error': 'Has alcanzado el límite diario de anuncios',
-            'completed': True
-        })
-
     # Otorgar recompensa
     reward = config['reward_per_ad']
     pts_reward = 5  # PTS por anuncio visto
-    new_ads_watched = progress['ads_watched'] + 1
-    new_total_earned = progress['total_earned'] + reward
-    completed = new_ads_watched >= config['max_daily_ads']
+    today = datetime.now().date()
 
     try:
-        with get_cursor() as cursor:
-            # Actualizar balance del usuario (DOGE)
-            cursor.execute(
-                """UPDATE users
-                   SET doge_balance = doge_balance + %s, updated_at = NOW()
-                   WHERE user_id = %s""",
-                (reward, str(user_id))
-            )
-
-            # Actualizar progreso de Adexium
-            cursor.execute(
-                """UPDATE adexium_progress
-                   SET ads_watched = %s, total_earned = %s, completed = %s,
-                       last_ad_at = NOW(), session_token = NULL, updated_at = NOW()
-                   WHERE user_id = %s""",
-                (new_ads_watched, new_total_earned, 1 if completed else 0, str(user_id))
-            )
-
-            # Actualizar historial como completado
-            cursor.execute(
-                """UPDATE adexium_history
-                   SET status = 'completed', watch_duration = %s, reward_amount = %s, completed_at = NOW()
-                   WHERE session_token = %s AND user_id = %s""",
-                (watch_duration, reward, session_token, str(user_id))
-            )
-
-            # Registrar en balance_history
-            cursor.execute(
-                """INSERT INTO balance_history
-                   (user_id, action, currency, amount, description, created_at)
-                   VALUES (%s, 'adexium_reward', 'DOGE', %s, %s, NOW())""",
-                (str(user_id), reward, f'Recompensa Adexium #{new_ads_watched}')
-            )
-
-        # Agregar PTS al ranking
-        try:
-            from onclicka_pts_system import add_pts
-            add_pts(user_id, pts_reward, 'ad_watched', 'Adexium ad')
-        except Exception as pts_error:
-            logger.warning(f"[Adexium] Error adding PTS: {pts_error}")
+        # Saldo, progreso e historial en una sola transacción: un único commit
+        # y sin saldo acreditado a medias si falla una de las sentencias
+        with get_cursor(transaction=True) as cursor:
+            # Actualizar progreso de Adexium (el límite diario se verifica en
+            # el propio UPDATE, así dos recompensas concurrentes no pueden
+            # partir del mismo ads_watched)
+            cursor.execute(_SQL_UPDATE_PROGRESS_REWARD, (
+                reward, config['max_daily_ads'], str(user_id), session_token,
+                today, config['max_daily_ads']
+            ))
+            granted = cursor.rowcount == 1
+
+            if granted:
+                cursor.execute(_SQL_SELECT_PROGRESS_TOTALS, (str(user_id),))
+                row = cursor.fetchone()
+                new_ads_watched = int(row['ads_watched'])
+                new_total_earned = float(row['total_earned'])
+                completed = bool(row['completed'])
+
+                # Actualizar balance del usuario (DOGE)
+                cursor.execute(_SQL_ADD_DOGE_BALANCE, (reward, str(user_id)))
+
+                # Registrar en balance_history
+                cursor.execute(_SQL_LOG_REWARD, (str(user_id), reward, f'Recompensa Adexium #{new_ads_watched}'))
+
+        invalidate_adexium_progress(user_id)
+
+        if not granted:
+            # El token ya se consumió, cambió el día o se alcanzó el límite
+            _release_start_lock(user_id)
+            progress = get_adexium_progress(user_id)
+            if progress['ads_watched'] >= config['max_daily_ads']:
+                return _jsonify({
+                    'success': False,
+                    'error': 'Has alcanzado el límite diario de anuncios',
+                    'completed': True
+                })
+            return _jsonify({'success': False, 'error': 'Sesión inválida o expirada'}), 400
+
+        _release_start_lock(user_id)
+
+        # Actualizar historial como completado
+        _log_history(user_id, session_token, 'completed', watch_duration=watch_duration,
+                     reward_amount=reward)
+
+        # Agregar PTS al ranking (en segundo plano)
+        if PTS_AVAILABLE:
+            try:
+                add_pts_async(user_id, pts_reward, 'ad_watched', 'Adexium ad')
+            except Exception as pts_error:
+                logger.warning(f"[Adexium] Error adding PTS: {pts_error}")
 
         logger.info(f"[Adexium] Reward granted to user {user_id}: +{reward} DOGE +{pts_reward} PTS (ad #{new_ads_watched})")
 
@@ -493,7 +641,7 @@ def adexium_reward():
         cooldown = config['cooldown_seconds']
         ads_remaining = config['max_daily_ads'] - new_ads_watched
 
-        return jsonify({
+        return _jsonify({
             'success': True,
             'reward': reward,
             'ads_watched': new_ads_watched,
@@ -506,7 +654,7 @@ def adexium_reward():
 
     except Exception as e:
         logger.error(f"[Adexium] Error granting reward: {e}")
-        return jsonify({'success': False, 'error': 'Database error'}), 500
+        return _jsonify({'success': False, 'error': 'Database error'}), 500
 
 
 @adexium_bp.route('/cancel', methods=['POST'])
@@ -515,42 +663,37 @@ def adexium_cancel():
     Cancela una sesión de Adexium sin recompensa.
     Para casos donde el usuario cierra el anuncio antes de tiempo.
     """
-    from app import get_user_id
-    from db import get_cursor
-
     data = request.get_json() or {}
-    user_id = data.get('user_id') or get_user_id()
+    user_id = data.get('user_id') or _get_user_id()
     session_token = data.get('session_token')
     watch_duration = data.get('watch_duration', 0)
 
     if not user_id or not session_token:
-        return jsonify({'success': False}), 400
+        return _jsonify({'success': False}), 400
+
+    # El historial se escribe por lotes: un valor inválido haría fallar el lote entero
+    try:
+        watch_duration = int(watch_duration)
+    except (ValueError, TypeError):
+        watch_duration = 0
 
     try:
+        # Limpiar token de sesión (solo si es la sesión actual del usuario)
         with get_cursor() as cursor:
+            cursor.execute(_SQL_CLEAR_SESSION_TOKEN, (str(user_id), session_token))
+            cancelled = cursor.rowcount == 1
+
+        if cancelled:
             # Actualizar historial como cancelado
-            cursor.execute(
-                """UPDATE adexium_history
-                   SET status = 'cancelled', watch_duration = %s, completed_at = NOW(),
-                       fail_reason = 'user_cancelled'
-                   WHERE session_token = %s AND user_id = %s""",
-                (watch_duration, session_token, str(user_id))
-            )
-
-            # Limpiar token de sesión
-            cursor.execute(
-                """UPDATE adexium_progress
-                   SET session_token = NULL
-                   WHERE user_id = %s""",
-                (str(user_id),)
-            )
-
-        logger.info(f"[Adexium] Session cancelled for user {user_id}, duration: {watch_duration}s")
+            _log_history(user_id, session_token, 'cancelled', watch_duration=watch_duration,
+                         fail_reason='user_cancelled')
+            _release_start_lock(user_id)
+            logger.info(f"[Adexium] Session cancelled for user {user_id}, duration: {watch_duration}s")
 
     except Exception as e:
         logger.warning(f"[Adexium] Error cancelling session: {e}")
 
-    return jsonify({'success': True, 'cancelled': True})
+    return _jsonify({'success': True, 'cancelled': True})
 
 
 # ============================================
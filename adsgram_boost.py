@@ -8,11 +8,24 @@ adsgram_boost.py - Sistema de Boost de Minería x2 con AdsGram
 """
 
 import logging
+import time
+from threading import Lock
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
+
+from json_response import fast_jsonify as _jsonify
+from db import get_cursor
+from ban_system import get_user_access
 
 logger = logging.getLogger(__name__)
 
+try:
+    from onclicka_pts_system import add_pts_async
+    PTS_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"⚠️ PTS system not available: {e}")
+    PTS_AVAILABLE = False
+
 # ============================================
 # CONFIGURACIÓN DEL BOOST
 # ============================================
@@ -25,17 +38,43 @@ ADSGRAM_BOOST_CONFIG = {
     'min_user_id': 100000           # Ignorar IDs pequeños (tests de AdsGram)
 }
 
+# Caracteres que AdsGram puede dejar alrededor del userId ("[123]", espacios)
+_USER_ID_STRIP_TABLE = str.maketrans('', '', '[] \t\r\n')
+
 # Blueprint
 adsgram_boost_bp = Blueprint('adsgram_boost', __name__)
 
+# Caché del estado del boost: el frontend lo consulta cada pocos segundos.
+# Formato: { user_id: (timestamp, estado) }
+_STATUS_CACHE_TTL = 2
+_STATUS_CACHE_MAX_SIZE = 10000
+
+_status_cache = {}
+_status_cache_lock = Lock()
+
+# Bloqueo por usuario de activate_boost: los clics y callbacks repetidos se
+# rechazan sin consultar MySQL mientras hay una activación en curso o durante
+# el cooldown tras activar. Formato: { user_id: expira (monotonic) }
+_activation_locks = {}
+_activation_locks_lock = Lock()
+
+# Caché del multiplicador activo, consultado en cada cálculo de minería.
+# Un boost activo se guarda hasta que expira; la ausencia de boost se guarda
+# _MULTIPLIER_MISS_TTL segundos (solo este módulo inserta en mining_boosts y
+# activate_boost actualiza la entrada directamente).
+# Formato: { user_id: (válido_hasta (epoch), multiplicador) }
+_MULTIPLIER_MISS_TTL = 30
+_MULTIPLIER_CACHE_MAX_SIZE = 10000
+
+_multiplier_cache = {}
+_multiplier_cache_lock = Lock()
+
 # ============================================
 # FUNCIONES DE BASE DE DATOS
 # ============================================
 
 def init_adsgram_boost_tables():
     """Crear tabla de boosts si no existe"""
-    from db import get_cursor
-
     try:
         with get_cursor() as cursor:
             cursor.execute("""
@@ -46,7 +85,7 @@ def init_adsgram_boost_tables():
                     activated_at DATETIME NOT NULL,
                     expires_at DATETIME NOT NULL,
                     source VARCHAR(50) DEFAULT 'adsgram',
-                    INDEX idx_user_expires (user_id, expires_at),
+                    INDEX idx_user_exp_mult (user_id, expires_at, multiplier),
                     INDEX idx_expires (expires_at)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
             """)
@@ -57,7 +96,8 @@ def init_adsgram_boost_tables():
                     user_id VARCHAR(50) NOT NULL,
                     activated_at DATETIME NOT NULL,
                     boost_date DATE NOT NULL,
-                    INDEX idx_user_date (user_id, boost_date)
+                    INDEX idx_user_date (user_id, boost_date),
+                    INDEX idx_user_activated (user_id, activated_at)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
             """)
 
@@ -68,8 +108,6 @@ def init_adsgram_boost_tables():
 
 def get_active_boost(user_id):
     """Obtener boost activo del usuario (si existe)"""
-    from db import get_cursor
-
     try:
         with get_cursor() as cursor:
             cursor.execute("""
@@ -95,22 +133,56 @@ def get_active_boost(user_id):
 
 def get_boost_multiplier(user_id):
     """Obtener el multiplicador actual del usuario (1.0 si no tiene boost)"""
-    boost = get_active_boost(user_id)
-    return boost['multiplier'] if boost['active'] else 1.0
+    key = str(user_id)
+    now_ts = time.time()
+    cached = _multiplier_cache.get(key)
+    if cached and now_ts < cached[0]:
+        return cached[1]
+
+    try:
+        with get_cursor() as cursor:
+            cursor.execute("""
+                SELECT multiplier, expires_at
+                FROM mining_boosts
+                WHERE user_id = %s AND expires_at > NOW()
+                ORDER BY expires_at DESC
+                LIMIT 1
+            """, (key,))
+            result = cursor.fetchone()
+    except Exception as e:
+        # Sin caché: el siguiente cálculo vuelve a consultar
+        logger.error(f"Error obteniendo multiplicador de boost: {e}")
+        return 1.0
+
+    if result:
+        _cache_boost_multiplier(key, float(result['multiplier']), result['expires_at'].timestamp())
+        return float(result['multiplier'])
+
+    _cache_boost_multiplier(key, 1.0, now_ts + _MULTIPLIER_MISS_TTL)
+    return 1.0
+
+
+def _cache_boost_multiplier(user_id, multiplier, valid_until):
+    """Guarda el multiplicador del usuario hasta valid_until (epoch)"""
+    with _multiplier_cache_lock:
+        if len(_multiplier_cache) >= _MULTIPLIER_CACHE_MAX_SIZE:
+            # Descartar las entradas caducadas
+            now_ts = time.time()
+            for k in [k for k, v in _multiplier_cache.items() if now_ts >= v[0]]:
+                _multiplier_cache.pop(k, None)
+        if len(_multiplier_cache) < _MULTIPLIER_CACHE_MAX_SIZE:
+            _multiplier_cache[str(user_id)] = (valid_until, multiplier)
 
 
 def count_daily_boosts(user_id):
     """Contar cuántos boosts ha usado el usuario hoy"""
-    from db import get_cursor
-
     try:
         with get_cursor() as cursor:
-            today = datetime.now().strftime('%Y-%m-%d')
             cursor.execute("""
                 SELECT COUNT(*) as count
                 FROM adsgram_boost_history
-                WHERE user_id = %s AND boost_date = %s
-            """, (str(user_id), today))
+                WHERE user_id = %s AND boost_date = CURDATE()
+            """, (str(user_id),))
 
             result = cursor.fetchone()
             return int(result['count']) if result else 0
@@ -121,8 +193,6 @@ def count_daily_boosts(user_id):
 
 def get_last_boost_time(user_id):
     """Obtener la hora del último boost activado"""
-    from db import get_cursor
-
     try:
         with get_cursor() as cursor:
             cursor.execute("""
@@ -142,107 +212,220 @@ def get_last_boost_time(user_id):
     return None
 
 
-def can_activate_boost(user_id):
-    """Verificar si el usuario puede activar un boost"""
+def get_boost_status_bundle(user_id):
+    """
+    Obtener en una sola consulta el boost activo, los boosts de hoy y la
+    hora del último boost (lo que antes eran tres consultas separadas).
+    """
+    uid = str(user_id)
+    bundle = {
+        'active_boost': {'active': False, 'multiplier': 1.0, 'expires_at': None},
+        'daily_count': 0,
+        'last_boost': None,
+        # Instantes en segundos epoch, calculados una sola vez por consulta
+        'expires_ts': 0,
+        'cooldown_end_ts': 0
+    }
+
+    try:
+        with get_cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    (SELECT multiplier FROM mining_boosts
+                     WHERE user_id = %s AND expires_at > NOW()
+                     ORDER BY expires_at DESC LIMIT 1) AS multiplier,
+                    (SELECT expires_at FROM mining_boosts
+                     WHERE user_id = %s AND expires_at > NOW()
+                     ORDER BY expires_at DESC LIMIT 1) AS expires_at,
+                    (SELECT COUNT(*) FROM adsgram_boost_history
+                     WHERE user_id = %s AND boost_date = CURDATE()) AS daily_count,
+                    (SELECT MAX(activated_at) FROM adsgram_boost_history
+                     WHERE user_id = %s) AS last_boost
+            """, (uid, uid, uid, uid))
+
+            result = cursor.fetchone()
+            if result:
+                if result['expires_at'] is not None:
+                    bundle['active_boost'] = {
+                        'active': True,
+                        'multiplier': float(result['multiplier']),
+                        'expires_at': result['expires_at']
+                    }
+                    bundle['expires_ts'] = int(result['expires_at'].timestamp())
+                bundle['daily_count'] = int(result['daily_count'] or 0)
+                bundle['last_boost'] = result['last_boost']
+                if result['last_boost'] is not None:
+                    bundle['cooldown_end_ts'] = (
+                        int(result['last_boost'].timestamp())
+                        + ADSGRAM_BOOST_CONFIG['cooldown_minutes'] * 60
+                    )
+    except Exception as e:
+        logger.error(f"Error obteniendo estado del boost: {e}")
+
+    return bundle
+
+
+def can_activate_boost(user_id, bundle=None, now_ts=None):
+    """
+    Verificar si el usuario puede activar un boost.
+    Acepta el resultado de get_boost_status_bundle para no repetir la consulta.
+    """
     config = ADSGRAM_BOOST_CONFIG
+    if bundle is None:
+        bundle = get_boost_status_bundle(user_id)
+    if now_ts is None:
+        now_ts = int(time.time())
 
     # Verificar límite diario
-    daily_count = count_daily_boosts(user_id)
+    daily_count = bundle['daily_count']
     if daily_count >= config['max_daily_boosts']:
         return False, f"Límite diario alcanzado ({config['max_daily_boosts']} boosts)"
 
     # Verificar cooldown
-    last_boost = get_last_boost_time(user_id)
-    if last_boost:
-        cooldown_end = last_boost + timedelta(minutes=config['cooldown_minutes'])
-        if datetime.now() < cooldown_end:
-            remaining = (cooldown_end - datetime.now()).seconds
-            return False, f"Cooldown activo. Espera {remaining // 60}m {remaining % 60}s"
+    remaining = bundle['cooldown_end_ts'] - now_ts
+    if remaining > 0:
+        return False, f"Cooldown activo. Espera {remaining // 60}m {remaining % 60}s"
 
     # Verificar si ya tiene boost activo
-    active_boost = get_active_boost(user_id)
-    if active_boost['active']:
+    if bundle['active_boost']['active']:
         return False, "Ya tienes un boost activo"
 
     return True, "OK"
 
 
+def _acquire_activation_lock(user_id, ttl):
+    """Reserva la activación del usuario durante ttl segundos (False si ya está reservada)"""
+    key = str(user_id)
+    now = time.monotonic()
+    with _activation_locks_lock:
+        expires = _activation_locks.get(key)
+        if expires and expires > now:
+            return False
+        if len(_activation_locks) >= _STATUS_CACHE_MAX_SIZE:
+            for k in [k for k, v in _activation_locks.items() if v <= now]:
+                _activation_locks.pop(k, None)
+        _activation_locks[key] = now + ttl
+        return True
+
+
+def _release_activation_lock(user_id):
+    """Libera la reserva de activación del usuario"""
+    with _activation_locks_lock:
+        _activation_locks.pop(str(user_id), None)
+
+
 def activate_boost(user_id):
     """Activar boost x2 por 30 minutos"""
-    from db import get_cursor
-
     config = ADSGRAM_BOOST_CONFIG
 
-    # Verificar si puede activar
-    can_activate, reason = can_activate_boost(user_id)
-    if not can_activate:
-        return False, reason
+    # Activación repetida (en curso o recién hecha): rechazar sin tocar la DB
+    if not _acquire_activation_lock(user_id, config['cooldown_minutes'] * 60):
+        return False, "Ya tienes un boost activo"
 
     try:
+        uid = str(user_id)
         now = datetime.now()
         expires = now + timedelta(minutes=config['boost_duration_minutes'])
-        today = now.strftime('%Y-%m-%d')
+        cooldown_start = now - timedelta(minutes=config['cooldown_minutes'])
 
-        with get_cursor() as cursor:
-            # Insertar boost activo
+        with get_cursor(transaction=True) as cursor:
+            # Insertar boost activo solo si cumple las condiciones (mismas
+            # que can_activate_boost), comprobadas en la misma sentencia
             cursor.execute("""
                 INSERT INTO mining_boosts (user_id, multiplier, activated_at, expires_at, source)
-                VALUES (%s, %s, %s, %s, 'adsgram')
-            """, (str(user_id), config['boost_multiplier'], now, expires))
-
-            # Registrar en historial
-            cursor.execute("""
-                INSERT INTO adsgram_boost_history (user_id, activated_at, boost_date)
-                VALUES (%s, %s, %s)
-            """, (str(user_id), now, today))
-
-        # Agregar PTS por activar boost (15 PTS)
+                SELECT %s, %s, %s, %s, 'adsgram' FROM DUAL
+                WHERE NOT EXISTS (
+                        SELECT 1 FROM mining_boosts
+                        WHERE user_id = %s AND expires_at > %s)
+                  AND (SELECT COUNT(*) FROM adsgram_boost_history
+                       WHERE user_id = %s AND boost_date = CURDATE()) < %s
+                  AND NOT EXISTS (
+                        SELECT 1 FROM adsgram_boost_history
+                        WHERE user_id = %s AND activated_at > %s)
+            """, (uid, config['boost_multiplier'], now, expires,
+                  uid, now,
+                  uid, config['max_daily_boosts'],
+                  uid, cooldown_start))
+
+            activated = cursor.rowcount == 1
+            if activated:
+                # Registrar en historial
+                cursor.execute("""
+                    INSERT INTO adsgram_boost_history (user_id, activated_at, boost_date)
+                    VALUES (%s, %s, CURDATE())
+                """, (uid, now))
+
+        if not activated:
+            # No cumple alguna condición: consultar el motivo para el mensaje
+            _release_activation_lock(user_id)
+            can_activate, reason = can_activate_boost(user_id)
+            return False, reason if not can_activate else "No se pudo activar el boost"
+
+        invalidate_boost_status(user_id)
+        _cache_boost_multiplier(uid, float(config['boost_multiplier']), expires.timestamp())
+
+        # Agregar PTS por activar boost (15 PTS, en segundo plano)
         pts_reward = 15  # PTS por activar boost x2
         pts_added = False
-        try:
-            from onclicka_pts_system import add_pts
-            success_pts, msg_pts = add_pts(user_id, pts_reward, 'boost_activated', 'Boost x2 activado')
-            if success_pts:
+        if PTS_AVAILABLE:
+            try:
+                add_pts_async(user_id, pts_reward, 'boost_activated', 'Boost x2 activado')
                 pts_added = True
-                logger.info(f"✅ [AdsGram Boost] +{pts_reward} PTS agregados a {user_id}")
-            else:
-                logger.warning(f"⚠️ [AdsGram Boost] No se pudieron agregar PTS: {msg_pts}")
-        except Exception as pts_error:
-            logger.warning(f"⚠️ [AdsGram Boost] Error agregando PTS: {pts_error}")
-            import traceback
-            traceback.print_exc()
+            except Exception as pts_error:
+                logger.warning(f"⚠️ [AdsGram Boost] Error agregando PTS: {pts_error}")
 
         logger.info(f"✅ [AdsGram Boost] User {user_id} activó boost x{config['boost_multiplier']} hasta {expires}")
 
-        # Mensaje con PTS si se agregaron
+        # Mensaje con PTS si se encolaron
         if pts_added:
             return True, f"Boost x{int(config['boost_multiplier'])} activado por {config['boost_duration_minutes']} minutos +{pts_reward} PTS"
         return True, f"Boost x{int(config['boost_multiplier'])} activado por {config['boost_duration_minutes']} minutos"
 
     except Exception as e:
         logger.error(f"❌ Error activando boost: {e}")
+        _release_activation_lock(user_id)
         return False, "Error al activar boost"
 
 
 def get_boost_status(user_id):
-    """Obtener estado completo del boost para el frontend"""
+    """Obtener estado completo del boost para el frontend (caché de 2s)"""
+    key = str(user_id)
+    now = time.monotonic()
+    cached = _status_cache.get(key)
+    if cached and now - cached[0] < _STATUS_CACHE_TTL:
+        return cached[1]
+
+    status = _build_boost_status(user_id)
+    with _status_cache_lock:
+        if len(_status_cache) >= _STATUS_CACHE_MAX_SIZE:
+            # Descartar las entradas caducadas
+            for k in [k for k, v in _status_cache.items() if now - v[0] >= _STATUS_CACHE_TTL]:
+                _status_cache.pop(k, None)
+        if len(_status_cache) < _STATUS_CACHE_MAX_SIZE:
+            _status_cache[key] = (now, status)
+    return status
+
+
+def invalidate_boost_status(user_id):
+    """Elimina el estado del boost del usuario de la caché tras activarlo"""
+    with _status_cache_lock:
+        _status_cache.pop(str(user_id), None)
+
+
+def _build_boost_status(user_id):
+    """Calcula el estado del boost consultando la base de datos"""
     config = ADSGRAM_BOOST_CONFIG
-    active_boost = get_active_boost(user_id)
-    daily_count = count_daily_boosts(user_id)
-    can_activate, reason = can_activate_boost(user_id)
-
-    # Calcular tiempo restante de cooldown
-    cooldown_remaining = 0
-    last_boost = get_last_boost_time(user_id)
-    if last_boost:
-        cooldown_end = last_boost + timedelta(minutes=config['cooldown_minutes'])
-        if datetime.now() < cooldown_end:
-            cooldown_remaining = int((cooldown_end - datetime.now()).total_seconds())
-
-    # Calcular tiempo restante de boost activo
+    bundle = get_boost_status_bundle(user_id)
+    active_boost = bundle['active_boost']
+    daily_count = bundle['daily_count']
+    now_ts = int(time.time())
+    can_activate, reason = can_activate_boost(user_id, bundle, now_ts)
+
+    # Tiempos restantes con aritmética entera sobre una única lectura del reloj
+    cooldown_remaining = max(0, bundle['cooldown_end_ts'] - now_ts)
     boost_remaining = 0
-    if active_boost['active'] and active_boost['expires_at']:
-        boost_remaining = max(0, int((active_boost['expires_at'] - datetime.now()).total_seconds()))
+    if active_boost['active']:
+        boost_remaining = max(0, bundle['expires_ts'] - now_ts)
 
     return {
         'has_active_boost': active_boost['active'],
@@ -273,52 +456,49 @@ def adsgram_reward():
     config = ADSGRAM_BOOST_CONFIG
 
     # Obtener user_id del query string (formato especial de AdsGram)
-    query_string = request.query_string.decode('utf-8')
-
-    # El query string puede ser: "123456789" o "[userId]" o vacío
-    user_id = query_string.strip()
+    query_string = request.query_string.decode('ascii', 'ignore')
 
-    # Limpiar posibles caracteres extra
-    user_id = user_id.replace('[', '').replace(']', '').strip()
+    # El query string puede ser: "123456789" o "[userId]" o vacío.
+    # Corchetes y espacios se eliminan en una sola pasada.
+    user_id = query_string.translate(_USER_ID_STRIP_TABLE)
 
     logger.info(f"[AdsGram Reward] Query string raw: '{query_string}' -> user_id: '{user_id}'")
 
     # Validar user_id
     if not user_id:
         logger.warning("[AdsGram Reward] No user_id provided")
-        return jsonify({'success': False, 'error': 'No user_id'}), 400
+        return _jsonify({'success': False, 'error': 'No user_id'}), 400
 
     # Verificar que sea un ID numérico válido
     try:
         user_id_int = int(user_id)
     except ValueError:
         logger.warning(f"[AdsGram Reward] Invalid user_id format: {user_id}")
-        return jsonify({'success': False, 'error': 'Invalid user_id format'}), 400
+        return _jsonify({'success': False, 'error': 'Invalid user_id format'}), 400
 
     # Ignorar IDs pequeños (tests automáticos de AdsGram)
     if user_id_int < config['min_user_id']:
         logger.info(f"[AdsGram Reward] Ignoring test user_id: {user_id}")
-        return jsonify({'success': True, 'message': 'Test ID ignored'}), 200
+        return _jsonify({'success': True, 'message': 'Test ID ignored'}), 200
 
     # Verificar que el usuario existe
-    from database import get_user
-    user = get_user(user_id)
+    user = get_user_access(user_id)
 
     if not user:
         logger.warning(f"[AdsGram Reward] User not found: {user_id}")
-        return jsonify({'success': False, 'error': 'User not found'}), 404
+        return _jsonify({'success': False, 'error': 'User not found'}), 404
 
     # Verificar que no esté baneado
-    if user.get('banned'):
+    if user['banned']:
         logger.warning(f"[AdsGram Reward] Banned user attempted boost: {user_id}")
-        return jsonify({'success': False, 'error': 'User banned'}), 403
+        return _jsonify({'success': False, 'error': 'User banned'}), 403
 
     # Activar el boost
     success, message = activate_boost(user_id)
 
     if success:
         logger.info(f"[AdsGram Reward] Boost activated for user {user_id}")
-        return jsonify({
+        return _jsonify({
             'success': True,
             'message': message,
             'boost': {
@@ -328,7 +508,7 @@ def adsgram_reward():
         }), 200
     else:
         logger.info(f"[AdsGram Reward] Boost denied for user {user_id}: {message}")
-        return jsonify({
+        return _jsonify({
             'success': False,
             'error': message
         }), 400
@@ -344,10 +524,10 @@ def api_boost_status():
     user_id = request.args.get('user_id')
 
     if not user_id:
-        return jsonify({'success': False, 'error': 'User ID required'}), 400
+        return _jsonify({'success': False, 'error': 'User ID required'}), 400
 
     status = get_boost_status(user_id)
-    return jsonify({
+    return _jsonify({
         'success': True,
         **status
     })
@@ -359,11 +539,11 @@ def api_can_activate():
     user_id = request.args.get('user_id')
 
     if not user_id:
-        return jsonify({'success': False, 'error': 'User ID required'}), 400
+        return _jsonify({'success': False, 'error': 'User ID required'}), 400
 
     can_activate, reason = can_activate_boost(user_id)
 
-    return jsonify({
+    return _jsonify({
         'success': True,
         'can_activate': can_activate,
         'reason': reason if not can_activate else None,
@@ -380,25 +560,24 @@ def api_activate_boost():
     user_id = request.args.get('user_id') or (request.json.get('user_id') if request.json else None)
 
     if not user_id:
-        return jsonify({'success': False, 'error': 'User ID required'}), 400
+        return _jsonify({'success': False, 'error': 'User ID required'}), 400
 
     # Verificar que el usuario existe
-    from database import get_user
-    user = get_user(user_id)
+    user = get_user_access(user_id)
 
     if not user:
-        return jsonify({'success': False, 'error': 'User not found'}), 404
+        return _jsonify({'success': False, 'error': 'User not found'}), 404
 
     # Verificar que no esté baneado
-    if user.get('banned'):
-        return jsonify({'success': False, 'error': 'User banned'}), 403
+    if user['banned']:
+        return _jsonify({'success': False, 'error': 'User banned'}), 403
 
     # Activar el boost
     success, message = activate_boost(user_id)
 
     if success:
         logger.info(f"[API Boost] Boost activated for user {user_id}")
-        return jsonify({
+        return _jsonify({
             'success': True,
             'message': message,
             'boost': {
@@ -408,7 +587,7 @@ def api_activate_boost():
             }
         }), 200
     else:
-        return jsonify({
+        return _jsonify({
             'success': False,
             'error': message
         }), 400
@@ -429,18 +608,27 @@ def apply_boost_to_rate(user_id, base_rate):
     return base_rate * multiplier
 
 
-def cleanup_expired_boosts():
-    """Limpiar boosts expirados de la base de datos"""
-    from db import get_cursor
-
+def cleanup_expired_boosts(batch_size=5000):
+    """
+    Limpiar boosts expirados de la base de datos.
+    Normalmente lo hace el evento ev_cleanup_boosts en MySQL; esta función
+    queda como respaldo si el event_scheduler está desactivado.
+    """
     try:
-        with get_cursor() as cursor:
-            cursor.execute("""
-                DELETE FROM mining_boosts
-                WHERE expires_at < NOW()
-            """)
-            deleted = cursor.rowcount
-            if deleted > 0:
-                logger.info(f"[AdsGram Boost] Limpiados {deleted} boosts expirados")
+        # En bloques (usa idx_expires) para no bloquear mining_boosts
+        deleted = 0
+        while True:
+            with get_cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM mining_boosts
+                    WHERE expires_at < NOW()
+                    LIMIT %s
+                """, (batch_size,))
+                rows = cursor.rowcount
+            deleted += rows
+            if rows < batch_size:
+                break
+        if deleted > 0:
+            logger.info(f"[AdsGram Boost] Limpiados {deleted} boosts expirados")
     except Exception as e:
         logger.error(f"Error limpiando boosts: {e}")
@@ -9,13 +9,96 @@ las existentes en app.py para implementar:
 - UI mejorada de tareas
 """
 
+import logging
 import os
+import time
+from functools import lru_cache
+from threading import Event, Lock
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limit import check_verify_rate_limit, wait_for_telegram_slot
+
+logger = logging.getLogger(__name__)
+
+# Se lee una sola vez al importar (app.py define la misma constante, que es
+# la que usan las rutas de abajo una vez copiadas)
+BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
 
 # ============================================
 # NUEVAS FUNCIONES PARA VERIFICACIÓN DE CANAL
 # ============================================
 
+# Sesión HTTP compartida para la API de Telegram: reutiliza las conexiones
+# TLS en lugar de abrir una nueva por cada verificación
+_telegram_http = requests.Session()
+# Los 5xx transitorios se reintentan con backoff exponencial; los 429 se
+# tratan aparte en _fetch_channel_membership porque Telegram indica la
+# espera en el cuerpo (parameters.retry_after)
+_telegram_http.mount('https://', HTTPAdapter(
+    pool_connections=4, pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, allowed_methods=['GET'],
+                      status_forcelist=[500, 502, 503, 504], raise_on_status=False,
+                      respect_retry_after_header=True)
+))
+
+# (conexión, lectura) en segundos: la verificación se hace dentro de la
+# petición HTTP del usuario, así que un Telegram lento no debe retener el
+# hilo de gunicorn los 10s completos
+_TELEGRAM_TIMEOUT = (3.05, 5)
+
+# 429 (flood wait): se reintenta una vez si Telegram pide esperar poco
+_FLOOD_WAIT_MAX_ATTEMPTS = 2
+_FLOOD_WAIT_MAX_SECONDS = 3
+
+# Caché de resultados de getChatMember: /api/task/verify y /api/task/complete
+# suelen consultar el mismo usuario y canal con segundos de diferencia.
+# Los negativos duran menos para no bloquear a quien acaba de unirse.
+# Formato: { (user_id, canal): (expira (monotonic), es_miembro) }
+_MEMBERSHIP_TTL_MEMBER = 60
+_MEMBERSHIP_TTL_NOT_MEMBER = 15
+_MEMBERSHIP_CACHE_MAX_SIZE = 10000
+
+_membership_cache = {}
+_membership_cache_lock = Lock()
+
+
+def _cache_membership(key, is_member):
+    """Guarda un resultado definitivo de getChatMember"""
+    now = time.monotonic()
+    ttl = _MEMBERSHIP_TTL_MEMBER if is_member else _MEMBERSHIP_TTL_NOT_MEMBER
+    with _membership_cache_lock:
+        if len(_membership_cache) >= _MEMBERSHIP_CACHE_MAX_SIZE:
+            # Descartar las entradas caducadas
+            for k in [k for k, v in _membership_cache.items() if now >= v[0]]:
+                _membership_cache.pop(k, None)
+        if len(_membership_cache) < _MEMBERSHIP_CACHE_MAX_SIZE:
+            _membership_cache[key] = (now + ttl, is_member)
+
+
+# Verificaciones en curso: cuando muchos usuarios (o clics repetidos) piden
+# lo mismo a la vez, solo el primero llama a Telegram y el resto espera su
+# resultado. Así las ráfagas no agotan el límite de ~30 req/s del bot.
+# Formato: { (user_id, canal): Event }
+_membership_inflight = {}
+_membership_inflight_lock = Lock()
+
+
+@lru_cache(maxsize=1024)
+def _normalize_channel(channel_username):
+    """
+    Forma canónica del canal para la API y la caché: '@canal' o el chat_id
+    numérico. Hay pocos canales distintos, así que se calcula una vez por canal.
+    (La tabla tasks ya guarda el username sin '@', ver create_task/update_task.)
+    """
+    channel = channel_username.strip()
+    if not channel.startswith('@') and not channel.startswith('-'):
+        channel = f"@{channel}"
+    return channel, channel.lower()
+
+
 def verify_telegram_channel_membership(user_id, channel_username, bot_token):
     """
     Verifica si un usuario es miembro de un canal de Telegram usando la API
@@ -30,38 +113,82 @@ def verify_telegram_channel_membership(user_id, channel_username, bot_token):
     """
     if not bot_token or not channel_username:
         return True  # Sin verificación, asumir OK
-    
+
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        logger.warning("[verify_channel] user_id inválido: %r", user_id)
+        return True  # Mismo criterio que ante cualquier error: no bloquear
+
+    channel, channel_key = _normalize_channel(channel_username)
+    cache_key = (user_id, channel_key)
+    cached = _membership_cache.get(cache_key)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+
+    with _membership_inflight_lock:
+        pending = _membership_inflight.get(cache_key)
+        if pending is None:
+            pending = _membership_inflight[cache_key] = Event()
+            owner = True
+        else:
+            owner = False
+
+    if not owner:
+        # Otra petición ya está consultando: esperar su resultado
+        if pending.wait(sum(_TELEGRAM_TIMEOUT)):
+            cached = _membership_cache.get(cache_key)
+            if cached:
+                return cached[1]
+        return True  # Sin resultado definitivo, no bloquear al usuario
+
+    try:
+        wait_for_telegram_slot()
+        return _fetch_channel_membership(user_id, channel, bot_token, cache_key)
+    finally:
+        with _membership_inflight_lock:
+            _membership_inflight.pop(cache_key, None)
+        pending.set()
+
+
+def _fetch_channel_membership(user_id, channel, bot_token, cache_key):
+    """Consulta getChatMember y guarda en caché los resultados definitivos"""
     try:
-        # Limpiar el username del canal
-        channel = channel_username.strip()
-        if not channel.startswith('@') and not channel.startswith('-'):
-            channel = f"@{channel}"
-        
         url = f"https://api.telegram.org/bot{bot_token}/getChatMember"
         params = {
             'chat_id': channel,
-            'user_id': int(user_id)
+            'user_id': user_id
         }
         
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
+        for attempt in range(_FLOOD_WAIT_MAX_ATTEMPTS):
+            response = _telegram_http.get(url, params=params, timeout=_TELEGRAM_TIMEOUT)
+            data = response.json()
+            if response.status_code != 429:
+                break
+            retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+            if attempt + 1 >= _FLOOD_WAIT_MAX_ATTEMPTS or retry_after > _FLOOD_WAIT_MAX_SECONDS:
+                break
+            logger.info("[verify_channel] Flood wait: reintentando en %ss", retry_after)
+            time.sleep(retry_after)
         
         if data.get('ok'):
             status = data.get('result', {}).get('status', '')
             is_member = status in ['member', 'administrator', 'creator']
-            print(f"[verify_channel] Usuario {user_id} en {channel}: {status} -> {'✅' if is_member else '❌'}")
+            logger.debug("[verify_channel] Usuario %s en %s: %s -> %s", user_id, channel, status, is_member)
+            _cache_membership(cache_key, is_member)
             return is_member
         else:
             error = data.get('description', 'Unknown error')
-            print(f"[verify_channel] API error: {error}")
+            logger.warning("[verify_channel] API error: %s", error)
             # Si el error es que el usuario no está en el chat, no es miembro
             if 'user not found' in error.lower() or 'chat not found' in error.lower():
+                _cache_membership(cache_key, False)
                 return False
             # Para otros errores, asumir OK para no bloquear
             return True
             
     except Exception as e:
-        print(f"[verify_channel] Error: {e}")
+        logger.error("[verify_channel] Error: %s", e)
         return True  # En caso de error, no bloquear al usuario
 
 
@@ -118,7 +245,7 @@ def tasks_route_v2():
                              user_id=user_id,
                              available_tasks=available_tasks,
                              completed_tasks=completed_tasks,
-                             bot_token=os.environ.get('BOT_TOKEN', ''),
+                             bot_token=BOT_TOKEN,
                              show_support_button=True)
     '''
     pass
@@ -135,35 +262,54 @@ def api_task_complete_v2():
         """Complete a task - V2 con validación de canal y referidos"""
         user_id = get_user_id()
         if not user_id:
-            print(f"[api_task_complete] ❌ No user_id provided")
+            logger.debug("[api_task_complete] No user_id provided")
             return jsonify({'success': False, 'error': 'User ID required'}), 400
 
+        retry_after = check_verify_rate_limit(user_id, 'complete')
+        if retry_after:
+            response = jsonify({'success': False, 'error': 'Demasiados intentos, espera un momento'})
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response, 429
+
         data = request.get_json() or {}
         task_id = data.get('task_id')
 
         if not task_id:
-            print(f"[api_task_complete] ❌ No task_id provided")
+            logger.debug("[api_task_complete] No task_id provided")
             return jsonify({'success': False, 'error': 'Task ID required'}), 400
 
-        print(f"[api_task_complete] Usuario {user_id} intentando completar tarea {task_id}")
+        logger.debug("[api_task_complete] user=%s task=%s", user_id, task_id)
 
-        # Obtener la tarea
-        task = get_task(task_id)
+        # Obtener la tarea (caché en memoria de ad_tasks)
+        task = get_task_cached(task_id)
         if not task:
-            print(f"[api_task_complete] ❌ Tarea {task_id} no encontrada")
+            logger.info("[api_task_complete] Tarea %s no encontrada", task_id)
             return jsonify({'success': False, 'error': 'Tarea no encontrada'}), 400
+
+        # Tarea ya completada (doble clic, reintento del cliente): responder
+        # sin gastar una llamada a getChatMember del límite del bot
+        user = get_user(user_id)
+        if user and str(task_id) in (str(t) for t in user.get('completed_tasks', [])):
+            return jsonify({'success': False, 'error': 'Ya completaste esta tarea',
+                            'message': 'Ya completaste esta tarea'}), 400
         
-        # Verificar membresía de canal si es requerido
+        # Verificar membresía de canal si es requerido (normalmente ya está en
+        # caché: /api/task/verify se llama justo antes desde el cliente)
         if task.get('requires_channel_join') and task.get('channel_username'):
-            bot_token = os.environ.get('BOT_TOKEN', '')
-            if bot_token:
+            bot_token = BOT_TOKEN
+            # Si es un canal oficial, check_channel_or_redirect ya lo verificó al
+            # cargar /tasks: reutilizar su resultado positivo de la caché de app.py
+            channel_key = '@' + task['channel_username'].strip().lstrip('@')
+            is_cached, cached_result = _get_cached_membership(user_id, channel_key)
+            already_verified = bool(is_cached and cached_result and cached_result[0])
+            if bot_token and not already_verified:
                 is_member = verify_telegram_channel_membership(
                     user_id, 
                     task['channel_username'], 
                     bot_token
                 )
                 if not is_member:
-                    print(f"[api_task_complete] ❌ Usuario {user_id} no es miembro del canal {task['channel_username']}")
+                    logger.debug("[api_task_complete] Usuario %s no es miembro del canal %s", user_id, task['channel_username'])
                     return jsonify({
                         'success': False, 
                         'error': 'Debes unirte al canal para completar esta tarea',
@@ -180,13 +326,13 @@ def api_task_complete_v2():
             success = complete_task(user_id, task_id)
             message = 'Tarea completada' if success else 'Ya completaste esta tarea'
 
-        print(f"[api_task_complete] Resultado: success={success}, message={message}")
+        logger.debug("[api_task_complete] success=%s message=%s", success, message)
 
         if success:
             user = get_user(user_id)
             new_balance = float(user.get('pxc_balance', 0)) if user else 0
             completed_count = len(user.get('completed_tasks', [])) if user else 0
-            print(f"[api_task_complete] ✅ Tarea completada. Nuevo balance: {new_balance}")
+            logger.debug("[api_task_complete] Tarea completada. Nuevo balance: %s", new_balance)
             
             return jsonify({
                 'success': True,
@@ -196,7 +342,7 @@ def api_task_complete_v2():
                 'completed_count': completed_count
             })
 
-        print(f"[api_task_complete] ❌ Error: {message}")
+        logger.info("[api_task_complete] Error: %s", message)
         return jsonify({'success': False, 'error': message, 'message': message}), 400
     '''
     pass
@@ -215,13 +361,19 @@ def api_task_verify_v2():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID required'}), 400
 
+        retry_after = check_verify_rate_limit(user_id, 'verify')
+        if retry_after:
+            response = jsonify({'success': False, 'error': 'Demasiados intentos, espera un momento'})
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response, 429
+
         data = request.get_json() or {}
         task_id = data.get('task_id')
         channel_username = data.get('channel_username', '')
 
         # Obtener tarea para saber el canal si no se especificó
         if task_id and not channel_username:
-            task = get_task(task_id)
+            task = get_task_cached(task_id)
             if task:
                 channel_username = task.get('channel_username', '')
 
@@ -230,9 +382,9 @@ def api_task_verify_v2():
             return jsonify({'success': True, 'verified': True})
 
         # Verificar membresía usando la API de Telegram
-        bot_token = os.environ.get('BOT_TOKEN', '')
+        bot_token = BOT_TOKEN
         if not bot_token:
-            print("[api_task_verify] ⚠️ No bot token configured")
+            logger.warning("[api_task_verify] No bot token configured")
             return jsonify({'success': True, 'verified': True, 'message': 'No bot token configured'})
 
         is_member = verify_telegram_channel_membership(user_id, channel_username, bot_token)
@@ -338,6 +490,7 @@ def admin_task_edit_v2():
             }
             
             update_task(task_id, **updates)
+            invalidate_task_cache(task_id)
             flash('Tarea actualizada exitosamente', 'success')
             return redirect(url_for('admin_tasks'))
 
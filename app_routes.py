@@ -12,8 +12,9 @@ from database import (
     # ... imports existentes ...,
     # Funciones de tareas de anuncios
     get_ad_tasks, get_ad_task_progress, update_ad_task_progress,
-    create_ad_task, check_ad_cooldown
+    create_ad_task, check_ad_cooldown, get_tasks_bundle
 )
+from ad_tasks import get_task_cached
 
 
 # ============================================
@@ -41,49 +42,18 @@ def tasks():
     if channel_check:
         return channel_check
 
-    all_tasks = get_active_tasks()
-
     raw_completed = user.get('completed_tasks', [])
     if not isinstance(raw_completed, list):
         raw_completed = []
     completed_ids_set = set(str(t) for t in raw_completed if t)
 
-    print(f"[tasks] Usuario {user_id} - Tareas completadas: {completed_ids_set}")
+    # Tareas y progreso de anuncios en una sola consulta, ya clasificadas
+    (available_tasks, completed_tasks, ad_tasks,
+     completed_ad_tasks, ad_progress) = get_tasks_bundle(user_id, completed_ids_set)
 
-    available_tasks = {}
-    completed_tasks = {}
-    ad_tasks = {}
-    completed_ad_tasks = {}
-
-    for task in all_tasks:
-        task_id = str(task.get('task_id', ''))
-        
-        # Separar tareas de anuncios
-        if task.get('task_type') == 'ads':
-            ad_tasks[task_id] = task
-        elif task_id in completed_ids_set:
-            completed_tasks[task_id] = task
-        else:
-            available_tasks[task_id] = task
-
-    # Obtener progreso de tareas de anuncios
-    ad_progress = {}
-    try:
-        ad_progress = get_ad_task_progress(user_id)
-    except Exception as e:
-        print(f"[tasks] Error getting ad progress: {e}")
-    
-    # Separar tareas de anuncios completadas
-    for task_id in list(ad_tasks.keys()):
-        task = ad_tasks[task_id]
-        progress = ad_progress.get(task_id, {})
-        if progress.get('completed'):
-            task['total_earned'] = progress.get('total_earned', 0)
-            completed_ad_tasks[task_id] = task
-            del ad_tasks[task_id]
-
-    print(f"[tasks] Disponibles: {list(available_tasks.keys())}, Completadas: {list(completed_tasks.keys())}")
-    print(f"[tasks] Ad Tasks: {list(ad_tasks.keys())}, Completed Ad Tasks: {list(completed_ad_tasks.keys())}")
+    logger.debug("[tasks] user=%s disponibles=%d completadas=%d ad_tasks=%d completed_ad_tasks=%d",
+                 user_id, len(available_tasks), len(completed_tasks),
+                 len(ad_tasks), len(completed_ad_tasks))
 
     return render_template('tasks.html',
                          user=user,
@@ -113,8 +83,8 @@ def api_ad_task_watch():
     if not task_id:
         return jsonify({'success': False, 'error': 'Task ID required'}), 400
 
-    # Obtener información de la tarea
-    task = get_task(task_id)
+    # Obtener información de la tarea (caché en memoria)
+    task = get_task_cached(task_id)
     if not task:
         return jsonify({'success': False, 'error': 'Task not found'}), 404
 
@@ -136,18 +106,14 @@ def api_ad_task_watch():
             'cooldown_remaining': remaining
         }), 429
 
-    # Actualizar progreso
-    success, ads_watched, total_earned, task_completed = update_ad_task_progress(
+    # Progreso, recompensa y saldo resultante en una sola transacción
+    success, ads_watched, total_earned, task_completed, new_balance = update_ad_task_progress(
         user_id, task_id, reward_per_ad
     )
 
     if not success:
         return jsonify({'success': False, 'error': 'Failed to update progress'}), 500
 
-    # Obtener balance actualizado
-    updated_user = get_user(user_id)
-    new_balance = float(updated_user.get('pxc_balance', 0)) if updated_user else 0
-
     logger.info(f"[AdTask] User {user_id} watched ad in {task_id}: {ads_watched}/{ads_required}")
 
     return jsonify({
@@ -11,7 +11,7 @@ INSTRUCCIONES DE INTEGRACIÓN:
 =============================
 
 1. Agregar imports al inicio de app.py:
-   from transactions_system import get_user_unified_transactions, format_transaction_for_api, CURRENCIES, get_translations
+   from transactions_system import CURRENCIES, get_translations, get_transactions_page
    from withdrawal_notifications import on_withdrawal_created, on_withdrawal_completed, on_withdrawal_rejected
 
 2. Reemplazar la función api_transactions() con new_api_transactions()
@@ -19,6 +19,24 @@ INSTRUCCIONES DE INTEGRACIÓN:
 3. Agregar llamadas a notificaciones en los lugares indicados
 """
 
+import logging
+
+from json_response import fast_jsonify as _jsonify
+
+logger = logging.getLogger(__name__)
+
+# Lista de monedas soportadas; CURRENCIES es inmutable, se calcula una sola vez
+_CURRENCY_LIST = None
+
+
+def _get_currency_list():
+    global _CURRENCY_LIST
+    if _CURRENCY_LIST is None:
+        from transactions_system import CURRENCIES
+        _CURRENCY_LIST = list(CURRENCIES.keys())
+    return _CURRENCY_LIST
+
+
 # ============== NUEVO ENDPOINT DE TRANSACCIONES ==============
 
 def new_api_transactions():
@@ -30,7 +48,7 @@ def new_api_transactions():
     Reemplaza: @app.route('/api/transactions')
     """
     from flask import request, jsonify
-    from transactions_system import get_user_unified_transactions, format_transaction_for_api, CURRENCIES
+    from transactions_system import get_transactions_page
     
     user_id = request.args.get('user_id')
     if not user_id:
@@ -44,50 +62,26 @@ def new_api_transactions():
     lang = request.args.get('lang', 'en')  # Idioma para traducciones
     
     try:
-        # Obtener transacciones unificadas
-        transactions = get_user_unified_transactions(
-            user_id=user_id,
-            currency=currency.upper() if currency else None,
+        # Transacciones unificadas, formateadas y con estadísticas (caché por página)
+        formatted, stats = get_transactions_page(
+            user_id,
+            currency=currency,
             tx_type=tx_type,
             limit=limit,
-            offset=offset
+            offset=offset,
+            lang=lang
         )
         
-        # Formatear para API
-        formatted = [format_transaction_for_api(tx, lang) for tx in transactions]
-        
-        # Calcular estadísticas
-        stats = {
-            'total_received': 0,
-            'total_sent': 0,
-            'by_currency': {}
-        }
-        
-        for tx in transactions:
-            currency_code = tx.get('currency', 'PXC')
-            amount = float(tx.get('amount', 0))
-            
-            if currency_code not in stats['by_currency']:
-                stats['by_currency'][currency_code] = {'received': 0, 'sent': 0}
-            
-            if tx.get('tx_type') == 'withdrawal':
-                stats['total_sent'] += amount
-                stats['by_currency'][currency_code]['sent'] += amount
-            else:
-                stats['total_received'] += amount
-                stats['by_currency'][currency_code]['received'] += amount
-        
-        return jsonify({
+        return _jsonify({
             'success': True,
             'transactions': formatted,
             'count': len(formatted),
             'stats': stats,
-            'currencies': list(CURRENCIES.keys())
+            'currencies': _get_currency_list()
         })
         
-    except Exception as e:
-        import logging
-        logging.error(f"[api_transactions_unified] Error: {e}")
+    except Exception:
+        logger.exception("[api_transactions_unified] Error")
         return jsonify({
             'success': False,
             'error': 'Error al obtener transacciones',
@@ -184,9 +178,8 @@ def notify_new_withdrawal(withdrawal_id, user_id, currency, amount, wallet_addre
             amount=amount,
             wallet_address=wallet_address
         )
-    except Exception as e:
-        import logging
-        logging.error(f"[notify_new_withdrawal] Error sending notification: {e}")
+    except Exception:
+        logger.exception("[notify_new_withdrawal] Error sending notification")
 
 
 def notify_completed_withdrawal(withdrawal_id, user_id, currency, amount, wallet_address, tx_hash):
@@ -204,9 +197,8 @@ def notify_completed_withdrawal(withdrawal_id, user_id, currency, amount, wallet
             wallet_address=wallet_address,
             tx_hash=tx_hash
         )
-    except Exception as e:
-        import logging
-        logging.error(f"[notify_completed_withdrawal] Error sending notification: {e}")
+    except Exception:
+        logger.exception("[notify_completed_withdrawal] Error sending notification")
 
 
 def notify_rejected_withdrawal(withdrawal_id, user_id, currency, amount, reason=''):
@@ -223,17 +215,19 @@ def notify_rejected_withdrawal(withdrawal_id, user_id, currency, amount, reason=
             amount=amount,
             reason=reason
         )
-    except Exception as e:
-        import logging
-        logging.error(f"[notify_rejected_withdrawal] Error sending notification: {e}")
+    except Exception:
+        logger.exception("[notify_rejected_withdrawal] Error sending notification")
 
 
 # ============== CÓDIGO PARA COPIAR A app.py ==============
 
 PATCH_IMPORTS = """
 # === TRANSACTIONS SYSTEM IMPORTS ===
-from transactions_system import get_user_unified_transactions, format_transaction_for_api, CURRENCIES, get_translations
+from transactions_system import CURRENCIES, get_translations, get_transactions_page
 from withdrawal_notifications import on_withdrawal_created, on_withdrawal_completed, on_withdrawal_rejected
+from json_response import fast_jsonify as _jsonify
+
+_CURRENCY_LIST = list(CURRENCIES.keys())
 """
 
 PATCH_API_TRANSACTIONS = """
@@ -252,49 +246,26 @@ def api_transactions():
     lang = request.args.get('lang', 'en')
     
     try:
-        # Obtener transacciones unificadas
-        transactions = get_user_unified_transactions(
-            user_id=user_id,
-            currency=currency.upper() if currency else None,
+        # Transacciones unificadas, formateadas y con estadísticas (caché por página)
+        formatted, stats = get_transactions_page(
+            user_id,
+            currency=currency,
             tx_type=tx_type,
             limit=limit,
-            offset=offset
+            offset=offset,
+            lang=lang
         )
         
-        # Formatear para API
-        formatted = [format_transaction_for_api(tx, lang) for tx in transactions]
-        
-        # Calcular estadísticas
-        stats = {
-            'total_received': 0,
-            'total_sent': 0,
-            'by_currency': {}
-        }
-        
-        for tx in transactions:
-            curr = tx.get('currency', 'PXC')
-            amount = float(tx.get('amount', 0))
-            
-            if curr not in stats['by_currency']:
-                stats['by_currency'][curr] = {'received': 0, 'sent': 0}
-            
-            if tx.get('tx_type') == 'withdrawal':
-                stats['total_sent'] += amount
-                stats['by_currency'][curr]['sent'] += amount
-            else:
-                stats['total_received'] += amount
-                stats['by_currency'][curr]['received'] += amount
-        
-        return jsonify({
+        return _jsonify({
             'success': True,
             'transactions': formatted,
             'count': len(formatted),
             'stats': stats,
-            'currencies': list(CURRENCIES.keys())
+            'currencies': _CURRENCY_LIST
         })
         
-    except Exception as e:
-        logger.error(f"[api_transactions] Error: {e}")
+    except Exception:
+        logger.exception("[api_transactions] Error")
         return jsonify({
             'success': False,
             'error': 'Error al obtener transacciones',
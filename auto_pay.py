@@ -3,9 +3,11 @@ auto_pay.py - Procesador automático de pagos para ARCADE PXC
 Procesa retiros automáticamente usando payments.py para BEP20 y ton_payments.py para TON
 """
 
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from database import (
-    get_withdrawal, update_withdrawal, update_balance,
+    get_withdrawal, update_withdrawal, claim_withdrawal, complete_withdrawal, update_balance,
     get_pending_withdrawals, get_config
 )
 
@@ -24,14 +26,26 @@ except ImportError:
     TON_PAYMENTS_AVAILABLE = False
     print("Warning: ton_payments_system.py not available - TON auto_pay will use manual mode")
 
-def process_withdrawal(withdrawal_id):
+# Estado de wallets reutilizado entre retiros individuales (cada consulta son
+# llamadas RPC a BSC/TON); los pagos enviados se descuentan del valor cacheado
+_WALLET_STATUS_TTL = 5
+
+_wallet_status_cache = {}  # red ('bep20' / 'ton') -> (ts, status)
+_wallet_status_lock = Lock()
+
+def process_withdrawal(withdrawal_id, withdrawal=None):
     """
     Procesa un retiro individual
     
+    Args:
+        withdrawal: fila del retiro ya leída (opcional); el paso a 'processing'
+                    es condicional, así que una fila desactualizada no se paga dos veces
+    
     Returns:
         tuple: (success: bool, message: str)
     """
-    withdrawal = get_withdrawal(withdrawal_id)
+    if withdrawal is None:
+        withdrawal = get_withdrawal(withdrawal_id)
     
     if not withdrawal:
         return False, "Retiro no encontrado"
@@ -39,13 +53,9 @@ def process_withdrawal(withdrawal_id):
     if withdrawal['status'] != 'pending':
         return False, f"Estado inválido: {withdrawal['status']}"
     
-    currency = withdrawal['currency'].upper()
-    
-    # Determinar qué sistema de pago usar
-    if currency == 'TON':
-        return process_ton_withdrawal(withdrawal)
-    else:
-        return process_bep20_withdrawal(withdrawal)
+    # Determinar qué sistema de pago usar (BEP20 por defecto)
+    processor = _PROCESSORS.get(withdrawal['currency'].upper(), process_bep20_withdrawal)
+    return processor(withdrawal)
 
 def process_bep20_withdrawal(withdrawal):
     """Procesa un retiro BEP20 (USDT/DOGE)"""
@@ -54,62 +64,36 @@ def process_bep20_withdrawal(withdrawal):
     
     withdrawal_id = withdrawal['withdrawal_id']
     
+    # Mark as processing (only if still pending)
+    if not claim_withdrawal(withdrawal_id):
+        return False, "El retiro ya no está pendiente"
+    
     # Validate wallet address
     if not validate_bep20(withdrawal['wallet_address']):
-        update_withdrawal(withdrawal_id, 
-                         status='failed',
-                         error_message='Dirección de wallet BEP20 inválida')
-        # Return balance
-        update_balance(withdrawal['user_id'],
-                      withdrawal['currency'].lower(),
-                      withdrawal['amount'],
-                      'add',
-                      f'Withdrawal failed refund: {withdrawal["amount"]} {withdrawal["currency"]}')
+        _fail_and_refund(withdrawal, 'Dirección de wallet BEP20 inválida')
         return False, "Dirección de wallet BEP20 inválida"
     
-    # Mark as processing
-    update_withdrawal(withdrawal_id, status='processing')
-    
     try:
         # Attempt to send crypto
         success, result = send_crypto(
             to_address=withdrawal['wallet_address'],
-            amount=float(withdrawal['amount']),
+            amount=_withdrawal_amount(withdrawal),
             currency=withdrawal['currency']
         )
         
         if success:
             # Update to completed with tx hash
-            update_withdrawal(withdrawal_id,
-                            status='completed',
-                            tx_hash=result,
-                            processed_at=datetime.now())
+            complete_withdrawal(withdrawal_id, result)
             return True, f"Pago enviado. TX: {result}"
         else:
-            # Payment failed
-            update_withdrawal(withdrawal_id,
-                            status='failed',
-                            error_message=result)
-            # Return balance to user
-            update_balance(withdrawal['user_id'],
-                          withdrawal['currency'].lower(),
-                          withdrawal['amount'],
-                          'add',
-                          f'Withdrawal failed refund: {withdrawal["amount"]} {withdrawal["currency"]}')
+            # Payment failed: return balance to user
+            _fail_and_refund(withdrawal, result)
             return False, f"Error en el pago: {result}"
             
     except Exception as e:
         # Handle unexpected errors
         error_msg = str(e)
-        update_withdrawal(withdrawal_id,
-                         status='failed',
-                         error_message=error_msg)
-        # Return balance
-        update_balance(withdrawal['user_id'],
-                      withdrawal['currency'].lower(),
-                      withdrawal['amount'],
-                      'add',
-                      f'Withdrawal error refund: {withdrawal["amount"]} {withdrawal["currency"]}')
+        _fail_and_refund(withdrawal, error_msg, 'error')
         return False, f"Error inesperado: {error_msg}"
 
 def process_ton_withdrawal(withdrawal):
@@ -120,44 +104,63 @@ def process_ton_withdrawal(withdrawal):
     withdrawal_id = withdrawal['withdrawal_id']
     address = withdrawal['wallet_address']
 
+    # Marcar como procesando (solo si sigue pendiente)
+    if not claim_withdrawal(withdrawal_id):
+        return False, "El retiro ya no está pendiente"
+
     # Validar dirección
     valid, err = _validate_ton_addr(address)
     if not valid:
-        update_withdrawal(withdrawal_id, status='failed', error_message=f'Dirección TON inválida: {err}')
-        update_balance(withdrawal['user_id'], 'ton', withdrawal['amount'], 'add',
-                       f'TON Withdrawal failed refund: {withdrawal["amount"]} TON')
+        _fail_and_refund(withdrawal, f'Dirección TON inválida: {err}')
         return False, f"Dirección TON inválida: {err}"
 
-    # Marcar como procesando
-    update_withdrawal(withdrawal_id, status='processing')
-
     try:
         memo = f"ARCADE PXC Withdrawal {withdrawal_id}"
         success, tx_hash, error = send_ton_payment(
             to_address=address,
-            amount=float(withdrawal['amount']),
+            amount=_withdrawal_amount(withdrawal),
             memo=memo,
         )
 
         if success:
-            update_withdrawal(withdrawal_id,
-                              status='completed',
-                              tx_hash=tx_hash,
-                              processed_at=datetime.now())
+            complete_withdrawal(withdrawal_id, tx_hash)
             return True, f"TON enviado. TX: {tx_hash}"
         else:
-            update_withdrawal(withdrawal_id, status='failed', error_message=error)
-            update_balance(withdrawal['user_id'], 'ton', withdrawal['amount'], 'add',
-                           f'TON Withdrawal failed refund: {withdrawal["amount"]} TON')
+            _fail_and_refund(withdrawal, error)
             return False, f"Error en el pago TON: {error}"
 
     except Exception as e:
         error_msg = str(e)
-        update_withdrawal(withdrawal_id, status='failed', error_message=error_msg)
-        update_balance(withdrawal['user_id'], 'ton', withdrawal['amount'], 'add',
-                       f'TON Withdrawal error refund: {withdrawal["amount"]} TON')
+        _fail_and_refund(withdrawal, error_msg, 'error')
         return False, f"Error inesperado: {error_msg}"
 
+def _withdrawal_amount(withdrawal):
+    """
+    Monto del retiro como float, convertido una sola vez por fila
+    (chequeo de saldo, envío y descuento). Los reembolsos siguen usando
+    el Decimal original de MySQL.
+    """
+    amount = withdrawal.get('_amount')
+    if amount is None:
+        amount = withdrawal['_amount'] = float(withdrawal['amount'])
+    return amount
+
+def _fail_and_refund(withdrawal, error_message, kind='failed'):
+    """Marca el retiro como fallido y devuelve el saldo al usuario"""
+    update_withdrawal(withdrawal['withdrawal_id'], status='failed', error_message=error_message)
+    currency = withdrawal['currency'].upper()
+    prefix = 'TON ' if currency == 'TON' else ''
+    update_balance(withdrawal['user_id'], currency.lower(), withdrawal['amount'], 'add',
+                   f'{prefix}Withdrawal {kind} refund: {withdrawal["amount"]} {currency}')
+
+# Procesador de pago por moneda; las monedas no listadas van por BEP20
+_PROCESSORS = {
+    'TON': process_ton_withdrawal,
+    'USDT': process_bep20_withdrawal,
+    'DOGE': process_bep20_withdrawal,
+    'BNB': process_bep20_withdrawal,
+}
+
 def process_all_pending():
     """
     Procesa todos los retiros pendientes
@@ -183,9 +186,26 @@ def process_all_pending():
         'details': []
     }
     
+    # Estado de las wallets una sola vez para todo el lote (cada consulta son
+    # llamadas RPC a BSC/TON); los saldos se descuentan según se envían pagos
+    wallet_status = check_wallet_status()
+    
+    # Los pagos de una misma wallet van en serie (el nonce de BSC y el seqno de
+    # TON se leen de la red antes de cada envío), pero BEP20 y TON son wallets
+    # distintas y se procesan en paralelo
+    ton_batch = [w for w in pending if w['currency'].upper() == 'TON']
+    bep20_batch = [w for w in pending if w['currency'].upper() != 'TON']
+    
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='auto_pay') as executor:
+        futures = [executor.submit(_process_batch, batch, wallet_status)
+                   for batch in (bep20_batch, ton_batch) if batch]
+        outcomes = {}
+        for future in futures:
+            outcomes.update(future.result())
+    
     for withdrawal in pending:
+        success, message = outcomes[withdrawal['withdrawal_id']]
         results['processed'] += 1
-        success, message = process_withdrawal(withdrawal['withdrawal_id'])
         
         if success:
             results['success'] += 1
@@ -201,58 +221,139 @@ def process_all_pending():
     
     return results
 
+def _process_batch(withdrawals, wallet_status):
+    """
+    Procesa en serie los retiros de una misma wallet del sistema.
+    
+    Returns:
+        dict: { withdrawal_id: (success, message) }
+    """
+    outcomes = {}
+    for withdrawal in withdrawals:
+        can_process, reason = can_process_withdrawal(
+            withdrawal['withdrawal_id'], wallet_status=wallet_status, withdrawal=withdrawal
+        )
+        if can_process:
+            try:
+                success, message = process_withdrawal(withdrawal['withdrawal_id'], withdrawal=withdrawal)
+            except Exception as e:
+                success, message = False, f"Error inesperado: {e}"
+            if success:
+                _deduct_wallet_balance(wallet_status, withdrawal)
+        else:
+            # Se queda pendiente: sin fondos en la wallet del sistema no se intenta
+            success, message = False, f"Auto-pago no disponible: {reason}"
+        outcomes[withdrawal['withdrawal_id']] = (success, message)
+    return outcomes
+
+def _deduct_wallet_balance(wallet_status, withdrawal):
+    """Descuenta un pago enviado del estado de wallets cacheado en process_all_pending"""
+    currency = withdrawal['currency'].upper()
+    amount = _withdrawal_amount(withdrawal)
+    if currency == 'TON':
+        ton_status = wallet_status.get('ton', {})
+        ton_status['ton_balance'] = ton_status.get('ton_balance', 0) - amount
+    else:
+        bep20_status = wallet_status.get('bep20', {})
+        balance_key = f"{currency.lower()}_balance"
+        bep20_status[balance_key] = bep20_status.get(balance_key, 0) - amount
+
+def _unavailable_status():
+    return {
+        'available': False,
+        'error': 'No disponible'
+    }
+
+def check_bep20_status():
+    """Consulta el estado de la wallet BEP20 (RPC de BSC)"""
+    if not BEP20_PAYMENTS_AVAILABLE:
+        return _unavailable_status()
+    try:
+        info = get_bep20_wallet_info()
+        return {
+            'available': True,
+            'address': info.get('address'),
+            'bnb_balance': info.get('bnb_balance', 0),
+            'usdt_balance': info.get('usdt_balance', 0),
+            'doge_balance': info.get('doge_balance', 0),
+            'can_process': info.get('bnb_balance', 0) > 0.001
+        }
+    except Exception as e:
+        return {
+            'available': False,
+            'error': str(e)
+        }
+
+def check_ton_status():
+    """Consulta el estado de la wallet TON (Toncenter)"""
+    if not TON_PAYMENTS_AVAILABLE or not is_ton_configured():
+        return _unavailable_status()
+    try:
+        info = get_ton_wallet_info()
+        return {
+            'available': info.get('configured', False),
+            'address': info.get('address'),
+            'ton_balance': info.get('balance', 0),
+            'network': info.get('network', 'mainnet'),
+            'can_process': info.get('can_process', False)
+        }
+    except Exception as e:
+        return {
+            'available': False,
+            'error': str(e)
+        }
+
+_NETWORK_CHECKS = {
+    'bep20': check_bep20_status,
+    'ton': check_ton_status,
+}
+
+def _wallet_network(currency):
+    """Red de la wallet del sistema que paga una moneda"""
+    return 'ton' if currency.upper() == 'TON' else 'bep20'
+
+def _cached_network_status(network):
+    """Estado de una sola wallet con caché de _WALLET_STATUS_TTL segundos"""
+    now = time.time()
+    with _wallet_status_lock:
+        cached = _wallet_status_cache.get(network)
+        if cached and now - cached[0] < _WALLET_STATUS_TTL:
+            return cached[1]
+    
+    status = _NETWORK_CHECKS[network]()
+    with _wallet_status_lock:
+        _wallet_status_cache[network] = (now, status)
+    return status
+
 def check_wallet_status():
     """
     Verifica el estado de las wallets del sistema
     
+    Las consultas a BSC y a Toncenter son independientes (E/S de red),
+    así que se lanzan en paralelo: la latencia es la de la más lenta.
+    
     Returns:
         dict: Wallet status info
     """
     status = {
-        'bep20': {
-            'available': False,
-            'error': 'No disponible'
-        },
-        'ton': {
-            'available': False,
-            'error': 'No disponible'
-        }
+        'bep20': _unavailable_status(),
+        'ton': _unavailable_status()
     }
     
-    # Check BEP20 wallet
+    checks = {}
     if BEP20_PAYMENTS_AVAILABLE:
-        try:
-            info = get_bep20_wallet_info()
-            status['bep20'] = {
-                'available': True,
-                'address': info.get('address'),
-                'bnb_balance': info.get('bnb_balance', 0),
-                'usdt_balance': info.get('usdt_balance', 0),
-                'doge_balance': info.get('doge_balance', 0),
-                'can_process': info.get('bnb_balance', 0) > 0.001
-            }
-        except Exception as e:
-            status['bep20'] = {
-                'available': False,
-                'error': str(e)
-            }
-    
-    # Check TON wallet
+        checks['bep20'] = check_bep20_status
     if TON_PAYMENTS_AVAILABLE and is_ton_configured():
-        try:
-            info = get_ton_wallet_info()
-            status['ton'] = {
-                'available': info.get('configured', False),
-                'address': info.get('address'),
-                'ton_balance': info.get('balance', 0),
-                'network': info.get('network', 'mainnet'),
-                'can_process': info.get('can_process', False)
-            }
-        except Exception as e:
-            status['ton'] = {
-                'available': False,
-                'error': str(e)
-            }
+        checks['ton'] = check_ton_status
+    
+    if len(checks) == 1:
+        for network, check in checks.items():
+            status[network] = check()
+    elif checks:
+        with ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix='wallet_status') as executor:
+            futures = {network: executor.submit(check) for network, check in checks.items()}
+            for network, future in futures.items():
+                status[network] = future.result()
     
     return status
 
@@ -272,14 +373,19 @@ def estimate_gas_cost(currency):
         # BEP20 token transfers typically cost around 0.0005 BNB
         return 0.0005
 
-def can_process_withdrawal(withdrawal_id):
+def can_process_withdrawal(withdrawal_id, wallet_status=None, withdrawal=None):
     """
     Verifica si un retiro puede ser procesado automáticamente
     
+    Args:
+        wallet_status: resultado de check_wallet_status() ya obtenido (opcional)
+        withdrawal: fila del retiro ya leída (opcional)
+    
     Returns:
         tuple: (can_process: bool, reason: str or None)
     """
-    withdrawal = get_withdrawal(withdrawal_id)
+    if withdrawal is None:
+        withdrawal = get_withdrawal(withdrawal_id)
     if not withdrawal:
         return False, "Retiro no encontrado"
     
@@ -293,8 +399,11 @@ def can_process_withdrawal(withdrawal_id):
         if not TON_PAYMENTS_AVAILABLE or not is_ton_configured():
             return False, "Sistema de pagos TON no disponible"
         
-        status = check_wallet_status()
-        ton_status = status.get('ton', {})
+        # Solo se consulta la wallet de esta moneda
+        if wallet_status is not None:
+            ton_status = wallet_status.get('ton', {})
+        else:
+            ton_status = _cached_network_status('ton')
         
         if not ton_status.get('available'):
             return False, ton_status.get('error', 'TON wallet no disponible')
@@ -302,15 +411,17 @@ def can_process_withdrawal(withdrawal_id):
         if not ton_status.get('can_process'):
             return False, "Balance TON insuficiente"
         
-        if float(withdrawal['amount']) > ton_status.get('ton_balance', 0):
+        if _withdrawal_amount(withdrawal) > ton_status.get('ton_balance', 0):
             return False, "Balance TON insuficiente para este retiro"
     
     else:  # BEP20 (USDT/DOGE)
         if not BEP20_PAYMENTS_AVAILABLE:
             return False, "Sistema de pagos BEP20 no disponible"
         
-        status = check_wallet_status()
-        bep20_status = status.get('bep20', {})
+        if wallet_status is not None:
+            bep20_status = wallet_status.get('bep20', {})
+        else:
+            bep20_status = _cached_network_status('bep20')
         
         if not bep20_status.get('available'):
             return False, bep20_status.get('error', 'BEP20 wallet no disponible')
@@ -322,7 +433,7 @@ def can_process_withdrawal(withdrawal_id):
         balance_key = f"{currency.lower()}_balance"
         wallet_balance = bep20_status.get(balance_key, 0)
         
-        if float(withdrawal['amount']) > wallet_balance:
+        if _withdrawal_amount(withdrawal) > wallet_balance:
             return False, f"Balance insuficiente de {currency} en wallet del sistema"
     
     return True, None
@@ -353,13 +464,23 @@ def process_withdrawal_if_auto(withdrawal_id):
     if not is_auto_mode():
         return False, False, "Modo manual - pendiente de aprobación"
     
-    # Verificar si se puede procesar
-    can_process, reason = can_process_withdrawal(withdrawal_id)
+    # Verificar si se puede procesar (estado de wallets compartido entre retiros)
+    withdrawal = get_withdrawal(withdrawal_id)
+    wallet_status = {}
+    if withdrawal:
+        network = _wallet_network(withdrawal['currency'])
+        wallet_status[network] = _cached_network_status(network)
+    can_process, reason = can_process_withdrawal(
+        withdrawal_id, wallet_status=wallet_status, withdrawal=withdrawal
+    )
     if not can_process:
         return True, False, f"Auto-pago no disponible: {reason}"
     
     # Intentar procesar
-    success, message = process_withdrawal(withdrawal_id)
+    success, message = process_withdrawal(withdrawal_id, withdrawal=withdrawal)
+    if success:
+        with _wallet_status_lock:
+            _deduct_wallet_balance(wallet_status, withdrawal)
     return True, success, message
 
 def get_auto_pay_status():
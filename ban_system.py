@@ -6,11 +6,22 @@ Compatible with PythonAnywhere db.py (uses get_cursor)
 
 import json
 import logging
+import time
 from datetime import datetime
+from threading import Lock
 from db import get_cursor, execute_query
 
 logger = logging.getLogger(__name__)
 
+# Banned users seen by get_user_access, so repeated requests from them are
+# rejected without a query. Only bans are cached (a new ban is always read
+# from the DB); unbans drop the entry. Format: { user_id: (timestamp, reason) }
+_BANNED_CACHE_TTL = 60
+_BANNED_CACHE_MAX_SIZE = 10000
+
+_banned_cache = {}
+_banned_cache_lock = Lock()
+
 
 # ============================================
 # CONFIGURATION
@@ -127,6 +138,51 @@ def is_user_banned(user_id):
     return status.get('is_banned', False) if status else False
 
 
+def get_user_access(user_id):
+    """
+    Lightweight existence/ban check for hot endpoints.
+    Returns None if the user does not exist (or on error), otherwise
+    {'banned': bool, 'ban_reason': str|None}.
+    """
+    key = str(user_id)
+    now = time.monotonic()
+    cached = _banned_cache.get(key)
+    if cached and now - cached[0] < _BANNED_CACHE_TTL:
+        return {'banned': True, 'ban_reason': cached[1]}
+
+    try:
+        with get_cursor() as cursor:
+            cursor.execute(
+                "SELECT banned, ban_reason, account_state FROM users WHERE user_id = %s",
+                (key,)
+            )
+            result = cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Error checking user access: {e}")
+        return None
+
+    if not result:
+        return None
+
+    banned = bool(result.get('banned')) or result.get('account_state') == 'BANNED'
+    if banned:
+        with _banned_cache_lock:
+            if len(_banned_cache) >= _BANNED_CACHE_MAX_SIZE:
+                # Drop expired entries
+                for k in [k for k, v in _banned_cache.items() if now - v[0] >= _BANNED_CACHE_TTL]:
+                    _banned_cache.pop(k, None)
+            if len(_banned_cache) < _BANNED_CACHE_MAX_SIZE:
+                _banned_cache[key] = (now, result.get('ban_reason'))
+
+    return {'banned': banned, 'ban_reason': result.get('ban_reason')}
+
+
+def invalidate_banned_cache(user_id):
+    """Forget a cached ban (call after unbanning)"""
+    with _banned_cache_lock:
+        _banned_cache.pop(str(user_id), None)
+
+
 # ============================================
 # BAN LOGGING
 # ============================================
@@ -334,6 +390,8 @@ def unban_user_manual(user_id, reason=None, admin_id=None):
             if cursor.rowcount == 0:
                 return {'success': False, 'error': 'User not found'}
         
+        invalidate_banned_cache(user_id)
+
         # Log the event
         log_ban_event(user_id, 'unban', reason or 'Unbanned by admin', admin_id)
         
@@ -8,6 +8,7 @@ import json
 from datetime import datetime
 from decimal import Decimal
 from db import execute_query, execute_many, get_cursor
+from ban_system import invalidate_banned_cache
 
 # ============== UPDATE_USER THROTTLING SYSTEM ==============
 # In-memory cache to track when each user's profile was last updated
@@ -372,6 +373,7 @@ def unban_user(user_id):
     print(f"[unban_user] Desbaneando usuario {user_id}")
     result = update_user(user_id, banned=False, ban_reason=None)
     if result:
+        invalidate_banned_cache(user_id)
         print(f"[unban_user] ✅ Usuario {user_id} desbaneado exitosamente")
     return result
 
@@ -1070,6 +1072,27 @@ def update_withdrawal(withdrawal_id, **kwargs):
     except:
         return False
 
+def claim_withdrawal(withdrawal_id):
+    """Pasa un retiro de 'pending' a 'processing'; False si ya no estaba pendiente"""
+    try:
+        return execute_query("""
+            UPDATE withdrawals SET status = 'processing'
+            WHERE withdrawal_id = %s AND status = 'pending'
+        """, (withdrawal_id,)) == 1
+    except:
+        return False
+
+def complete_withdrawal(withdrawal_id, tx_hash):
+    """Marca un retiro como completado; processed_at lo pone MySQL (igual que created_at)"""
+    try:
+        execute_query("""
+            UPDATE withdrawals SET status = 'completed', tx_hash = %s, processed_at = NOW()
+            WHERE withdrawal_id = %s
+        """, (tx_hash, withdrawal_id))
+        return True
+    except:
+        return False
+
 # ============== PROMO CODE OPERATIONS ==============
 
 def get_all_promo_codes():
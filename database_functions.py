@@ -7,15 +7,14 @@ def get_ad_tasks():
     """Obtiene todas las tareas de anuncios activas"""
     with get_cursor() as cursor:
         cursor.execute("""
-            SELECT * FROM tasks 
+            SELECT task_id, title, description, reward, task_type,
+                   ads_required, reward_per_ad, active, created_at,
+                   1 AS is_ad_task
+            FROM tasks 
             WHERE task_type = 'ads' AND active = TRUE 
             ORDER BY created_at DESC
         """)
-        tasks = rows_to_list(cursor, cursor.fetchall())
-        for task in tasks:
-            task['active'] = bool(task.get('active', 1))
-            task['is_ad_task'] = True
-        return tasks
+        return rows_to_list(cursor, cursor.fetchall())
 
 
 def get_ad_task_progress(user_id, task_id=None):
@@ -26,13 +25,15 @@ def get_ad_task_progress(user_id, task_id=None):
     with get_cursor() as cursor:
         if task_id:
             cursor.execute("""
-                SELECT * FROM ad_task_progress 
+                SELECT task_id, ads_watched, total_earned, completed, last_ad_at 
+                FROM ad_task_progress 
                 WHERE user_id = %s AND task_id = %s
             """, (str(user_id), str(task_id)))
             return row_to_dict(cursor, cursor.fetchone())
         else:
             cursor.execute("""
-                SELECT * FROM ad_task_progress 
+                SELECT task_id, ads_watched, total_earned, completed, last_ad_at 
+                FROM ad_task_progress 
                 WHERE user_id = %s
             """, (str(user_id),))
             results = rows_to_list(cursor, cursor.fetchall())
@@ -107,8 +108,9 @@ def update_ad_task_progress(user_id, task_id, reward_per_ad):
             if len(completed) == 0:
                 process_first_task_completion(user_id)
             
-            # Marcar en completed_tasks del usuario
-            if str(task_id) not in [str(t) for t in completed]:
+            # Marcar en completed_tasks del usuario (búsqueda O(1) con un set)
+            completed_set = set(str(t) for t in completed)
+            if str(task_id) not in completed_set:
                 completed.append(str(task_id))
                 update_user(user_id, completed_tasks=completed)
         
@@ -132,8 +134,8 @@ def update_ad_task_progress(user_id, task_id, reward_per_ad):
 
 def create_ad_task(title, description, ads_required, reward_per_ad, active=True):
     """Crea una nueva tarea de anuncios"""
-    import uuid
-    task_id = f"adtask_{uuid.uuid4().hex[:8]}"
+    import secrets
+    task_id = f"adtask_{secrets.token_urlsafe(6)}"
     total_reward = float(ads_required) * float(reward_per_ad)
     
     try:
@@ -170,9 +172,7 @@ def check_ad_cooldown(user_id, task_id, cooldown_seconds=30):
         if not last_ad:
             return True, 0
         
-        if isinstance(last_ad, str):
-            last_ad = datetime.strptime(last_ad, '%Y-%m-%d %H:%M:%S')
-        
+        # El driver ya devuelve DATETIME como datetime (no se usa raw=True)
         elapsed = (datetime.now() - last_ad).total_seconds()
         
         if elapsed >= cooldown_seconds:
@@ -185,6 +185,7 @@ def get_user_ad_stats(user_id):
     """Obtiene las estadísticas de anuncios de un usuario"""
     with get_cursor() as cursor:
         cursor.execute("""
-            SELECT * FROM user_ad_stats WHERE user_id = %s
+            SELECT user_id, ads_watched_today, total_ads_watched, total_earnings, last_ad_date
+            FROM user_ad_stats WHERE user_id = %s
         """, (str(user_id),))
         return row_to_dict(cursor, cursor.fetchone())
@@ -3,8 +3,11 @@
 Configured for Railway MySQL using the MYSQL_URL environment variable.
 """
 
+import atexit
 import os
 import logging
+import queue
+import threading
 import time
 from contextlib import contextmanager
 from threading import Lock
@@ -12,6 +15,7 @@ from urllib.parse import urlparse
 
 import mysql.connector
 from mysql.connector import pooling, Error as MySQLError
+from mysql.connector.errors import PoolError
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -50,10 +54,15 @@ DB_CONFIG = {
 }
 
 # Pool settings
-POOL_SIZE = 10          # Aumentado de 3 a 10 para soportar mas conexiones simultaneas
+# Tamaño configurable con DB_POOL_SIZE (ver pool_sizing.py, junto con los
+# threads de gunicorn que dependen de él)
+from pool_sizing import POOL_SIZE
 POOL_NAME = 'arcadepxc_pool'
 MAX_RETRIES = 3
 RETRY_DELAY = 0.3       # Reducido para recuperarse mas rapido
+POOL_WAIT_WARN_SECONDS = float(os.getenv('DB_POOL_WAIT_WARN', '0.5'))  # avisar si obtener conexión tarda más
+# Conexiones directas extra permitidas cuando el pool está agotado (se cierran al liberarlas)
+POOL_MAX_OVERFLOW = max(int(os.getenv('DB_POOL_OVERFLOW', '5')), 0)
 
 
 def _get_friendly_error_message(error):
@@ -113,6 +122,9 @@ class DatabasePool:
     _pool = None
     _initialized = False
     _pool_failed = False
+    _overflow_lock = Lock()
+    _overflow_count = 0
+    _overflow_ids = set()
 
     def __new__(cls):
         if cls._instance is None:
@@ -169,6 +181,28 @@ class DatabasePool:
             self._pool = None
             self._pool_failed = True
 
+    def _open_overflow_connection(self):
+        """
+        Open a temporary direct connection when the pool is exhausted.
+        Returns None when POOL_MAX_OVERFLOW connections are already open.
+        """
+        with self._overflow_lock:
+            if DatabasePool._overflow_count >= POOL_MAX_OVERFLOW:
+                return None
+            DatabasePool._overflow_count += 1
+
+        try:
+            conn = _create_direct_connection()
+        except Exception:
+            with self._overflow_lock:
+                DatabasePool._overflow_count -= 1
+            raise
+
+        with self._overflow_lock:
+            self._overflow_ids.add(id(conn))
+        logger.warning(f"⚠️ Pool exhausted, using overflow connection ({DatabasePool._overflow_count}/{POOL_MAX_OVERFLOW})")
+        return conn
+
     def get_connection(self):
         """Get a connection from the pool with retry logic and fallback"""
         last_error = None
@@ -176,15 +210,27 @@ class DatabasePool:
         if not _mysql_password:
             raise MySQLError("Cannot connect: MYSQL_URL is not set or has no password. Please configure it in your Railway environment variables.")
 
+        started = time.monotonic()
+
         for attempt in range(MAX_RETRIES):
             try:
                 if self._pool is not None:
-                    conn = self._pool.get_connection()
+                    try:
+                        conn = self._pool.get_connection()
+                    except PoolError:
+                        # Pool agotado: conexión extra temporal en vez de esperar y reintentar
+                        conn = self._open_overflow_connection()
+                        if conn is None:
+                            raise
+                        return conn
 
                     try:
-                        if not conn.is_connected():
-                            conn.reconnect(attempts=2, delay=0.2)
+                        # ping(reconnect=True) ya reconecta si hace falta; is_connected()
+                        # hacía otro ping, así que era un round-trip extra por consulta
                         conn.ping(reconnect=True, attempts=2, delay=0.2)
+                        waited = time.monotonic() - started
+                        if waited > POOL_WAIT_WARN_SECONDS:
+                            logger.warning(f"⚠️ Pool wait {waited:.2f}s (size: {POOL_SIZE}, attempts: {attempt + 1})")
                         return conn
                     except Exception:
                         try:
@@ -232,8 +278,12 @@ class DatabasePool:
             raise MySQLError("❌ Failed to establish database connection after all retries")
 
     def release_connection(self, conn):
-        """Release a connection back to the pool"""
+        """Release a connection back to the pool (overflow connections are closed)"""
         if conn:
+            with self._overflow_lock:
+                if id(conn) in self._overflow_ids:
+                    self._overflow_ids.discard(id(conn))
+                    DatabasePool._overflow_count -= 1
             try:
                 conn.close()
             except Exception:
@@ -289,11 +339,14 @@ def get_db_connection():
 
 
 @contextmanager
-def get_cursor(dictionary=True, buffered=True):
+def get_cursor(dictionary=True, buffered=True, transaction=False):
     """
     Context manager for database cursor.
     Automatically handles connection and cursor lifecycle.
 
+    With transaction=True every statement runs inside one explicit
+    transaction that is committed once on exit (or rolled back on error).
+
     Usage:
         with get_cursor() as cursor:
             cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
@@ -302,6 +355,8 @@ def get_cursor(dictionary=True, buffered=True):
     with get_db_connection() as conn:
         cursor = None
         try:
+            if transaction:
+                conn.start_transaction()
             cursor = conn.cursor(dictionary=dictionary, buffered=buffered)
             yield cursor
             conn.commit()
@@ -310,6 +365,10 @@ def get_cursor(dictionary=True, buffered=True):
             friendly_msg = _get_friendly_error_message(e)
             logger.error(f"Cursor error: {friendly_msg}")
             raise
+        except Exception:
+            if transaction:
+                conn.rollback()
+            raise
         finally:
             if cursor:
                 cursor.close()
@@ -350,6 +409,114 @@ def execute_many(query, params_list):
         return cursor.rowcount
 
 
+class BatchWriter:
+    """
+    Background writer for audit/log rows that don't need to block a request.
+    Rows are queued in memory and flushed with executemany() from a daemon
+    thread, every `flush_interval` seconds or every `batch_size` rows.
+
+    If `merge` is given, each batch is passed through it before the write
+    (e.g. to sum counter deltas that hit the same row).
+
+    Queued rows are written on shutdown by close(), which close_batch_writers()
+    calls for every writer (atexit and gunicorn's worker_exit hook).
+
+    Usage:
+        _log_writer = BatchWriter("INSERT INTO logs (a, b) VALUES (%s, %s)", name="logs")
+        _log_writer.put((a, b))
+    """
+
+    _STOP = object()
+    _instances = []
+
+    def __init__(self, query, name, batch_size=100, flush_interval=0.5, maxsize=10000, merge=None):
+        self.query = query
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.merge = merge
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = Lock()
+        BatchWriter._instances.append(self)
+
+    def put(self, params):
+        """Queue a row; drops it (with a warning) if the queue is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(params)
+            return True
+        except queue.Full:
+            logger.warning(f"⚠️ BatchWriter {self.name}: queue full, row dropped")
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"batch-writer-{self.name}",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def close(self, timeout=5.0):
+        """Write every queued row and stop the thread (waits up to `timeout` seconds)"""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            try:
+                # The thread writes everything queued before the marker, then exits
+                self._queue.put(self._STOP, timeout=timeout)
+            except queue.Full:
+                logger.warning(f"⚠️ BatchWriter {self.name}: queue full on close")
+                return
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"⚠️ BatchWriter {self.name}: {self._queue.qsize()} rows not written on close")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            if items[0] is self._STOP:
+                return
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                items.append(item)
+            self._write(items)
+
+    def _write(self, items):
+        try:
+            if self.merge is not None:
+                items = self.merge(items)
+            execute_many(self.query, items)
+        except Exception as e:
+            logger.error(f"❌ BatchWriter {self.name}: failed to write {len(items)} rows: {e}")
+
+
+def close_batch_writers():
+    """Flush and stop every BatchWriter (called on worker/process exit)"""
+    for writer in list(BatchWriter._instances):
+        writer.close()
+
+
+atexit.register(close_batch_writers)
+
+
 def test_connection():
     """Test database connectivity"""
     try:
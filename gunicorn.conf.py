@@ -13,6 +13,8 @@ Resultado: ~4-8x más rápido que Flask dev server en producción.
 import os
 import multiprocessing
 
+from pool_sizing import GUNICORN_THREADS
+
 # ── Binding ──────────────────────────────────────────────────
 port    = int(os.environ.get("PORT", 5000))
 bind    = f"0.0.0.0:{port}"
@@ -21,7 +23,8 @@ bind    = f"0.0.0.0:{port}"
 # 1 solo worker para que el bot de Telegram no se duplique
 workers     = 1
 worker_class = "gthread"   # threads reales (requiere gunicorn[gthread] o solo gunicorn>=20)
-threads      = 8            # 8 threads concurrentes → 8 requests en paralelo
+# Threads ligados al pool MySQL, descontando los hilos en segundo plano (pool_sizing.py)
+threads      = GUNICORN_THREADS
 
 # ── Timeouts ─────────────────────────────────────────────────
 timeout          = 60    # matar worker si no responde en 60s
@@ -38,3 +41,11 @@ access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(D)sμs'
 preload_app   = True    # cargar la app UNA sola vez antes de hacer fork → más rápido
 max_requests  = 1000    # reiniciar worker cada 1000 requests (evita memory leaks)
 max_requests_jitter = 100
+
+
+# ── Hooks ────────────────────────────────────────────────────
+def worker_exit(server, worker):
+    # max_requests recicla el worker: escribir las filas que los BatchWriter
+    # aún tienen en cola (ad_tokens, ad_daily_stats, historiales...)
+    from db import close_batch_writers
+    close_batch_writers()
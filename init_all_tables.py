@@ -50,6 +50,7 @@ ALL_TABLES = [
         last_ip VARCHAR(50) DEFAULT NULL,
         is_admin TINYINT(1) DEFAULT 0,
         completed_tasks JSON DEFAULT NULL,
+        ad_tasks_started SMALLINT UNSIGNED DEFAULT 0,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
         last_interaction DATETIME DEFAULT NULL,
@@ -95,7 +96,8 @@ ALL_TABLES = [
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
         INDEX idx_task_id (task_id),
-        INDEX idx_active (active)
+        INDEX idx_active (active),
+        INDEX idx_type_active_created (task_type, active, created_at)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
 
@@ -115,7 +117,7 @@ ALL_TABLES = [
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         processed_at DATETIME DEFAULT NULL,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-        INDEX idx_user_id (user_id),
+        INDEX idx_user_currency_created (user_id, currency, created_at),
         INDEX idx_status (status)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
@@ -210,7 +212,7 @@ ALL_TABLES = [
         balance_after DECIMAL(20,8) DEFAULT 0.00000000,
         description TEXT DEFAULT NULL,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        INDEX idx_user_id (user_id)
+        INDEX idx_user_currency_created (user_id, currency, created_at)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
 
@@ -463,7 +465,7 @@ ALL_TABLES = [
         activated_at DATETIME NOT NULL,
         expires_at DATETIME NOT NULL,
         source VARCHAR(50) DEFAULT 'adsgram',
-        INDEX idx_user_expires (user_id, expires_at),
+        INDEX idx_user_exp_mult (user_id, expires_at, multiplier),
         INDEX idx_expires (expires_at)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
@@ -475,7 +477,8 @@ ALL_TABLES = [
         user_id VARCHAR(50) NOT NULL,
         activated_at DATETIME NOT NULL,
         boost_date DATE NOT NULL,
-        INDEX idx_user_date (user_id, boost_date)
+        INDEX idx_user_date (user_id, boost_date),
+        INDEX idx_user_activated (user_id, activated_at)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
 
@@ -621,7 +624,7 @@ ALL_TABLES = [
     """
     CREATE TABLE IF NOT EXISTS ad_task_progress (
         id INT AUTO_INCREMENT PRIMARY KEY,
-        user_id VARCHAR(50) NOT NULL,
+        user_id BIGINT UNSIGNED NOT NULL,
         task_id VARCHAR(50) NOT NULL,
         ads_watched INT DEFAULT 0,
         total_earned DECIMAL(10,4) DEFAULT 0.0000,
@@ -629,9 +632,7 @@ ALL_TABLES = [
         last_ad_at DATETIME DEFAULT NULL,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-        UNIQUE KEY unique_user_task (user_id, task_id),
-        INDEX idx_user_id (user_id),
-        INDEX idx_task_id (task_id)
+        UNIQUE KEY unique_user_task (user_id, task_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
 
@@ -652,7 +653,7 @@ ALL_TABLES = [
     """
     CREATE TABLE IF NOT EXISTS user_ad_stats (
         id INT AUTO_INCREMENT PRIMARY KEY,
-        user_id VARCHAR(50) NOT NULL UNIQUE,
+        user_id BIGINT UNSIGNED NOT NULL UNIQUE,
         ads_watched_today INT DEFAULT 0,
         total_ads_watched INT DEFAULT 0,
         total_earnings DECIMAL(20,8) DEFAULT 0.00000000,
@@ -665,7 +666,7 @@ ALL_TABLES = [
     """
     CREATE TABLE IF NOT EXISTS ad_completions (
         id INT AUTO_INCREMENT PRIMARY KEY,
-        user_id VARCHAR(50) NOT NULL,
+        user_id BIGINT UNSIGNED NOT NULL,
         task_id VARCHAR(50) DEFAULT NULL,
         ad_type VARCHAR(50) DEFAULT 'task_center',
         reward DECIMAL(10,4) NOT NULL,
@@ -680,7 +681,7 @@ ALL_TABLES = [
     CREATE TABLE IF NOT EXISTS ad_tokens (
         id INT AUTO_INCREMENT PRIMARY KEY,
         token VARCHAR(64) NOT NULL UNIQUE,
-        user_id VARCHAR(50) NOT NULL,
+        user_id BIGINT UNSIGNED NOT NULL,
         ad_type VARCHAR(20) DEFAULT 'rewarded',
         ad_block_uuid VARCHAR(100) DEFAULT NULL,
         status ENUM('pending','completed','claimed','expired') DEFAULT 'pending',
@@ -689,12 +690,11 @@ ALL_TABLES = [
         claimed_at DATETIME DEFAULT NULL,
         expires_at DATETIME NOT NULL,
         ip_address VARCHAR(50) DEFAULT NULL,
-        user_agent TEXT DEFAULT NULL,
+        user_agent VARCHAR(16) DEFAULT NULL,
         telega_response TEXT DEFAULT NULL,
-        INDEX idx_token (token),
-        INDEX idx_user_id (user_id),
         INDEX idx_status (status),
-        INDEX idx_expires_at (expires_at)
+        INDEX idx_expires_at (expires_at),
+        INDEX idx_user_status (user_id, status)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
 
@@ -702,7 +702,7 @@ ALL_TABLES = [
     """
     CREATE TABLE IF NOT EXISTS ad_daily_stats (
         id INT AUTO_INCREMENT PRIMARY KEY,
-        user_id VARCHAR(50) NOT NULL,
+        user_id BIGINT UNSIGNED NOT NULL,
         stat_date DATE NOT NULL,
         ads_requested INT DEFAULT 0,
         ads_completed INT DEFAULT 0,
@@ -712,7 +712,6 @@ ALL_TABLES = [
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
         UNIQUE KEY unique_user_date (user_id, stat_date),
-        INDEX idx_user_id (user_id),
         INDEX idx_stat_date (stat_date)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
@@ -868,7 +867,6 @@ ALL_TABLES = [
         token_created_at DATETIME NULL,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-        INDEX idx_user_id (user_id),
         INDEX idx_progress_date (progress_date)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
@@ -887,7 +885,7 @@ ALL_TABLES = [
         started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         completed_at DATETIME NULL,
         INDEX idx_user_id (user_id),
-        INDEX idx_session_token (session_token),
+        UNIQUE KEY uniq_session_token (session_token),
         INDEX idx_status (status)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
     """,
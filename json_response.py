@@ -0,0 +1,29 @@
+"""
+json_response.py - Respuestas JSON para las rutas de alta frecuencia
+Usa orjson si está instalado (bastante más rápido que el jsonify de Flask)
+y vuelve a jsonify si no lo está.
+"""
+
+from decimal import Decimal
+
+from flask import current_app, jsonify
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_default(obj):
+    # Los importes llegan de MySQL como Decimal, que orjson no serializa solo
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def fast_jsonify(obj):
+    """Equivalente a jsonify(obj) para un dict/list, serializado con orjson si está disponible"""
+    if orjson is None:
+        return jsonify(obj)
+    return current_app.response_class(orjson.dumps(obj, default=_orjson_default),
+                                      mimetype='application/json')
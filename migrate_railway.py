@@ -54,6 +54,44 @@ def table_exists(table: str) -> bool:
         return False
 
 
+def column_type(table: str, column: str) -> str:
+    try:
+        with get_cursor() as cursor:
+            cursor.execute("""
+                SELECT DATA_TYPE as data_type
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME   = %s
+                  AND COLUMN_NAME  = %s
+            """, (table, column))
+            row = cursor.fetchone()
+            if not row:
+                return ''
+            value = row.get('data_type', '') if isinstance(row, dict) else row[0]
+            return str(value).lower()
+    except Exception as e:
+        logger.error(f"Error verificando tipo de {table}.{column}: {e}")
+        return ''
+
+
+def index_exists(table: str, index: str) -> bool:
+    try:
+        with get_cursor() as cursor:
+            cursor.execute("""
+                SELECT COUNT(*) as cnt
+                FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME   = %s
+                  AND INDEX_NAME   = %s
+            """, (table, index))
+            row = cursor.fetchone()
+            cnt = row.get('cnt', 0) if isinstance(row, dict) else row[0]
+            return int(cnt) > 0
+    except Exception as e:
+        logger.error(f"Error verificando indice {table}.{index}: {e}")
+        return False
+
+
 def safe_alter(description: str, sql: str):
     try:
         execute_query(sql)
@@ -79,6 +117,25 @@ def ensure_columns(table: str, cols: dict):
             logger.info(f"  -- {table}.{col} ya existe")
 
 
+def ensure_indexes(table: str, indexes: dict):
+    if not table_exists(table):
+        logger.info(f"  SKIP Tabla {table} no existe aun")
+        return
+    for index, sql in indexes.items():
+        if not index_exists(table, index):
+            safe_alter(f"{table}.{index}", sql)
+        else:
+            logger.info(f"  -- {table}.{index} ya existe")
+
+
+def drop_indexes(table: str, indexes: list):
+    if not table_exists(table):
+        return
+    for index in indexes:
+        if index_exists(table, index):
+            safe_alter(f"{table}: DROP {index}", f"ALTER TABLE `{table}` DROP INDEX `{index}`")
+
+
 # ─────────────────────────────────────────────────────────────
 # MIGRACIÓN: activa → active
 # ─────────────────────────────────────────────────────────────
@@ -365,11 +422,203 @@ def migrate_user_tasks():
     })
 
 
+# ─────────────────────────────────────────────────────────────
+# MIGRACIÓN: índices de tareas de anuncios
+# ─────────────────────────────────────────────────────────────
+
+def migrate_ad_indexes():
+    logger.info("\n[14] indices de tareas de anuncios")
+    # get_ad_tasks: WHERE task_type = 'ads' AND active = 1 ORDER BY created_at DESC
+    ensure_indexes('tasks', {
+        'idx_type_active_created': "ALTER TABLE tasks ADD INDEX idx_type_active_created (task_type, active, created_at)",
+    })
+    # unique_user_task (user_id, task_id) ya cubre todas las consultas
+    drop_indexes('ad_task_progress', ['idx_user_id', 'idx_task_id'])
+    # Flujo de reclamo de tokens: WHERE user_id = %s AND status = %s
+    ensure_indexes('ad_tokens', {
+        'idx_user_status': "ALTER TABLE ad_tokens ADD INDEX idx_user_status (user_id, status)",
+    })
+    # idx_token duplica el UNIQUE de token; idx_user_id es prefijo de idx_user_status
+    if index_exists('ad_tokens', 'token'):
+        drop_indexes('ad_tokens', ['idx_token'])
+    if index_exists('ad_tokens', 'idx_user_status'):
+        drop_indexes('ad_tokens', ['idx_user_id'])
+    # unique_user_date (user_id, stat_date) ya cubre las búsquedas por user_id
+    if index_exists('ad_daily_stats', 'unique_user_date'):
+        drop_indexes('ad_daily_stats', ['idx_user_id'])
+
+
+# ─────────────────────────────────────────────────────────────
+# MIGRACIÓN: contador de tareas de anuncios iniciadas
+# ─────────────────────────────────────────────────────────────
+
+def migrate_ad_tasks_started():
+    logger.info("\n[15] users.ad_tasks_started")
+    ensure_columns('users', {
+        'ad_tasks_started': "ALTER TABLE users ADD COLUMN ad_tasks_started SMALLINT UNSIGNED DEFAULT 0",
+    })
+    if table_exists('ad_task_progress'):
+        # Rellenar con el progreso existente para que /tasks no oculte tareas iniciadas
+        safe_alter("backfill ad_tasks_started", """
+            UPDATE users u
+            JOIN (
+                SELECT user_id, COUNT(*) AS started
+                FROM ad_task_progress GROUP BY user_id
+            ) p ON p.user_id = u.user_id
+            SET u.ad_tasks_started = p.started
+        """)
+
+
+# ─────────────────────────────────────────────────────────────
+# MIGRACIÓN: user_id BIGINT en tablas de anuncios
+# ─────────────────────────────────────────────────────────────
+
+# Los user_id de Telegram caben en BIGINT: claves de 8 bytes en lugar de
+# VARCHAR(50) → índices más pequeños y comparaciones enteras.
+AD_USER_ID_COLUMNS = {
+    'ad_task_progress': "BIGINT UNSIGNED NOT NULL",
+    'user_ad_stats':    "BIGINT UNSIGNED NOT NULL",
+    'ad_completions':   "BIGINT UNSIGNED NOT NULL",
+    'ad_tokens':        "BIGINT UNSIGNED NOT NULL",
+    'ad_daily_stats':   "BIGINT UNSIGNED NOT NULL",
+    # telega_callbacks se deja en VARCHAR: guarda el user_id tal cual llega
+    # en callbacks externos (también los inválidos) para auditoría.
+}
+
+
+def migrate_ad_user_id_bigint():
+    logger.info("\n[16] user_id BIGINT en tablas de anuncios")
+    for table, definition in AD_USER_ID_COLUMNS.items():
+        if not table_exists(table):
+            continue
+        if column_type(table, 'user_id') in ('', 'bigint'):
+            continue
+        # No convertir si hay user_id no numéricos (el ALTER fallaría o los truncaría)
+        try:
+            with get_cursor() as cursor:
+                cursor.execute(
+                    f"SELECT COUNT(*) as cnt FROM {table} WHERE user_id NOT REGEXP '^[0-9]+$'"
+                )
+                row = cursor.fetchone()
+                bad = row.get('cnt', 0) if isinstance(row, dict) else row[0]
+        except Exception as e:
+            logger.error(f"  ERROR revisando {table}.user_id: {e}")
+            continue
+        if int(bad or 0) > 0:
+            logger.warning(f"  -- {table}.user_id: {bad} valores no numéricos, se mantiene VARCHAR")
+            continue
+        safe_alter(f"{table}.user_id BIGINT",
+                   f"ALTER TABLE {table} MODIFY user_id {definition}")
+
+
+# ─────────────────────────────────────────────────────────────
+# MIGRACIÓN: índices de Adexium
+# ─────────────────────────────────────────────────────────────
+
+def migrate_adexium_indexes():
+    logger.info("\n[17] indices de Adexium")
+    # adexium_start hace INSERT ... ON DUPLICATE KEY UPDATE sobre el UNIQUE
+    # de user_id; idx_user_id lo duplica y solo encarece cada escritura
+    if index_exists('adexium_progress', 'user_id'):
+        drop_indexes('adexium_progress', ['idx_user_id'])
+
+
+def migrate_adexium_history_unique():
+    logger.info("\n[20] adexium_history: UNIQUE session_token")
+    if not table_exists('adexium_history'):
+        logger.info("  SKIP Tabla adexium_history no existe aun")
+        return
+    # El historial se escribe con upserts por session_token (una fila por sesión):
+    # antes de crear el UNIQUE se conserva solo la fila más reciente de cada token
+    if not index_exists('adexium_history', 'uniq_session_token'):
+        try:
+            with get_cursor() as cursor:
+                cursor.execute("""
+                    DELETE h FROM adexium_history h
+                    JOIN adexium_history newer
+                      ON newer.session_token = h.session_token AND newer.id > h.id
+                """)
+                removed = cursor.rowcount
+            if removed:
+                logger.info(f"  OK adexium_history: {removed} filas duplicadas eliminadas")
+        except Exception as e:
+            logger.error(f"  ERROR deduplicando adexium_history.session_token: {e}")
+            return
+        safe_alter("adexium_history.uniq_session_token",
+                   "ALTER TABLE adexium_history ADD UNIQUE KEY uniq_session_token (session_token)")
+    if index_exists('adexium_history', 'uniq_session_token'):
+        drop_indexes('adexium_history', ['idx_session_token'])
+
+
+# ─────────────────────────────────────────────────────────────
+# MIGRACIÓN: índices de boosts de minería
+# ─────────────────────────────────────────────────────────────
+
+def migrate_boost_indexes():
+    logger.info("\n[18] indices de boosts de minería")
+    # Boost activo: WHERE user_id = %s AND expires_at > NOW() ORDER BY expires_at DESC
+    # → multiplier en el índice para resolverlo sin leer la fila
+    ensure_indexes('mining_boosts', {
+        'idx_user_exp_mult': "ALTER TABLE mining_boosts ADD INDEX idx_user_exp_mult (user_id, expires_at, multiplier)",
+    })
+    if index_exists('mining_boosts', 'idx_user_exp_mult'):
+        drop_indexes('mining_boosts', ['idx_user_expires'])
+    # Último boost: MAX(activated_at) WHERE user_id = %s
+    ensure_indexes('adsgram_boost_history', {
+        'idx_user_activated': "ALTER TABLE adsgram_boost_history ADD INDEX idx_user_activated (user_id, activated_at)",
+    })
+
+
+# ─────────────────────────────────────────────────────────────
+# MIGRACIÓN: evento de limpieza de boosts
+# ─────────────────────────────────────────────────────────────
+
+def migrate_boost_cleanup_event():
+    logger.info("\n[19] evento de limpieza de boosts")
+    if not table_exists('mining_boosts'):
+        logger.info("  SKIP Tabla mining_boosts no existe aun")
+        return
+    # Borrado en el propio servidor cada 5 min; el LIMIT evita bloqueos largos
+    safe_alter("EVENT ev_cleanup_boosts", """
+        CREATE EVENT IF NOT EXISTS ev_cleanup_boosts
+        ON SCHEDULE EVERY 5 MINUTE
+        DO DELETE FROM mining_boosts WHERE expires_at < NOW() LIMIT 5000
+    """)
+    try:
+        with get_cursor() as cursor:
+            cursor.execute("SELECT @@event_scheduler AS scheduler")
+            row = cursor.fetchone()
+            scheduler = row.get('scheduler') if isinstance(row, dict) else row[0]
+        if str(scheduler).upper() not in ('ON', '1'):
+            logger.warning("  -- event_scheduler desactivado: ev_cleanup_boosts no se ejecutará "
+                           "(queda cleanup_expired_boosts() como respaldo)")
+    except Exception as e:
+        logger.error(f"  ERROR revisando event_scheduler: {e}")
+
+
+# ─────────────────────────────────────────────────────────────
+# MIGRACIÓN: índices del historial de transacciones
+# ─────────────────────────────────────────────────────────────
+
+def migrate_transaction_indexes():
+    logger.info("\n[21] indices del historial de transacciones")
+    # get_user_unified_transactions:
+    #   WHERE user_id = %s [AND currency = %s] ORDER BY created_at DESC LIMIT n
+    # → el índice resuelve filtro y orden sin filesort
+    for table in ('balance_history', 'withdrawals'):
+        ensure_indexes(table, {
+            'idx_user_currency_created': f"ALTER TABLE {table} ADD INDEX idx_user_currency_created (user_id, currency, created_at)",
+        })
+        # idx_user_id es prefijo del índice compuesto
+        if index_exists(table, 'idx_user_currency_created'):
+            drop_indexes(table, ['idx_user_id'])
+
+
 # ─────────────────────────────────────────────────────────────
 # FUNCIÓN PRINCIPAL
 # ─────────────────────────────────────────────────────────────
 
-MIGRATION_VERSION = 14  # Incrementar cuando se agreguen nuevas migraciones
+MIGRATION_VERSION = 23  # Incrementar cuando se agreguen nuevas migraciones
 
 
 def _get_migration_version() -> int:
@@ -433,6 +682,14 @@ def run_migrations():
     migrate_user_ips()
     migrate_user_device_history()
     migrate_user_tasks()
+    migrate_ad_indexes()
+    migrate_ad_tasks_started()
+    migrate_ad_user_id_bigint()
+    migrate_adexium_indexes()
+    migrate_boost_indexes()
+    migrate_boost_cleanup_event()
+    migrate_adexium_history_unique()
+    migrate_transaction_indexes()
 
     _set_migration_version(MIGRATION_VERSION)
 
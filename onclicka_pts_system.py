@@ -4,6 +4,7 @@ VERSIÓN CORREGIDA - Collation utf8mb4_unicode_ci
 """
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 
@@ -229,6 +230,25 @@ def add_pts(user_id, amount, action, description=""):
         return False, "Error"
 
 
+# PTS en segundo plano: las rutas de recompensa no esperan a las consultas
+# de add_pts (son puntos de ranking, no saldo, y pueden fallar sin afectarla)
+_pts_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pts")
+
+
+def _add_pts_logged(user_id, amount, action, description):
+    try:
+        success, message = add_pts(user_id, amount, action, description)
+        if not success:
+            logger.warning(f"[PTS] No se agregaron PTS a {user_id} ({action}): {message}")
+    except Exception as e:
+        logger.error(f"[PTS] Error agregando PTS en segundo plano: {e}")
+
+
+def add_pts_async(user_id, amount, action, description=""):
+    """Encola add_pts en segundo plano sin bloquear la petición"""
+    _pts_executor.submit(_add_pts_logged, user_id, amount, action, description)
+
+
 def update_ranking_pts(user_id, amount):
     from db import get_cursor
     try:
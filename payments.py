@@ -62,8 +62,16 @@ def get_web3():
     global _web3
     if _web3 is None:
         try:
+            import requests
+            from requests.adapters import HTTPAdapter
             from web3 import Web3
-            _web3 = Web3(Web3.HTTPProvider(BSC_RPC))
+            # Sesión keep-alive propia: los pagos y consultas de saldo reutilizan
+            # la conexión TLS con el RPC en lugar de abrir una por llamada
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _web3 = Web3(Web3.HTTPProvider(BSC_RPC, session=session))
             if not _web3.is_connected():
                 raise Exception("Could not connect to BSC")
         except ImportError:
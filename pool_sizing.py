@@ -0,0 +1,49 @@
+"""
+pool_sizing.py - Tamaño del pool MySQL y número de threads de gunicorn
+Sin dependencias (solo os/logging) para que gunicorn.conf.py pueda leerlo
+en el master sin cargar db.py (load_dotenv, logging.basicConfig, driver).
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Máximo del pool de mysql-connector (pooling.CNX_POOL_MAXSIZE)
+_CNX_POOL_MAXSIZE = 32
+
+# Tamaño configurable con DB_POOL_SIZE
+POOL_SIZE = min(max(int(os.getenv('DB_POOL_SIZE', '25')), 1), _CNX_POOL_MAXSIZE)
+
+# Conexiones reservadas para los hilos en segundo plano que usan el mismo pool:
+# bot de Telegram (1), BatchWriter (5: ad_completions, adexium_history,
+# ad_daily_stats, ad_tokens, telega_callbacks), _pts_executor (2) y auto-pay (2).
+# Con pools pequeños la reserva se limita a la mitad del pool: esos hilos
+# escriben por lotes y rara vez ocupan su conexión a la vez.
+_BACKGROUND_RESERVE_WANTED = max(int(os.getenv('DB_POOL_BACKGROUND_RESERVE', '10')), 0)
+POOL_BACKGROUND_RESERVE = min(_BACKGROUND_RESERVE_WANTED, POOL_SIZE // 2)
+
+# Threads de gunicorn: cada uno que espera a MySQL ocupa una conexión, así que
+# más threads que conexiones libres solo harían cola en get_connection()
+_MIN_THREADS = 4
+_MAX_THREADS = 16
+
+
+def _gunicorn_threads():
+    configured = os.getenv('GUNICORN_THREADS')
+    if configured:
+        return max(int(configured), 1)
+    if POOL_BACKGROUND_RESERVE < _BACKGROUND_RESERVE_WANTED:
+        logger.warning(
+            "DB_POOL_SIZE=%s: reserva para hilos en segundo plano reducida de %s a %s",
+            POOL_SIZE, _BACKGROUND_RESERVE_WANTED, POOL_BACKGROUND_RESERVE)
+    threads = min(_MAX_THREADS, POOL_SIZE - POOL_BACKGROUND_RESERVE)
+    if threads < _MIN_THREADS:
+        logger.warning(
+            "DB_POOL_SIZE=%s deja %s conexiones libres; se usan %s threads de gunicorn "
+            "(algunas peticiones esperarán conexión)", POOL_SIZE, threads, _MIN_THREADS)
+        threads = _MIN_THREADS
+    return threads
+
+
+GUNICORN_THREADS = _gunicorn_threads()
@@ -0,0 +1,71 @@
+"""
+rate_limit.py - Límites de uso para las rutas de verificación de tareas
+Token buckets en memoria (la app corre en un único worker de gunicorn):
+- Por usuario y ruta en /api/task/verify y /api/task/complete
+- Global para las llamadas a getChatMember de la API de Telegram
+"""
+
+import time
+from threading import Lock
+
+
+class TokenBucket:
+    """Token bucket simple y thread-safe (rate tokens/s, ráfaga de capacity)"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def try_acquire(self):
+        """Consume un token; devuelve 0 si había, o los segundos hasta el próximo"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+# Límite global de llamadas a getChatMember, por debajo de los ~30 req/s que
+# Telegram permite al bot: una ráfaga espera un poco en vez de provocar un
+# flood wait que afectaría a todos los usuarios
+_telegram_bucket = TokenBucket(rate=25, capacity=25)
+_TELEGRAM_BUCKET_MAX_WAIT = 1.0
+
+# Límite por usuario y ruta de /api/task/verify y /api/task/complete (10 por
+# minuto, en ráfaga de 10): un cliente insistente no puede agotar el cupo del
+# bot, y completar varias tareas seguidas sigue siendo posible
+_USER_VERIFY_RATE = 10 / 60
+_USER_VERIFY_BURST = 10
+_USER_BUCKETS_MAX_SIZE = 10000
+
+_user_buckets = {}
+_user_buckets_lock = Lock()
+
+
+def check_verify_rate_limit(user_id, endpoint):
+    """Devuelve 0 si el usuario puede usar la ruta, o los segundos que debe esperar"""
+    key = (endpoint, str(user_id))
+    bucket = _user_buckets.get(key)
+    if bucket is None:
+        with _user_buckets_lock:
+            if len(_user_buckets) >= _USER_BUCKETS_MAX_SIZE:
+                # Un bucket lleno equivale a no tener bucket: se puede descartar
+                now = time.monotonic()
+                full_after = _USER_VERIFY_BURST / _USER_VERIFY_RATE
+                for k in [k for k, b in _user_buckets.items() if now - b._updated >= full_after]:
+                    _user_buckets.pop(k, None)
+            bucket = _user_buckets.setdefault(key, TokenBucket(_USER_VERIFY_RATE, _USER_VERIFY_BURST))
+    return bucket.try_acquire()
+
+
+def wait_for_telegram_slot():
+    """Reserva una llamada a getChatMember del cupo global (espera como mucho 1s)"""
+    wait = _telegram_bucket.try_acquire()
+    if wait:
+        time.sleep(min(wait, _TELEGRAM_BUCKET_MAX_WAIT))
@@ -86,12 +86,19 @@ def run_gunicorn():
         from web import app as flask_app
 
         port = int(os.environ.get("PORT", 5000))
+        # Threads ligados al tamaño del pool MySQL (ver pool_sizing.py)
+        from pool_sizing import GUNICORN_THREADS as threads
+
+        def worker_exit(server, worker):
+            # Escribir las filas en cola de los BatchWriter al reciclar el worker
+            from db import close_batch_writers
+            close_batch_writers()
 
         options = {
             "bind":               f"0.0.0.0:{port}",
             "workers":            1,          # 1 solo worker → bot no se duplica
             "worker_class":       "gthread",  # threads reales
-            "threads":            8,          # 8 requests en paralelo
+            "threads":            threads,    # requests en paralelo (≤ pool MySQL)
             "timeout":            60,
             "graceful_timeout":   30,
             "keepalive":          5,
@@ -101,9 +108,10 @@ def run_gunicorn():
             "accesslog":          "-",
             "errorlog":           "-",
             "loglevel":           "warning",
+            "worker_exit":        worker_exit,
         }
 
-        logger.info(f"🌐 Iniciando Gunicorn en puerto {port} (1 worker, 8 threads)...")
+        logger.info(f"🌐 Iniciando Gunicorn en puerto {port} (1 worker, {threads} threads)...")
         StandaloneApp(flask_app, options).run()
 
     except ImportError:
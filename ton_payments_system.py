@@ -22,6 +22,21 @@ TONCENTER_API_URL    = 'https://toncenter.com/api/v2'
 TONSCAN_URL          = 'https://tonscan.org'
 
 
+# Sesión HTTP reutilizada para Toncenter (keep-alive: sin handshake TLS por consulta)
+_http_session = None
+
+
+def _get_http_session():
+    global _http_session
+    if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=8))
+        _http_session = session
+    return _http_session
+
+
 def is_ton_configured() -> bool:
     """True si están definidos mnemonic y API key."""
     return bool(TON_WALLET_MNEMONIC and TON_API_KEY)
@@ -67,8 +82,7 @@ def get_system_wallet_info() -> dict:
         return {'configured': False, 'error': 'TON_WALLET_MNEMONIC no configurado'}
 
     try:
-        import requests
-        resp = requests.get(
+        resp = _get_http_session().get(
             f'{TONCENTER_API_URL}/getAddressBalance',
             params={'address': TON_WALLET_ADDRESS},
             headers={'X-API-Key': TON_API_KEY},
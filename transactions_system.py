@@ -10,10 +10,24 @@ Características:
 """
 
 import json
+import time
 from datetime import datetime
 from decimal import Decimal
+from threading import Lock
 from db import execute_query, get_cursor
 
+# ============== CACHÉ DEL HISTORIAL ==============
+# El frontend consulta el historial repetidamente con los mismos parámetros.
+# Páginas ya formateadas en memoria del proceso, con una versión por usuario:
+# al cambiar un retiro se incrementa la versión y las páginas viejas dejan
+# de coincidir (caducan solas por TTL).
+_TX_PAGE_CACHE_TTL = 30
+_TX_PAGE_CACHE_MAX_SIZE = 5000
+
+_tx_page_cache = {}
+_tx_cache_versions = {}
+_tx_cache_lock = Lock()
+
 # ============== CONFIGURACIÓN DE MONEDAS ==============
 CURRENCIES = {
     'PXC': {
@@ -54,6 +68,12 @@ CURRENCIES = {
     }
 }
 
+# (network, explorer) por moneda, resuelto una vez para el formateo por fila
+_CURRENCY_API_INFO = {
+    code: (config.get('network', 'Internal'), config.get('explorer'))
+    for code, config in CURRENCIES.items()
+}
+
 # ============== TRADUCCIONES ==============
 TRANSLATIONS = {
     'status': {
@@ -348,6 +368,17 @@ def get_all_translations(lang='es'):
 
 # ============== FUNCIONES DE TRANSACCIONES ==============
 
+def _currency_filter(user_id, currency, null_currency):
+    """
+    Fragmento WHERE y parámetros para filtrar por moneda en SQL.
+    Las filas con currency NULL se muestran como null_currency.
+    """
+    if not currency:
+        return '', (user_id,)
+    if currency == null_currency:
+        return 'AND (currency = %s OR currency IS NULL)', (user_id, currency)
+    return 'AND currency = %s', (user_id, currency)
+
 def get_user_unified_transactions(user_id, currency=None, tx_type=None, limit=50, offset=0):
     """
     Obtiene todas las transacciones de un usuario de forma unificada
@@ -365,11 +396,21 @@ def get_user_unified_transactions(user_id, currency=None, tx_type=None, limit=50
     """
     user_id = str(user_id)
     transactions = []
+    currency = currency.upper() if currency else None
+    tx_type = tx_type.lower() if tx_type else None
+    
+    # Los filtros se aplican en SQL cuando es posible (menos filas por la red)
+    # y las tablas que no pueden coincidir ni se consultan. El tipo de
+    # balance_history se deriva en Python (normalize_transaction_type), así
+    # que el filtro final por moneda/tipo de abajo se mantiene.
+    # Las columnas usan collation _ci: las comparaciones no distinguen mayúsculas.
+    want_ton_tables = currency in (None, 'TON')
     
     try:
         with get_cursor() as cursor:
             # 1. Obtener de balance_history (PXC y otras monedas internas)
-            cursor.execute("""
+            history_filter, history_params = _currency_filter(user_id, currency, 'PXC')
+            cursor.execute(f"""
                 SELECT 
                     id,
                     user_id,
@@ -385,10 +426,10 @@ def get_user_unified_transactions(user_id, currency=None, tx_type=None, limit=50
                     'completed' as status,
                     'balance_history' as source
                 FROM balance_history
-                WHERE user_id = %s
+                WHERE user_id = %s {history_filter}
                 ORDER BY created_at DESC
                 LIMIT 200
-            """, (user_id,))
+            """, history_params)
             
             for row in cursor.fetchall():
                 if isinstance(row, dict):
@@ -416,72 +457,29 @@ def get_user_unified_transactions(user_id, currency=None, tx_type=None, limit=50
                 transactions.append(tx)
             
             # 2. Obtener de withdrawals (DOGE, USDT, TON)
-            cursor.execute("""
-                SELECT 
-                    withdrawal_id as id,
-                    user_id,
-                    currency,
-                    amount,
-                    'withdrawal' as tx_type,
-                    CONCAT('Retiro a ', COALESCE(wallet_address, '')) as description,
-                    NULL as balance_before,
-                    NULL as balance_after,
-                    created_at,
-                    tx_hash,
-                    wallet_address,
-                    status,
-                    'withdrawals' as source
-                FROM withdrawals
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                LIMIT 100
-            """, (user_id,))
-            
-            for row in cursor.fetchall():
-                if isinstance(row, dict):
-                    tx = dict(row)
-                else:
-                    tx = {
-                        'id': row[0],
-                        'user_id': row[1],
-                        'currency': row[2],
-                        'amount': row[3],
-                        'tx_type': row[4],
-                        'description': row[5],
-                        'balance_before': row[6],
-                        'balance_after': row[7],
-                        'created_at': row[8],
-                        'tx_hash': row[9],
-                        'wallet_address': row[10],
-                        'status': row[11],
-                        'source': row[12]
-                    }
-                tx['currency'] = (tx.get('currency') or 'DOGE').upper()
-                transactions.append(tx)
-            
-            # 3. Obtener de ton_payments (TON específicamente)
-            try:
-                cursor.execute("""
+            if tx_type in (None, 'withdrawal'):
+                withdrawal_filter, withdrawal_params = _currency_filter(user_id, currency, 'DOGE')
+                cursor.execute(f"""
                     SELECT 
-                        id,
+                        withdrawal_id as id,
                         user_id,
-                        'TON' as currency,
+                        currency,
                         amount,
-                        payment_type as tx_type,
-                        CONCAT('TON ', payment_type) as description,
+                        'withdrawal' as tx_type,
+                        CONCAT('Retiro a ', COALESCE(wallet_address, '')) as description,
                         NULL as balance_before,
                         NULL as balance_after,
                         created_at,
                         tx_hash,
                         wallet_address,
                         status,
-                        'ton_payments' as source
-                    FROM ton_payments
-                    WHERE user_id = %s
+                        'withdrawals' as source
+                    FROM withdrawals
+                    WHERE user_id = %s {withdrawal_filter}
                     ORDER BY created_at DESC
                     LIMIT 100
-                """, (user_id,))
-                
+                """, withdrawal_params)
+            
                 for row in cursor.fetchall():
                     if isinstance(row, dict):
                         tx = dict(row)
@@ -501,55 +499,102 @@ def get_user_unified_transactions(user_id, currency=None, tx_type=None, limit=50
                             'status': row[11],
                             'source': row[12]
                         }
-                    tx['currency'] = 'TON'
+                    tx['currency'] = (tx.get('currency') or 'DOGE').upper()
                     transactions.append(tx)
-            except Exception as e:
-                print(f"[transactions] Tabla ton_payments no disponible: {e}")
+            
+            # 3. Obtener de ton_payments (TON específicamente)
+            if want_ton_tables:
+                payment_filter = 'AND payment_type = %s' if tx_type else ''
+                payment_params = (user_id, tx_type) if tx_type else (user_id,)
+                try:
+                    cursor.execute(f"""
+                        SELECT 
+                            id,
+                            user_id,
+                            'TON' as currency,
+                            amount,
+                            payment_type as tx_type,
+                            CONCAT('TON ', payment_type) as description,
+                            NULL as balance_before,
+                            NULL as balance_after,
+                            created_at,
+                            tx_hash,
+                            wallet_address,
+                            status,
+                            'ton_payments' as source
+                        FROM ton_payments
+                        WHERE user_id = %s {payment_filter}
+                        ORDER BY created_at DESC
+                        LIMIT 100
+                    """, payment_params)
+                
+                    for row in cursor.fetchall():
+                        if isinstance(row, dict):
+                            tx = dict(row)
+                        else:
+                            tx = {
+                                'id': row[0],
+                                'user_id': row[1],
+                                'currency': row[2],
+                                'amount': row[3],
+                                'tx_type': row[4],
+                                'description': row[5],
+                                'balance_before': row[6],
+                                'balance_after': row[7],
+                                'created_at': row[8],
+                                'tx_hash': row[9],
+                                'wallet_address': row[10],
+                                'status': row[11],
+                                'source': row[12]
+                            }
+                        tx['currency'] = 'TON'
+                        transactions.append(tx)
+                except Exception as e:
+                    print(f"[transactions] Tabla ton_payments no disponible: {e}")
 
             # 4. Obtener depósitos TON confirmados (ton_deposits)
-            try:
-                cursor.execute("""
-                    SELECT
-                        id,
-                        user_id,
-                        'TON' as currency,
-                        amount,
-                        'deposit' as tx_type,
-                        CONCAT('TON Deposit - ', deposit_id) as description,
-                        NULL as balance_before,
-                        NULL as balance_after,
-                        COALESCE(credited_at, created_at) as created_at,
-                        tx_hash,
-                        wallet_destination as wallet_address,
-                        status,
-                        'ton_deposits' as source
-                    FROM ton_deposits
-                    WHERE user_id = %s AND status = 'confirmed'
-                    ORDER BY created_at DESC
-                    LIMIT 100
-                """, (user_id,))
+            if want_ton_tables and tx_type in (None, 'deposit'):
+                try:
+                    cursor.execute("""
+                        SELECT
+                            id,
+                            user_id,
+                            'TON' as currency,
+                            amount,
+                            'deposit' as tx_type,
+                            CONCAT('TON Deposit - ', deposit_id) as description,
+                            NULL as balance_before,
+                            NULL as balance_after,
+                            COALESCE(credited_at, created_at) as created_at,
+                            tx_hash,
+                            wallet_destination as wallet_address,
+                            status,
+                            'ton_deposits' as source
+                        FROM ton_deposits
+                        WHERE user_id = %s AND status = 'confirmed'
+                        ORDER BY created_at DESC
+                        LIMIT 100
+                    """, (user_id,))
 
-                for row in cursor.fetchall():
-                    tx = dict(row) if isinstance(row, dict) else {
-                        'id': row[0], 'user_id': row[1], 'currency': row[2],
-                        'amount': row[3], 'tx_type': row[4], 'description': row[5],
-                        'balance_before': row[6], 'balance_after': row[7],
-                        'created_at': row[8], 'tx_hash': row[9],
-                        'wallet_address': row[10], 'status': row[11], 'source': row[12]
-                    }
-                    tx['currency'] = 'TON'
-                    transactions.append(tx)
-            except Exception as e:
-                print(f"[transactions] Tabla ton_deposits no disponible: {e}")
+                    for row in cursor.fetchall():
+                        tx = dict(row) if isinstance(row, dict) else {
+                            'id': row[0], 'user_id': row[1], 'currency': row[2],
+                            'amount': row[3], 'tx_type': row[4], 'description': row[5],
+                            'balance_before': row[6], 'balance_after': row[7],
+                            'created_at': row[8], 'tx_hash': row[9],
+                            'wallet_address': row[10], 'status': row[11], 'source': row[12]
+                        }
+                        tx['currency'] = 'TON'
+                        transactions.append(tx)
+                except Exception as e:
+                    print(f"[transactions] Tabla ton_deposits no disponible: {e}")
 
         # Filtrar por moneda si se especifica
         if currency:
-            currency = currency.upper()
             transactions = [tx for tx in transactions if tx.get('currency', '').upper() == currency]
         
         # Filtrar por tipo si se especifica
         if tx_type:
-            tx_type = tx_type.lower()
             transactions = [tx for tx in transactions if tx.get('tx_type', '').lower() == tx_type]
         
         # Ordenar por fecha descendente
@@ -769,7 +814,7 @@ def format_transaction_for_api(tx, lang='en'):
         return None
     
     currency = (tx.get('currency') or 'PXC').upper()
-    currency_config = CURRENCIES.get(currency, CURRENCIES['PXC'])
+    network, explorer = _CURRENCY_API_INFO.get(currency) or _CURRENCY_API_INFO['PXC']
     
     tx_type = tx.get('tx_type', 'mining')
     status = tx.get('status', 'completed')
@@ -796,8 +841,8 @@ def format_transaction_for_api(tx, lang='en'):
         'timestamp': timestamp,
         'tx_hash': tx.get('tx_hash'),
         'wallet_address': tx.get('wallet_address'),
-        'network': currency_config.get('network', 'Internal'),
-        'explorer': currency_config.get('explorer')
+        'network': network,
+        'explorer': explorer
     }
 
 
@@ -877,6 +922,101 @@ def get_transaction_stats(user_id):
     
     return stats
 
+def format_transactions_with_stats(transactions, lang='en', default_currency='PXC'):
+    """
+    Formatea las transacciones para la API y calcula sus totales
+    recibidos/enviados (global y por moneda) en una sola pasada
+    
+    Los acumuladores son variables locales y listas [recibido, enviado]
+    por moneda; el dict de estadísticas se construye una vez al final, así
+    el coste por fila es mínimo incluso con límites grandes (exportaciones).
+    
+    Returns:
+        tuple: (formatted, {'total_received', 'total_sent', 'by_currency': {moneda: {'received', 'sent'}}})
+    """
+    formatted = []
+    append = formatted.append
+    fmt = format_transaction_for_api
+    total_received = 0.0
+    total_sent = 0.0
+    per_currency = {}
+    get_totals = per_currency.get
+    
+    for tx in transactions:
+        item = fmt(tx, lang)
+        append(item)
+        amount = item['amount']
+        curr = tx.get('currency') or default_currency
+        totals = get_totals(curr)
+        if totals is None:
+            totals = per_currency[curr] = [0.0, 0.0]
+        
+        if tx.get('tx_type') == 'withdrawal':
+            total_sent += amount
+            totals[1] += amount
+        else:
+            total_received += amount
+            totals[0] += amount
+    
+    stats = {
+        'total_received': total_received,
+        'total_sent': total_sent,
+        'by_currency': {
+            curr: {'received': received, 'sent': sent}
+            for curr, (received, sent) in per_currency.items()
+        }
+    }
+    return formatted, stats
+
+def get_transactions_page(user_id, currency=None, tx_type=None, limit=50, offset=0,
+                          lang='en', default_currency='PXC'):
+    """
+    Página del historial ya formateada para la API, con estadísticas
+    Usa la caché en memoria (TTL corto, invalidación por usuario)
+    
+    Returns:
+        tuple: (formatted, stats) como format_transactions_with_stats
+    """
+    user_id = str(user_id)
+    currency = currency.upper() if currency else None
+    tx_type = tx_type.lower() if tx_type else None
+    now = time.time()
+    
+    version = _tx_cache_versions.get(user_id, 0)
+    key = (user_id, version, currency, tx_type, limit, offset, lang, default_currency)
+    cached = _tx_page_cache.get(key)
+    if cached and now - cached[0] < _TX_PAGE_CACHE_TTL:
+        return cached[1]
+    
+    transactions = get_user_unified_transactions(
+        user_id=user_id,
+        currency=currency,
+        tx_type=tx_type,
+        limit=limit,
+        offset=offset
+    )
+    page = format_transactions_with_stats(transactions, lang, default_currency)
+    
+    # Una lista vacía también es lo que devuelve la consulta si falla: no se guarda
+    if transactions:
+        with _tx_cache_lock:
+            if len(_tx_page_cache) >= _TX_PAGE_CACHE_MAX_SIZE:
+                # Eliminar entradas expiradas o de versiones anteriores
+                for k in [k for k, v in _tx_page_cache.items()
+                          if now - v[0] >= _TX_PAGE_CACHE_TTL
+                          or k[1] != _tx_cache_versions.get(k[0], 0)]:
+                    _tx_page_cache.pop(k, None)
+            if len(_tx_page_cache) < _TX_PAGE_CACHE_MAX_SIZE:
+                _tx_page_cache[key] = (now, page)
+    
+    return page
+
+def invalidate_transactions_cache(user_id):
+    """Descarta las páginas de historial cacheadas de un usuario"""
+    user_id = str(user_id)
+    with _tx_cache_lock:
+        _tx_cache_versions[user_id] = _tx_cache_versions.get(user_id, 0) + 1
+
 def export_transactions_csv(user_id, lang='es'):
     """
     Exporta transacciones a formato CSV
@@ -9,10 +9,14 @@ import sys
 import json
 import secrets
 import random
+import time
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from functools import wraps
+from threading import Event, Lock
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
 from flask_cors import CORS
 
@@ -78,6 +82,16 @@ from database import (
 # Import execute_query for direct queries
 from db import execute_query
 
+# Caché en memoria de tareas (TTL 60s) para las rutas de completar/verificar;
+# las rutas de admin la invalidan al modificar una tarea
+from ad_tasks import get_task_cached, invalidate_task_cache
+
+# Respuestas JSON de las rutas más llamadas (orjson si está disponible)
+from json_response import fast_jsonify as _jsonify
+
+# Límites por usuario en verify/complete y cupo global de getChatMember
+from rate_limit import check_verify_rate_limit, wait_for_telegram_slot
+
 # Import wallet functions
 try:
     from wallet import (
@@ -128,7 +142,8 @@ except ImportError as e:
 
 # Import transactions system
 try:
-    from transactions_system import get_user_unified_transactions, format_transaction_for_api, CURRENCIES, get_translations
+    from transactions_system import CURRENCIES, get_translations, get_transactions_page
+    _CURRENCY_LIST = list(CURRENCIES.keys())
     TRANSACTIONS_SYSTEM_AVAILABLE = True
     logger.info("✅ Transactions system loaded successfully")
 except ImportError as e:
@@ -287,6 +302,36 @@ def _cache_membership_result(user_id, channel_username, result):
 
 # ============== TELEGRAM VERIFICATION FUNCTIONS ==============
 
+# Sesión HTTP compartida para la API de Telegram: reutiliza las conexiones
+# TLS en lugar de abrir una nueva por cada verificación
+_telegram_http = requests.Session()
+# Los 5xx transitorios se reintentan con backoff exponencial; los 429 se
+# tratan aparte en _fetch_channel_membership porque Telegram indica la
+# espera en el cuerpo (parameters.retry_after)
+_telegram_http.mount('https://', HTTPAdapter(
+    pool_connections=4, pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, allowed_methods=['GET'],
+                      status_forcelist=[500, 502, 503, 504], raise_on_status=False,
+                      respect_retry_after_header=True)
+))
+
+# (conexión, lectura) en segundos: la verificación se hace dentro de la
+# petición HTTP del usuario, así que un Telegram lento no debe retener el
+# hilo de gunicorn los 10s completos
+_TELEGRAM_TIMEOUT = (3.05, 5)
+
+# 429 (flood wait): se reintenta una vez si Telegram pide esperar poco
+_FLOOD_WAIT_MAX_ATTEMPTS = 2
+_FLOOD_WAIT_MAX_SECONDS = 3
+
+# Verificaciones en curso: cuando llegan a la vez varias peticiones para el
+# mismo usuario y canal (verify + complete, clics repetidos), solo la primera
+# llama a Telegram y el resto espera su resultado en la caché.
+# Format: { "user_id:channel": Event }
+_membership_inflight = {}
+_membership_inflight_lock = Lock()
+
+
 def verify_channel_membership(user_id, channel_username):
     """
     Verifica si un usuario es miembro de un canal de Telegram.
@@ -322,6 +367,32 @@ def verify_channel_membership(user_id, channel_username):
         return cached_result
     # ============== END CACHE CHECK ==============
 
+    cache_key = _get_membership_cache_key(user_id, channel)
+    with _membership_inflight_lock:
+        pending = _membership_inflight.get(cache_key)
+        owner = pending is None
+        if owner:
+            pending = _membership_inflight[cache_key] = Event()
+
+    if not owner:
+        # Otra petición ya está consultando: esperar su resultado
+        if pending.wait(sum(_TELEGRAM_TIMEOUT)):
+            is_cached, cached_result = _get_cached_membership(user_id, channel)
+            if is_cached and cached_result is not None:
+                return cached_result
+        # Sin resultado en caché (error transitorio): consultar directamente
+        return _fetch_channel_membership(user_id, channel)
+
+    try:
+        return _fetch_channel_membership(user_id, channel)
+    finally:
+        with _membership_inflight_lock:
+            _membership_inflight.pop(cache_key, None)
+        pending.set()
+
+
+def _fetch_channel_membership(user_id, channel):
+    """Consulta getChatMember y guarda en caché el resultado"""
     try:
         url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
 
@@ -332,8 +403,17 @@ def verify_channel_membership(user_id, channel_username):
 
         logger.info(f"[verify_channel_membership] Verificando user {user_id} en canal {channel}")
 
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
+        for attempt in range(_FLOOD_WAIT_MAX_ATTEMPTS):
+            wait_for_telegram_slot()
+            response = _telegram_http.get(url, params=params, timeout=_TELEGRAM_TIMEOUT)
+            data = response.json()
+            if response.status_code != 429:
+                break
+            retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+            if attempt + 1 >= _FLOOD_WAIT_MAX_ATTEMPTS or retry_after > _FLOOD_WAIT_MAX_SECONDS:
+                break
+            logger.info("[verify_channel_membership] Flood wait: reintentando en %ss", retry_after)
+            time.sleep(retry_after)
 
         logger.info(f"[verify_channel_membership] Respuesta de Telegram: {data}")
 
@@ -351,9 +431,9 @@ def verify_channel_membership(user_id, channel_username):
                 _cache_membership_result(user_id, channel, result)  # Cache result
                 return result
 
-            result = (False, f"Error de verificación: {error_description}")
-            _cache_membership_result(user_id, channel, result)  # Cache result
-            return result
+            # Errores no definitivos (flood wait, 5xx...): no se guardan en
+            # caché para no bloquear al usuario durante 10 minutos
+            return False, f"Error de verificación: {error_description}"
 
         result = data.get('result', {})
         status = result.get('status', '')
@@ -757,6 +837,21 @@ def safe_user_dict(user):
 
     return user
 
+
+def completed_task_set(user):
+    """
+    Conjunto de task_id completados del usuario, calculado una sola vez por
+    petición y guardado en el propio dict. get_user ya normaliza la lista a
+    strings, así que basta con un frozenset directo.
+    """
+    completed = user.get('_completed_set')
+    if completed is None:
+        raw_completed = user.get('completed_tasks') or []
+        if not isinstance(raw_completed, list):
+            raw_completed = []
+        completed = user['_completed_set'] = frozenset(raw_completed)
+    return completed
+
 # ============== USER ROUTES ==============
 
 @app.route('/')
@@ -860,12 +955,7 @@ def tasks():
 
     all_tasks = get_active_tasks()
 
-    raw_completed = user.get('completed_tasks', [])
-    if not isinstance(raw_completed, list):
-        raw_completed = []
-    completed_ids_set = set(str(t) for t in raw_completed if t)
-
-    print(f"[tasks] Usuario {user_id} - Tareas completadas: {completed_ids_set}")
+    completed_ids_set = completed_task_set(user)
 
     available_tasks = {}
     completed_tasks = {}
@@ -878,7 +968,8 @@ def tasks():
         else:
             available_tasks[task_id] = task
 
-    print(f"[tasks] Disponibles: {list(available_tasks.keys())}, Completadas: {list(completed_tasks.keys())}")
+    logger.debug("[tasks] user=%s disponibles=%d completadas=%d",
+                 user_id, len(available_tasks), len(completed_tasks))
 
     # Usar el nuevo template con sistema PTS
     social_tasks = get_active_social_tasks(user_id=user_id) if globals().get('SOCIAL_TASKS_AVAILABLE') else []
@@ -2689,8 +2780,14 @@ def api_task_complete():
     """
     user_id = get_user_id()
     if not user_id:
-        print(f"[api_task_complete] ❌ No user_id provided")
-        return jsonify({'success': False, 'error': 'User ID required'}), 400
+        logger.debug("[api_task_complete] No user_id provided")
+        return _jsonify({'success': False, 'error': 'User ID required'}), 400
+
+    retry_after = check_verify_rate_limit(user_id, 'complete')
+    if retry_after:
+        response = _jsonify({'success': False, 'error': 'Demasiados intentos, espera un momento'})
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
 
     # Registrar IP antes de procesar para que are_accounts_related funcione correctamente
     try:
@@ -2702,19 +2799,19 @@ def api_task_complete():
     task_id = data.get('task_id')
 
     if not task_id:
-        print(f"[api_task_complete] ❌ No task_id provided")
-        return jsonify({'success': False, 'error': 'Task ID required'}), 400
+        logger.debug("[api_task_complete] No task_id provided")
+        return _jsonify({'success': False, 'error': 'Task ID required'}), 400
 
-    print(f"[api_task_complete] Usuario {user_id} intentando completar tarea {task_id}")
+    logger.debug("[api_task_complete] user=%s task=%s", user_id, task_id)
 
-    task = get_task(task_id)
+    task = get_task_cached(task_id)
     if not task:
-        print(f"[api_task_complete] ❌ Tarea {task_id} no encontrada")
-        return jsonify({'success': False, 'error': 'Tarea no encontrada'}), 400
+        logger.info("[api_task_complete] Tarea %s no encontrada", task_id)
+        return _jsonify({'success': False, 'error': 'Tarea no encontrada'}), 400
 
     if is_task_completed(user_id, task_id):
-        print(f"[api_task_complete] ❌ Tarea {task_id} ya completada por usuario {user_id}")
-        return jsonify({'success': False, 'error': 'Ya completaste esta tarea'}), 400
+        logger.debug("[api_task_complete] Tarea %s ya completada por usuario %s", task_id, user_id)
+        return _jsonify({'success': False, 'error': 'Ya completaste esta tarea'}), 400
 
     reward = float(task.get('reward', 0))
 
@@ -2722,20 +2819,20 @@ def api_task_complete():
     requires_channel = task.get('requires_channel_join', False)
     channel_username = task.get('channel_username', '')
 
-    print(f"[api_task_complete] Tarea requiere canal: {requires_channel}, Canal: {channel_username}")
+    logger.debug("[api_task_complete] Tarea requiere canal: %s, Canal: %s", requires_channel, channel_username)
 
     if requires_channel and channel_username:
-        print(f"[api_task_complete] Verificando membresía del usuario {user_id} en canal {channel_username}")
+        logger.debug("[api_task_complete] Verificando membresía del usuario %s en canal %s", user_id, channel_username)
 
         is_member, verification_message = verify_channel_membership(user_id, channel_username)
 
         if not is_member:
-            print(f"[api_task_complete] ❌ Usuario {user_id} NO es miembro del canal {channel_username}")
+            logger.debug("[api_task_complete] Usuario %s no es miembro del canal %s", user_id, channel_username)
             # Get user language for translated error
             from i18n_messages import get_user_lang, get_msg as _gm
             _lang = get_user_lang(user_id)
             _msg = _gm('must_join_channel', _lang, channel=f'@{channel_username}')
-            return jsonify({
+            return _jsonify({
                 'success': False,
                 'error': _msg,
                 'message': _msg,
@@ -2743,12 +2840,12 @@ def api_task_complete():
                 'channel': f'@{channel_username}'
             }), 400
 
-        print(f"[api_task_complete] ✅ Usuario {user_id} ES miembro del canal {channel_username}")
+        logger.debug("[api_task_complete] Usuario %s es miembro del canal %s", user_id, channel_username)
     # ====== FIN DE VERIFICACIÓN ======
 
     # Completar la tarea y dar la recompensa
     success, message = complete_task(user_id, task_id)
-    print(f"[api_task_complete] Resultado: success={success}, message={message}")
+    logger.debug("[api_task_complete] success=%s message=%s", success, message)
 
     if success:
         # Validar referido si es la primera tarea
@@ -2761,8 +2858,8 @@ def api_task_complete():
         user = get_user(user_id)
         new_balance = user.get('se_balance', 0) if user else 0
         completed_count = len(user.get('completed_tasks', [])) if user else 0
-        print(f"[api_task_complete] ✅ Tarea completada. Nuevo balance: {new_balance}, Total completadas: {completed_count}")
-        return jsonify({
+        logger.debug("[api_task_complete] Tarea completada. Nuevo balance: %s, Total completadas: %s", new_balance, completed_count)
+        return _jsonify({
             'success': True,
             'message': message,
             'reward': reward,
@@ -2770,8 +2867,8 @@ def api_task_complete():
             'completed_count': completed_count
         })
 
-    print(f"[api_task_complete] ❌ Error: {message}")
-    return jsonify({'success': False, 'error': message, 'message': message}), 400
+    logger.info("[api_task_complete] Error: %s", message)
+    return _jsonify({'success': False, 'error': message, 'message': message}), 400
 
 @app.route('/api/task/verify', methods=['POST'])
 def api_task_verify():
@@ -2780,12 +2877,18 @@ def api_task_verify():
     if not user_id:
         return jsonify({'success': False, 'error': 'User ID required'}), 400
 
+    retry_after = check_verify_rate_limit(user_id, 'verify')
+    if retry_after:
+        response = jsonify({'success': False, 'error': 'Demasiados intentos, espera un momento'})
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
+
     data = request.get_json() or {}
     task_id = data.get('task_id')
     channel_username = data.get('channel_username')
 
     if task_id and not channel_username:
-        task = get_task(task_id)
+        task = get_task_cached(task_id)
         if task:
             channel_username = task.get('channel_username')
 
@@ -3244,7 +3347,7 @@ def api_user_photo(user_id):
     try:
         # Obtener las fotos de perfil del usuario
         photos_url = f"https://api.telegram.org/bot{BOT_TOKEN}/getUserProfilePhotos"
-        photos_response = requests.get(photos_url, params={
+        photos_response = _telegram_http.get(photos_url, params={
             'user_id': user_id,
             'limit': 1
         }, timeout=10)
@@ -3275,7 +3378,7 @@ def api_user_photo(user_id):
 
         # Obtener la ruta del archivo
         file_url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile"
-        file_response = requests.get(file_url, params={
+        file_response = _telegram_http.get(file_url, params={
             'file_id': file_id
         }, timeout=10)
 
@@ -3615,44 +3718,23 @@ def api_transactions():
     try:
         # Use new unified transactions system if available
         if TRANSACTIONS_SYSTEM_AVAILABLE:
-            transactions = get_user_unified_transactions(
-                user_id=user_id,
-                currency=currency.upper() if currency else None,
+            # Format for API and calculate stats in one pass (cached per page)
+            formatted, stats = get_transactions_page(
+                user_id,
+                currency=currency,
                 tx_type=tx_type,
                 limit=limit,
-                offset=offset
+                offset=offset,
+                lang=lang,
+                default_currency='SE'
             )
 
-            # Format for API
-            formatted = [format_transaction_for_api(tx, lang) for tx in transactions]
-
-            # Calculate stats
-            stats = {
-                'total_received': 0,
-                'total_sent': 0,
-                'by_currency': {}
-            }
-
-            for tx in transactions:
-                curr = tx.get('currency', 'SE')
-                amount = float(tx.get('amount', 0))
-
-                if curr not in stats['by_currency']:
-                    stats['by_currency'][curr] = {'received': 0, 'sent': 0}
-
-                if tx.get('tx_type') == 'withdrawal':
-                    stats['total_sent'] += amount
-                    stats['by_currency'][curr]['sent'] += amount
-                else:
-                    stats['total_received'] += amount
-                    stats['by_currency'][curr]['received'] += amount
-
-            return jsonify({
+            return _jsonify({
                 'success': True,
                 'transactions': formatted,
                 'count': len(formatted),
                 'stats': stats,
-                'currencies': list(CURRENCIES.keys()) if TRANSACTIONS_SYSTEM_AVAILABLE else ['SE', 'DOGE', 'TON', 'USDT']
+                'currencies': _CURRENCY_LIST
             })
 
         # Fallback to legacy implementation
@@ -5514,6 +5596,7 @@ def admin_task_edit(task_id):
         if update_task(task_id, title=title, description=description, reward=reward,
                       url=url, task_type=task_type, active=active,
                       requires_channel_join=requires_channel_join, channel_username=channel_username):
+            invalidate_task_cache(task_id)
             flash('Tarea actualizada', 'success')
         else:
             flash('Error al actualizar tarea', 'error')
@@ -5533,6 +5616,7 @@ def admin_task_edit_alt(task_id):
 def admin_task_delete(task_id):
     """Delete a task"""
     if delete_task(task_id):
+        invalidate_task_cache(task_id)
         flash('Tarea eliminada', 'success')
     else:
         flash('Error al eliminar tarea', 'error')
@@ -5552,6 +5636,7 @@ def admin_task_toggle(task_id):
     if task:
         new_status = not task.get('active', True)
         update_task(task_id, active=new_status)
+        invalidate_task_cache(task_id)
         status_text = 'activada' if new_status else 'desactivada'
         flash(f'Tarea {status_text}', 'success')
     else:
@@ -7476,13 +7561,33 @@ async def _bot_error(update, context):
     logger.error(f"[bot error] {context.error}")
 
 
+async def _bot_chat_member(update, context):
+    """
+    Altas y bajas en los canales donde el bot es administrador (Telegram solo
+    envía chat_member a administradores). Se vuelcan en la caché de membresía
+    para que verify_channel_membership no tenga que llamar a getChatMember.
+    """
+    change = update.chat_member
+    if not change:
+        return
+    chat = change.chat
+    channel = f"@{chat.username}" if chat.username else str(chat.id)
+    user_id = str(change.new_chat_member.user.id)
+    status = change.new_chat_member.status
+
+    if status in ('creator', 'administrator', 'member'):
+        _cache_membership_result(user_id, channel, (True, "Verificación exitosa"))
+    elif status in ('left', 'kicked'):
+        _cache_membership_result(user_id, channel, (False, "No eres miembro del canal"))
+
+
 # ── Thread del bot ─────────────────────────────────────────────
 def _start_bot_thread():
     import asyncio as _asyncio
     from telegram import Update
     from telegram.ext import (
         Application, CommandHandler, CallbackQueryHandler,
-        MessageHandler, filters
+        ChatMemberHandler, MessageHandler, filters
     )
 
     async def _run():
@@ -7506,6 +7611,9 @@ def _start_bot_thread():
         # Cualquier texto → respuesta genérica
         app_bot.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, _bot_message))
 
+        # Membresía de canales empujada por Telegram (ALL_TYPES incluye chat_member)
+        app_bot.add_handler(ChatMemberHandler(_bot_chat_member, ChatMemberHandler.CHAT_MEMBER))
+
         app_bot.add_error_handler(_bot_error)
 
         logger.info("🤖 Bot de Telegram arrancando...")
@@ -22,6 +22,12 @@ except ImportError as e:
     def get_withdrawal(withdrawal_id):
         return None
 
+try:
+    from transactions_system import invalidate_transactions_cache
+except ImportError:
+    def invalidate_transactions_cache(user_id):
+        pass
+
 # ============== CONFIGURATION ==============
 
 def get_pending_channel():
@@ -343,6 +349,8 @@ def on_withdrawal_created(withdrawal_id, user_id, currency, amount, wallet_addre
     Called when a new withdrawal is created.
     Sends notification to pending channel with banner and buttons IN USER'S LANGUAGE.
     """
+    invalidate_transactions_cache(user_id)
+
     channel = get_pending_channel()
     if not channel:
         print("[on_withdrawal_created] ⚠️ WITHDRAWALS_PENDING_CHANNEL not set")
@@ -412,6 +420,8 @@ def on_withdrawal_completed(withdrawal_id, user_id, currency, amount, wallet_add
     Called when a withdrawal is approved.
     Sends to channel WITH BUTTONS and to user WITHOUT BUTTONS, BOTH IN USER'S LANGUAGE.
     """
+    invalidate_transactions_cache(user_id)
+
     success_channel = get_success_channel()
 
     # Get user info and LANGUAGE
@@ -489,6 +499,8 @@ def on_withdrawal_rejected(withdrawal_id, user_id, currency, amount, reason=None
     Called when a withdrawal is rejected.
     Sends notification to user WITHOUT IMAGE and WITHOUT BUTTONS IN USER'S LANGUAGE.
     """
+    invalidate_transactions_cache(user_id)
+
     # Get user's LANGUAGE
     lang = get_user_language(user_id)
 